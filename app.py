@@ -1,40 +1,174 @@
 import datetime
+import hmac
 import json
 import os
-import subprocess
-import sys
+import signal
 
 from flask import jsonify, request
-from flask import Flask, flash, jsonify, redirect, render_template, request, url_for
-import joblib
-import numpy as np
-import openai
-import pandas as pd
-
-from models.multimodal_detector import MultimodalAnomalyDetector
-from utils.explanation_generator import generate_fraud_explanation
+from flask import Flask, Response, flash, jsonify, redirect, render_template, request, stream_with_context, url_for
+
+from models.registry import ModelRegistry
 from utils.feature_engineering import extract_features
 # Update this import line
-from utils.app_logging import log_error, log_prediction, logger, log_feedback # Renamed from utils.loggingfrom utils.scoring import calculate_risk_score, get_decision
+from utils.app_logging import log_error, logger, log_feedback # Renamed from utils.logging
+from utils.scoring import calculate_risk_score, get_decision
+from utils.batch_scoring import MAX_BATCH_SIZE, format_result, score_transactions
+from utils.feedback_store import FeedbackStore
+from utils.lazy_resource import LazyResource, ResourceUnavailable
+from utils.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry, RequestMetrics
+from utils.behavior_profiles import BehaviorProfileStore
+from utils.live_features import LiveFeatureEngine
+from utils.velocity import VelocityCounter
+from utils.geo_index import GeoIndex
+from utils.device_familiarity import create_device_store
+from utils.micro_batching import MicroBatcher
+from utils.prediction_log_writer import PredictionLogWriter
+from utils.prediction_store import DEFAULT_PAGE_SIZE, PredictionStore
+from utils.process_memory import process_memory
+from utils.profiler import COLLECTORS as PROFILE_COLLECTORS, ProfilerBusy, RequestProfiler
+from utils.retrain_jobs import RetrainJobQueue, retrain_command
+from utils.sample_data_cache import SampleTransactionCache
+
+def create_multimodal_detector():
+    """Build the DistilBERT-based detector (imports torch and transformers on first call)"""
+    from models.multimodal_detector import MultimodalAnomalyDetector
+    return MultimodalAnomalyDetector()
 
 # Initialize models
-multimodal_detector = MultimodalAnomalyDetector()
+# The multimodal detector is only needed by /api/llm-analyze: build it on first use
+# (or warm it up in the background) so it never delays the /predict models
+multimodal_detector = LazyResource('multimodal_detector', create_multimodal_detector)
+if os.environ.get('FRAUDSHIELD_MULTIMODAL_WARMUP', '').lower() in ('1', 'true', 'yes'):
+    multimodal_detector.warm_up()
 
 
 app = Flask(__name__, template_folder='dashboard/templates', static_folder='dashboard/static')
 app.secret_key = os.urandom(24)  # For flash messages
 
+def model_class_name(model):
+    """Estimator class name, looking through compiled wrappers"""
+    if model is None:
+        return 'Not loaded'
+    return getattr(model, 'source_class', model.__class__.__name__)
+
+# Serving models: one immutable ModelSet (models + fused pipeline + version) swapped atomically.
+# Handlers read model_registry.current once per request and use that snapshot throughout.
+model_registry = ModelRegistry(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models'),
+    mmap=os.environ.get('FRAUDSHIELD_MODEL_MMAP', '1').lower() in ('1', 'true', 'yes')
+)
+
 # Load models
 try:
-    supervised_model = joblib.load('models/supervised_model.pkl')
-    anomaly_model = joblib.load('models/anomaly_model.pkl')
-    model_version = "current"
-    logger.info("Models loaded successfully")
+    model_set = model_registry.reload()
+    logger.info(f"Models loaded successfully ({model_class_name(model_set.supervised)}, "
+                f"{model_class_name(model_set.anomaly)}, version {model_set.version}, from {model_set.source})")
 except Exception as e:
     logger.error(f"Error loading models: {e}")
-    supervised_model = None
-    anomaly_model = None
-    model_version = None
+
+# Append-only analyst feedback (data/feedback.jsonl) for retraining
+feedback_store = FeedbackStore(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'feedback.jsonl'))
+
+# Parsed-once, conditional-GET cache behind /api/sample-transactions
+# (serialized through the app's JSON provider so the body matches jsonify byte for byte)
+sample_transaction_cache = SampleTransactionCache(lambda records: app.json.response(records).get_data(as_text=True))
+
+# Indexed prediction history behind /api/transactions
+prediction_store = PredictionStore()
+try:
+    prediction_store.initialize()
+except Exception as e:
+    logger.error(f"Error opening prediction store: {e}")
+
+# Background group-commit writer: /predict never waits on disk for logging
+prediction_writer = PredictionLogWriter(
+    store=prediction_store,
+    max_queue=int(os.environ.get('FRAUDSHIELD_LOG_QUEUE_SIZE', 10000)),
+    flush_interval=float(os.environ.get('FRAUDSHIELD_LOG_FLUSH_INTERVAL', 0.05)),
+    fsync=os.environ.get('FRAUDSHIELD_LOG_FSYNC', '').lower() in ('1', 'true', 'yes'),
+    drop_policy=os.environ.get('FRAUDSHIELD_LOG_DROP_POLICY', 'drop_newest')
+)
+
+# Per-user behavior profiles (live amount/location/time/device deviation features)
+# per-user/device/card velocity counters over 1 min, 1 h and 24 h windows,
+# and a grid-cell index of where each user (and everyone) has transacted.
+# FRAUDSHIELD_DEVICE_STORE=exact|sketch counts every (user, device) pair instead
+# of the profile's few recent devices; the sketch has fixed memory.
+# Off unless FRAUDSHIELD_LIVE_FEATURES=fill|override: live values are computed
+# differently from the offline training features, so they are opt-in, and the
+# stores are only built when they are on.
+live_feature_mode = os.environ.get('FRAUDSHIELD_LIVE_FEATURES', 'off')
+profile_store = velocity_counter = geo_index = device_store = None
+if live_feature_mode != 'off':
+    profile_store = BehaviorProfileStore.from_memory_budget(
+        float(os.environ.get('FRAUDSHIELD_PROFILE_MEMORY_MB', 512)) * 1024 * 1024)
+    velocity_counter = VelocityCounter(capacity=int(os.environ.get('FRAUDSHIELD_VELOCITY_KEYS', 500000)))
+    geo_index = GeoIndex.from_memory_budget(float(os.environ.get('FRAUDSHIELD_GEO_MEMORY_MB', 256)) * 1024 * 1024)
+    if os.environ.get('FRAUDSHIELD_DEVICE_STORE'):
+        device_store = create_device_store(
+            os.environ['FRAUDSHIELD_DEVICE_STORE'],
+            expected_pairs=int(os.environ.get('FRAUDSHIELD_DEVICE_SKETCH_PAIRS', 10000000)),
+            false_positive_rate=float(os.environ.get('FRAUDSHIELD_DEVICE_SKETCH_FPR', 0.01)),
+            max_bytes=float(os.environ.get('FRAUDSHIELD_DEVICE_SKETCH_MEMORY_MB', 256)) * 1024 * 1024
+        )
+
+live_features = LiveFeatureEngine(profile_store, velocity=velocity_counter, geo=geo_index,
+                                  devices=device_store, mode=live_feature_mode)
+
+# Per-stage latency histograms and request counters, exported on /metrics. Under serve.py
+# the workers exchange snapshots (logs/metrics/<launcher pid>) so any worker can answer a scrape.
+metrics_registry = MetricsRegistry(
+    share_dir=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'metrics',
+                           os.environ['FRAUDSHIELD_LAUNCHER_PID'])
+    if os.environ.get('FRAUDSHIELD_LAUNCHER_PID') else None,
+    share_interval=float(os.environ.get('FRAUDSHIELD_METRICS_SHARE_INTERVAL', 5.0))
+)
+request_metrics = RequestMetrics(metrics_registry)
+
+# On-demand profiling of this process's next requests (admin only, see /admin/profile)
+request_profiler = RequestProfiler(
+    app,
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'profiles'),
+    sample_interval=float(os.environ.get('FRAUDSHIELD_PROFILE_SAMPLE_INTERVAL', 0.005))
+)
+
+def record_prediction(transaction, risk_score, decision, model_version):
+    """Queue a prediction for the log segments and the indexed prediction store"""
+    prediction_writer.submit(transaction, risk_score, decision, model_version)
+
+def score_with_current_models(transactions):
+    """Batch scorer bound to whichever models are published at call time"""
+    models = model_registry.current
+    results = score_transactions(transactions, models.pipeline, feature_engine=live_features)
+    # The whole batch was scored by this one model set
+    for result in results:
+        result['model_version'] = models.version
+    return results
+
+# Opt-in coalescing of concurrent /predict calls into batched model calls
+micro_batcher = None
+if os.environ.get('FRAUDSHIELD_MICROBATCH', '').lower() in ('1', 'true', 'yes'):
+    micro_batcher = MicroBatcher(
+        score_with_current_models,
+        max_batch_size=int(os.environ.get('FRAUDSHIELD_MICROBATCH_MAX_SIZE', 64)),
+        max_wait_ms=float(os.environ.get('FRAUDSHIELD_MICROBATCH_WAIT_MS', 2.0))
+    )
+    logger.info("Micro-batching enabled for /predict")
+
+def activate_retrained_version(job):
+    """Retraining job success hook: validate and swap in the version the job saved"""
+    return activate_model_version(job['version'])
+
+# Retraining runs as a background job, niced and limited to FRAUDSHIELD_RETRAIN_N_JOBS cores.
+# The job only saves a new version (--no-activate); the success hook validates and installs it.
+retrain_jobs = RetrainJobQueue(
+    retrain_command(os.path.dirname(os.path.abspath(__file__))) + ['--no-activate'],
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'retrain_jobs'),
+    cwd=os.path.dirname(os.path.abspath(__file__)),
+    n_jobs=os.environ.get('FRAUDSHIELD_RETRAIN_N_JOBS'),
+    niceness=int(os.environ.get('FRAUDSHIELD_RETRAIN_NICE', 10)),
+    on_success=activate_retrained_version
+)
 
 @app.route('/')
 def home():
@@ -44,80 +178,226 @@ def dash2():
     return render_template('dashboard.html')
 @app.route('/predict', methods=['POST'])
 def predict():
+    timer = request_metrics.timer('predict')
     try:
-        # Check if models are loaded
-        if supervised_model is None or anomaly_model is None:
+        # Check if models are loaded (one snapshot for the whole request)
+        models = model_registry.current
+        if models is None:
+            timer.finish(500)
             return jsonify({'error': 'Models not loaded. Please check logs.'}), 500
             
         # Get transaction data
         transaction = request.json
+        timer.stage('parse')
+        
+        if micro_batcher is not None:
+            return predict_micro_batched(transaction, timer)
+        
+        # Fill in behavior features from the user's live profile
+        enriched = live_features.observe(transaction)
+        timer.stage('live_features')
         
         # Extract features
-        features = extract_features(transaction)
+        features = extract_features(enriched)
+        timer.stage('feature_extraction')
         
-        # Make predictions
-        supervised_score = supervised_model.predict_proba(features.reshape(1, -1))[0][1]
-        anomaly_score = anomaly_model.decision_function(features.reshape(1, -1))[0]
-        anomaly_score = 1 / (1 + np.exp(-anomaly_score))  # Normalize to 0-1
+        # Make predictions (scaling, both models and anomaly normalization in one call)
+        supervised_scores, anomaly_scores = models.pipeline.model_scores(features, timer=timer)
+        supervised_score = supervised_scores[0]
+        anomaly_score = anomaly_scores[0]
         
         # Calculate final risk score
-        risk_score = calculate_risk_score(supervised_score, anomaly_score, transaction_data=transaction)
+        risk_score = calculate_risk_score(supervised_score, anomaly_score, transaction_data=enriched)
+        timer.stage('risk_score')
         
         # Get decision
         decision, message = get_decision(risk_score, user_id=transaction.get('user_id'), 
                                         amount=float(transaction.get('amount', 0)))
+        timer.stage('decision')
         
         # Log prediction
-        log_prediction(transaction, risk_score, decision, model_version)
+        record_prediction(transaction, risk_score, decision, models.version)
+        timer.stage('log_prediction')
         
         # Return response
         response = {
             'risk_score': int(risk_score * 100),
             'decision': decision,
             'message': message,
-            'model_version': model_version
+            'model_version': models.version
         }
         
-        return jsonify(response)
+        response = jsonify(response)
+        timer.stage('response')
+        timer.finish(200)
+        return response
     
     except Exception as e:
         error_msg = f"Prediction error: {str(e)}"
         log_error(error_msg, "prediction_error", transaction=request.json)
+        timer.finish(500)
+        return jsonify({'error': error_msg}), 500
+
+def predict_micro_batched(transaction, timer):
+    """Score one transaction through the shared micro-batcher"""
+    result = micro_batcher.submit(transaction)
+    timer.stage('micro_batch')
+    if 'error' in result:
+        log_error(result['error'], "prediction_error", transaction=transaction)
+        timer.finish(500)
+        return jsonify({'error': result['error']}), 500
+    
+    record_prediction(transaction, result['risk_score'], result['decision'], result['model_version'])
+    timer.stage('log_prediction')
+    
+    response = format_result(result, result['model_version'])
+    del response['index']
+    response = jsonify(response)
+    timer.stage('response')
+    timer.finish(200)
+    return response
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """Score many transactions with one model call per model"""
+    timer = request_metrics.timer('predict_batch')
+    try:
+        if model_registry.current is None:
+            timer.finish(500)
+            return jsonify({'error': 'Models not loaded. Please check logs.'}), 500
+
+        # Accept either a bare list or {"transactions": [...]}
+        payload = request.json
+        transactions = payload.get('transactions') if isinstance(payload, dict) else payload
+        if not isinstance(transactions, list):
+            timer.finish(400)
+            return jsonify({'error': 'Expected a list of transactions'}), 400
+        if len(transactions) > MAX_BATCH_SIZE:
+            timer.finish(413)
+            return jsonify({'error': f'Batch too large (max {MAX_BATCH_SIZE} transactions)'}), 413
+        timer.stage('parse')
+
+        results = score_with_current_models(transactions)
+        timer.stage('scoring')
+        model_version = results[0]['model_version'] if results else model_registry.current.version
+
+        # Log every scored transaction, same as /predict
+        for result in results:
+            if 'error' not in result:
+                record_prediction(transactions[result['index']], result['risk_score'], result['decision'],
+                                  model_version)
+        timer.stage('log_prediction')
+
+        response = jsonify({
+            'results': [format_result(result, model_version) for result in results],
+            'count': len(results),
+            'errors': sum(1 for result in results if 'error' in result),
+            'model_version': model_version
+        })
+        timer.stage('response')
+        timer.finish(200)
+        return response
+
+    except Exception as e:
+        error_msg = f"Batch prediction error: {str(e)}"
+        log_error(error_msg, "prediction_error")
+        timer.finish(500)
         return jsonify({'error': error_msg}), 500
 
 @app.route('/status', methods=['GET'])
 def status():
+    models = model_registry.current
     return jsonify({
-        'status': 'operational' if supervised_model is not None else 'degraded',
+        'status': 'operational' if models is not None else 'degraded',
         'models': {
-            'supervised': supervised_model.__class__.__name__ if supervised_model else 'Not loaded',
-            'anomaly': anomaly_model.__class__.__name__ if anomaly_model else 'Not loaded',
-            'version': model_version
+            'supervised': model_class_name(models.supervised if models else None),
+            'anomaly': model_class_name(models.anomaly if models else None),
+            'compiled': models.compiled if models else False,
+            'version': models.version if models else None,
+            'pipeline': models.pipeline.describe() if models else None,
+            'registry': model_registry.status()
         },
+        'process': process_memory(),
+        'micro_batching': micro_batcher.stats() if micro_batcher else {'enabled': False},
+        'prediction_log': prediction_writer.stats(),
+        'live_features': live_features.stats(),
+        'multimodal': multimodal_status(),
         'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     })
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Stage timings and request counts in the Prometheus text format"""
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+def admin_error():
+    """None if the request carries FRAUDSHIELD_ADMIN_TOKEN, else the error response"""
+    token = os.environ.get('FRAUDSHIELD_ADMIN_TOKEN')
+    if not token:
+        return jsonify({'error': 'Admin endpoints are disabled (FRAUDSHIELD_ADMIN_TOKEN is not set)'}), 404
+    supplied = request.headers.get('X-Admin-Token', '')
+    authorization = request.headers.get('Authorization', '')
+    if authorization.startswith('Bearer '):
+        supplied = authorization[len('Bearer '):]
+    if not hmac.compare_digest(supplied.encode('utf-8'), token.encode('utf-8')):
+        return jsonify({'error': 'Invalid admin token'}), 403
+    return None
+
+@app.route('/admin/profile', methods=['GET', 'POST'])
+def profile_capture():
+    """
+    Profile this worker's next requests
+
+    POST {"requests": N} or {"seconds": T}, optionally "collector": "cprofile"
+    (default) or "sampling"; GET reports the running and last capture.
+    """
+    error = admin_error()
+    if error:
+        return error
+
+    if request.method == 'GET':
+        return jsonify(request_profiler.status())
+
+    options = request.get_json(silent=True) or {}
+    collector = options.get('collector', 'cprofile')
+    if collector not in PROFILE_COLLECTORS:
+        return jsonify({'error': f'Unknown collector: {collector}'}), 400
+    try:
+        capture = request_profiler.start(requests=options.get('requests'), seconds=options.get('seconds'),
+                                         collector=collector)
+    except ProfilerBusy as e:
+        return jsonify({'error': str(e), 'status': request_profiler.status()}), 409
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    logger.info(f"Profiling capture {capture['id']} started ({collector})")
+    return jsonify(capture), 202
+
+def multimodal_status():
+    """Readiness of the lazily loaded multimodal detector"""
+    status = multimodal_detector.status()
+    detector = multimodal_detector.peek()
+    if detector is not None:
+        status['inference_mode'] = detector.inference_mode
+        status['torch_threads'] = detector.threads
+        status['embedding_cache'] = detector.cache_info()
+    return status
+
 @app.route('/retrain', methods=['GET', 'POST'])
 def retrain_page():
     # Get list of available models
     models_info = get_models_info()
     
-    # Handle retraining request
-    retraining_result = None
+    # Handle retraining request (on a plain visit, follow a job that is still in progress)
+    retraining_result = next((job for job in retrain_jobs.list(limit=1) if job['status'] in ('queued', 'running')), None)
     
     if request.method == 'POST':
-        if 'retrain' in request.form:
-            # Trigger model retraining
-            retraining_result = trigger_retraining()
-            if retraining_result.get('success'):
-                flash('Model retraining completed successfully!', 'success')
-                # Reload models after successful retraining
-                reload_models()
-            else:
-                flash(f'Model retraining failed: {retraining_result.get("error")}', 'danger')
-            
-            # Refresh models info after retraining
-            models_info = get_models_info()
+        if 'retrain' in request.form or request.is_json:
+            # Queue the retraining job; progress is polled or streamed from /api/retrain/jobs/<id>
+            job = retrain_jobs.submit(retrain_args())
+            if request.is_json:
+                return jsonify(job_links(job)), 202
+            flash(f'Retraining started (job {job["id"]})', 'success')
+            retraining_result = job
         
         elif 'activate' in request.form:
             # Activate a specific model version
@@ -125,9 +405,8 @@ def retrain_page():
             activation_result = activate_model_version(version)
             
             if activation_result.get('success'):
+                # The registry has already published the validated version
                 flash(f'Model version {version} activated successfully!', 'success')
-                # Reload models after activation
-                reload_models()
             else:
                 flash(f'Model activation failed: {activation_result.get("error")}', 'danger')
                 
@@ -136,6 +415,41 @@ def retrain_page():
     
     return render_template('retrain.html', models=models_info, result=retraining_result)
 
+def job_links(job):
+    """Job record plus the URLs to follow it"""
+    return dict(job,
+                status_url=url_for('retrain_job_status', job_id=job['id']),
+                events_url=url_for('retrain_job_events', job_id=job['id']))
+
+def retrain_args():
+    """Script arguments for the requested mode: 'full' (default) or 'incremental'"""
+    payload = request.get_json(silent=True) or {}
+    mode = payload.get('mode') or request.form.get('retrain')
+    return ['--incremental'] if mode == 'incremental' else []
+
+@app.route('/api/retrain/jobs', methods=['GET', 'POST'])
+def retrain_jobs_api():
+    if request.method == 'POST':
+        return jsonify(job_links(retrain_jobs.submit(retrain_args()))), 202
+    return jsonify({'jobs': retrain_jobs.list(limit=request.args.get('limit', 20, type=int))})
+
+@app.route('/api/retrain/jobs/<job_id>', methods=['GET'])
+def retrain_job_status(job_id):
+    job = retrain_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job_links(job))
+
+@app.route('/api/retrain/jobs/<job_id>/events', methods=['GET'])
+def retrain_job_events(job_id):
+    """Server-sent events: log lines and progress until the job finishes"""
+    if retrain_jobs.get(job_id) is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    offset = request.headers.get('Last-Event-ID', 0, type=int)
+    return Response(stream_with_context(retrain_jobs.events(job_id, offset=offset)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 def get_models_info():
     """Get information about available models"""
     models_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
@@ -203,105 +517,22 @@ def get_models_info():
     
     return models_info
 
-def trigger_retraining():
-    """Trigger the model retraining process"""
+def activate_model_version(version):
+    """Activate a specific model version (validated, then swapped in atomically)"""
     try:
-        # Create a log file for the retraining output
-        log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
-        os.makedirs(log_dir, exist_ok=True)
-        log_file = os.path.join(log_dir, f'retraining_{datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}.log')
-        
-        # Run the retraining script as a subprocess
-        retrain_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'retraining', 'retrain.py')
-        
-        with open(log_file, 'w') as f:
-            process = subprocess.Popen([sys.executable, retrain_script], 
-                                      stdout=subprocess.PIPE, 
-                                      stderr=subprocess.STDOUT,
-                                      universal_newlines=True)
-            
-            output = ""
-            for line in process.stdout:
-                output += line
-                f.write(line)
-                f.flush()
-            
-            process.wait()
-            
-            if process.returncode != 0:
-                return {
-                    'success': False,
-                    'error': f'Retraining process exited with code {process.returncode}',
-                    'output': output,
-                    'log_file': log_file,
-                    'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
+        model_set = model_registry.activate(version)
+        logger.info(f"Activated model version {version} (from {model_set.source})")
+        notify_workers()
         
         return {
             'success': True,
-            'output': output,
-            'log_file': log_file,
+            'version': version,
             'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
-    except Exception as e:
-        error_msg = f"Error triggering retraining: {str(e)}"
-        log_error(error_msg, "retraining_error")
+    except FileNotFoundError:
         return {
             'success': False,
-            'error': error_msg,
-            'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-
-def activate_model_version(version):
-    """Activate a specific model version"""
-    try:
-        models_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
-        
-        # Check if version exists
-        supervised_version_path = os.path.join(models_dir, f'supervised_model_v{version}.pkl')
-        anomaly_version_path = os.path.join(models_dir, f'anomaly_model_v{version}.pkl')
-        
-        if not os.path.exists(supervised_version_path) or not os.path.exists(anomaly_version_path):
-            return {
-                'success': False,
-                'error': f'Model version {version} not found'
-            }
-        
-        # Copy versioned models to current models
-        supervised_current_path = os.path.join(models_dir, 'supervised_model.pkl')
-        anomaly_current_path = os.path.join(models_dir, 'anomaly_model.pkl')
-        
-        # Load models to verify they are valid
-        try:
-            joblib.load(supervised_version_path)
-            joblib.load(anomaly_version_path)
-        except Exception as e:
-            return {
-                'success': False,
-                'error': f'Invalid model files: {str(e)}'
-            }
-        
-        # Make backup of current models
-        backup_time = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-        if os.path.exists(supervised_current_path):
-            os.rename(supervised_current_path, 
-                     os.path.join(models_dir, f'supervised_model_backup_{backup_time}.pkl'))
-        
-        if os.path.exists(anomaly_current_path):
-            os.rename(anomaly_current_path, 
-                     os.path.join(models_dir, f'anomaly_model_backup_{backup_time}.pkl'))
-        
-        # Copy versioned models to current
-        import shutil
-        shutil.copy2(supervised_version_path, supervised_current_path)
-        shutil.copy2(anomaly_version_path, anomaly_current_path)
-        
-        logger.info(f"Activated model version {version}")
-        
-        return {
-            'success': True,
-            'version': version,
-            'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            'error': f'Model version {version} not found'
         }
     except Exception as e:
         error_msg = f"Error activating model version {version}: {str(e)}"
@@ -311,14 +542,19 @@ def activate_model_version(version):
             'error': error_msg
         }
 
+def notify_workers():
+    """Under serve.py, have every worker reload the current models (this one already has)"""
+    launcher_pid = os.environ.get('FRAUDSHIELD_LAUNCHER_PID')
+    if launcher_pid and int(launcher_pid) != os.getpid():
+        try:
+            os.kill(int(launcher_pid), signal.SIGHUP)
+        except OSError as e:
+            log_error(f"Could not notify the launcher: {str(e)}", "model_reload_error")
+
 def reload_models():
     """Reload the current models"""
-    global supervised_model, anomaly_model, model_version
-    
     try:
-        supervised_model = joblib.load('models/supervised_model.pkl')
-        anomaly_model = joblib.load('models/anomaly_model.pkl')
-        model_version = "current"
+        model_registry.reload()
         logger.info("Models reloaded successfully")
         return True
     except Exception as e:
@@ -332,24 +568,18 @@ def submit_feedback():
     try:
         feedback = request.json
         
-        # Validate required fields
-        required_fields = ['transaction_id', 'original_decision', 'corrected_decision']
+        # Validate required fields; retraining turns the feedback into a training
+        # row, so it needs the transaction's own fields as well as the label
+        required_fields = ['transaction_id', 'original_decision', 'corrected_decision',
+                           'user_id', 'amount', 'timestamp']
         for field in required_fields:
             if field not in feedback:
                 return jsonify({'error': f'Missing required field: {field}'}), 400
         
-        # Save feedback to CSV for retraining
-        feedback_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
-        os.makedirs(feedback_dir, exist_ok=True)
-        feedback_file = os.path.join(feedback_dir, 'feedback.csv')
-        
-        # Create or append to feedback file
-        is_new_file = not os.path.exists(feedback_file)
-        with open(feedback_file, 'a', newline='') as f:
-            writer = pd.DataFrame([feedback]).to_csv(f, header=is_new_file, index=False)
+        # Append to the feedback store for retraining (one locked write, no DataFrame)
+        feedback_store.append(feedback)
         
         # Log the feedback
-        from utils.logging import log_feedback
         log_feedback(
             feedback['transaction_id'],
             feedback['original_decision'],
@@ -381,84 +611,47 @@ def settings_page():
 
 @app.route('/api/transactions')
 def get_transactions():
-    """API endpoint to get transaction data"""
+    """
+    API endpoint to get logged predictions, newest first
+
+    Query parameters: limit, cursor (from next_cursor of the previous page),
+    user_id, min_amount, max_amount, risk_level (low/medium/high), decision
+    """
     try:
-        # Read from logs/predictions.csv
-        csv_log_path = os.path.join('logs', 'predictions.csv')
-        if not os.path.exists(csv_log_path):
-            return jsonify([])
-            
-        transactions = []
-        with open(csv_log_path, 'r') as f:
-            import csv
-            reader = csv.DictReader(f)
-            for row in reader:
-                transactions.append({
-                    'timestamp': row['timestamp'],
-                    'user_id': row['user_id'],
-                    'amount': float(row['amount']),
-                    'risk_score': float(row['risk_score']),
-                    'decision': row['decision'],
-                    'model_version': row['model_version']
-                })
-        
-        # Sort by timestamp (newest first)
-        transactions.sort(key=lambda x: x['timestamp'], reverse=True)
+        args = request.args
+        transactions, next_cursor = prediction_store.query(
+            limit=args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+            cursor=args.get('cursor'),
+            user_id=args.get('user_id'),
+            min_amount=args.get('min_amount', type=float),
+            max_amount=args.get('max_amount', type=float),
+            risk_level=args.get('risk_level'),
+            decision=args.get('decision')
+        )
         
-        return jsonify(transactions)
+        return jsonify({
+            'transactions': transactions,
+            'next_cursor': next_cursor
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         log_error(f"Error fetching transactions: {str(e)}", "api_error")
-        return jsonify([])
+        return jsonify({'transactions': [], 'next_cursor': None})
 
 @app.route('/api/sample-transactions')
 def get_sample_transactions():
     """API endpoint to get sample transaction data from CSV"""
     try:
-        # Read from data/sample_transactions.csv
-        csv_path = os.path.join('data', 'sample_transactions.csv')
-        if not os.path.exists(csv_path):
+        # Parsed and serialized once per file change; unchanged data returns 304
+        body, etag = sample_transaction_cache.get()
+        if body is None:
             return jsonify([])
-            
-        transactions = []
-        with open(csv_path, 'r') as f:
-            import csv
-            reader = csv.DictReader(f)
-            for row in reader:
-                # Convert string values to appropriate types
-                risk_score = float(row.get('amount_deviation', 0)) * 0.7 + float(row.get('geo_diff', 0)) * 0.3
-                risk_score = min(risk_score, 1.0)  # Ensure risk score is between 0 and 1
-                
-                # Determine decision based on risk score
-                decision = "ALLOW"
-                if risk_score > 0.7:
-                    decision = "BLOCK"
-                elif risk_score > 0.4:
-                    decision = "CHALLENGE"
-                
-                transactions.append({
-                    'timestamp': row.get('timestamp', ''),
-                    'user_id': row.get('user_id', ''),
-                    'amount': float(row.get('amount', 0)),
-                    'device_id': row.get('device_id', ''),
-                    'latitude': float(row.get('latitude', 0)),
-                    'longitude': float(row.get('longitude', 0)),
-                    'hour': int(row.get('hour', 0)),
-                    'velocity': int(row.get('velocity', 0)),
-                    'geo_diff': float(row.get('geo_diff', 0)),
-                    'amount_deviation': float(row.get('amount_deviation', 0)),
-                    'is_weekend': int(row.get('is_weekend', 0)),
-                    'device_familiarity': float(row.get('device_familiarity', 0)),
-                    'location_familiarity': float(row.get('location_familiarity', 0)),
-                    'time_since_last': float(row.get('time_since_last', 0)),
-                    'is_fraud': int(row.get('is_fraud', 0)),
-                    'risk_score': risk_score,
-                    'decision': decision
-                })
-        
-        # Sort by timestamp (newest first)
-        transactions.sort(key=lambda x: x['timestamp'], reverse=True)
         
-        return jsonify(transactions)
+        response = app.response_class(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
     except Exception as e:
         app.logger.error(f"Error fetching sample transactions: {str(e)}")
         return jsonify([])
@@ -466,9 +659,11 @@ def get_sample_transactions():
 @app.route('/api/llm-analyze', methods=['POST'])
 def llm_analyze():
     """Analyze a transaction using LLM capabilities"""
+    timer = request_metrics.timer('llm_analyze')
     data = request.json
     
     if not data:
+        timer.finish(400)
         return jsonify({'error': 'No data provided'}), 400
     
     try:
@@ -483,28 +678,42 @@ def llm_analyze():
         }
         
         # Use multimodal detector for advanced analysis
-        anomaly_score, feature_importance = multimodal_detector.detect_anomalies(transaction)
+        try:
+            detector = multimodal_detector.get(wait=False)
+        except ResourceUnavailable as e:
+            timer.finish(503)
+            return jsonify({'error': str(e), 'multimodal': multimodal_detector.status()}), 503
+        timer.stage('parse')
+        anomaly_score, feature_importance = detector.detect_anomalies(transaction, timer=timer)
         
         # Generate natural language explanation
+        from utils.explanation_generator import generate_fraud_explanation
         explanation = generate_fraud_explanation(transaction, feature_importance)
+        timer.stage('explanation')
         
-        return jsonify({
+        response = jsonify({
             'success': True,
             'risk_score': float(anomaly_score),
             'explanation': explanation,
             'feature_importance': feature_importance
         })
+        timer.stage('response')
+        timer.finish(200)
+        return response
     
     except Exception as e:
         app.logger.error(f"Error in LLM analysis: {str(e)}")
+        timer.finish(500)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/fraud-assistant', methods=['POST'])
 def fraud_assistant():
     """Provide AI-powered assistance for fraud investigation"""
+    timer = request_metrics.timer('fraud_assistant')
     data = request.json
     
     if not data:
+        timer.finish(400)
         return jsonify({'error': 'No data provided'}), 400
     
     try:
@@ -545,7 +754,10 @@ def fraud_assistant():
             "content": query
         })
         
+        timer.stage('prompt')
+        
         # Call OpenAI API
+        import openai
         response = openai.ChatCompletion.create(
             model="gpt-4",
             messages=formatted_conversation,
@@ -554,17 +766,23 @@ def fraud_assistant():
         )
         
         assistant_response = response.choices[0].message.content
+        timer.stage('llm_call')
         
         # Generate suggested actions based on the conversation
         suggested_actions = generate_suggested_actions(query, transaction, assistant_response)
+        timer.stage('suggested_actions')
         
-        return jsonify({
+        response = jsonify({
             'response': assistant_response,
             'suggested_actions': suggested_actions
         })
+        timer.stage('response')
+        timer.finish(200)
+        return response
     
     except Exception as e:
         app.logger.error(f"Error in fraud assistant: {str(e)}")
+        timer.finish(500)
         return jsonify({'error': str(e)}), 500
 
 def generate_suggested_actions(query, transaction, response):
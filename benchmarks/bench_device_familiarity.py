@@ -0,0 +1,110 @@
+"""
+Memory and lookup latency of the exact and sketch device familiarity stores.
+
+Inserts N distinct (user, device) pairs into each store, then times
+familiarity lookups of pairs that were seen and pairs that were not, and
+measures how often an unseen pair has a non-zero count. Memory is the growth
+of the process's RSS while the store is filled (for the sketch, its counter
+pages being touched), measured the same way for both stores.
+
+    python benchmarks/bench_device_familiarity.py --pairs 10000000
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.device_familiarity import DeviceSketchStore, ExactDeviceStore  # noqa: E402
+from utils.process_memory import process_memory  # noqa: E402
+
+DEVICES_PER_USER = 4
+NOW = 1745000000.0
+
+
+def pair(i):
+    return f'user_{i // DEVICES_PER_USER}', f'device_{i}'
+
+
+def fill(store, n):
+    started = time.perf_counter()
+    for i in range(n):
+        user_id, device_id = pair(i)
+        store.record(user_id, device_id, NOW)
+    return time.perf_counter() - started
+
+
+def time_lookups(store, indices):
+    timings = np.empty(len(indices))
+    hits = 0
+    for k, i in enumerate(indices):
+        user_id, device_id = pair(i)
+        started = time.perf_counter()
+        store.familiarity(user_id, device_id, NOW)
+        timings[k] = time.perf_counter() - started
+        hits += store.count(user_id, device_id, NOW) > 0
+    return timings, hits
+
+
+def rss_bytes():
+    return process_memory()['rss_mb'] * 1024 * 1024
+
+
+def run(make_store, n, lookups):
+    gc.collect()
+    rss_before = rss_bytes()
+    store = make_store()
+    insert_seconds = fill(store, n)
+    gc.collect()
+    memory = rss_bytes() - rss_before
+
+    rng = np.random.default_rng(0)
+    seen, _ = time_lookups(store, rng.integers(0, n, lookups))
+    unseen, false_hits = time_lookups(store, rng.integers(n, 2 * n, lookups))
+    return store, {
+        'store': store.kind,
+        'pairs': n,
+        'memory_mb': round(memory / 1024 / 1024, 1),
+        'bytes_per_pair': round(memory / n, 1),
+        'insert_us': round(insert_seconds / n * 1e6, 3),
+        'lookup_p50_us': round(float(np.percentile(seen, 50)) * 1e6, 3),
+        'lookup_p99_us': round(float(np.percentile(seen, 99)) * 1e6, 3),
+        'unseen_lookup_p50_us': round(float(np.percentile(unseen, 50)) * 1e6, 3),
+        'false_familiar_rate': false_hits / float(lookups)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pairs', type=int, default=10000000)
+    parser.add_argument('--lookups', type=int, default=100000)
+    parser.add_argument('--fpr', type=float, default=0.01, help='Sketch target false-familiarity rate')
+    parser.add_argument('--memory-mb', type=float, default=256, help='Sketch memory cap')
+    parser.add_argument('--skip-exact', action='store_true', help='Only run the sketch')
+    args = parser.parse_args()
+
+    results = []
+    sketch, result = run(lambda: DeviceSketchStore(expected_pairs=args.pairs, false_positive_rate=args.fpr,
+                                                   max_bytes=args.memory_mb * 1024 * 1024),
+                         args.pairs, args.lookups)
+    stats = sketch.stats()
+    results.append(dict(result, depth=stats['depth'], width=stats['width'],
+                        allocated_mb=round(stats['memory_bytes'] / 1024 / 1024, 1),
+                        estimated_false_positive_rate=round(stats['false_positive_rate'], 6)))
+    del sketch, stats
+
+    if not args.skip_exact:
+        store, result = run(ExactDeviceStore, args.pairs, args.lookups)
+        results.append(result)
+        del store
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
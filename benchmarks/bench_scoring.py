@@ -0,0 +1,416 @@
+"""
+End-to-end latency and throughput of the scoring path.
+
+Runs locally without network access and measures:
+
+- cold start: importing app (models included) and the first /predict, each
+  run in a fresh process
+- /predict latency percentiles for single requests through the Flask test client
+- sustained /predict throughput with 1, 4 and 16 concurrent clients
+- /predict/batch latency per batch size
+- load time and inference cost of every model artifact in models/
+
+Transactions come from utils.synthetic_transactions. Prediction logs are
+written to a temporary directory, not the repository's logs/.
+
+Results are saved as JSON. With --baseline (or --compare on two saved files)
+every latency/throughput metric is checked against the baseline and the
+script exits with status 1 when one regressed by more than --threshold.
+
+    python benchmarks/bench_scoring.py --output bench.json
+    python benchmarks/bench_scoring.py --output bench.json --baseline bench-baseline.json
+    python benchmarks/bench_scoring.py --compare bench.json bench-baseline.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from importlib import metadata
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from models.compiled_trees import compiled_path, load_model  # noqa: E402
+from models.scoring_pipeline import ScoringPipeline  # noqa: E402
+from utils.synthetic_transactions import generate_shard  # noqa: E402
+
+SECTIONS = ('cold_start', 'latency', 'throughput', 'batch', 'models')
+
+# Metric name suffixes compared against a baseline, and whether higher values are better
+METRIC_DIRECTIONS = (('_per_second', True), ('_ms', False), ('_us', False), ('_seconds', False))
+
+COLD_START_CODE = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().post('/predict', json=json.loads(sys.argv[1]))
+finished = time.perf_counter()
+app.prediction_writer.close()
+print(json.dumps({'import_seconds': imported - started, 'first_request_seconds': finished - imported,
+                  'status': response.status_code}))
+'''
+
+
+def sample_transactions(n, seed=0):
+    """/predict payloads for n synthetic transactions"""
+    frame = generate_shard(0, n, seed, shard_rows=n)
+    return [{
+        'transaction_id': row.transaction_id,
+        'user_id': row.user_id,
+        'card_id': row.card_id,
+        'device_id': row.device_id,
+        'amount': float(row.amount),
+        'timestamp': row.timestamp,
+        'location': {'latitude': float(row.latitude), 'longitude': float(row.longitude)}
+    } for row in frame.itertuples(index=False)]
+
+
+def summarize(seconds, unit='ms'):
+    """Percentiles of a list of durations in seconds"""
+    scale = 1e3 if unit == 'ms' else 1e6
+    seconds = np.asarray(seconds, dtype=np.float64)
+    return {
+        f'p50_{unit}': round(float(np.percentile(seconds, 50)) * scale, 3),
+        f'p95_{unit}': round(float(np.percentile(seconds, 95)) * scale, 3),
+        f'p99_{unit}': round(float(np.percentile(seconds, 99)) * scale, 3),
+        f'mean_{unit}': round(float(seconds.mean()) * scale, 3),
+        f'max_{unit}': round(float(seconds.max()) * scale, 3)
+    }
+
+
+def bench_cold_start(transaction, runs, workdir):
+    """Import and first-request time of the app in fresh interpreters"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get('PYTHONPATH')])))
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        completed = subprocess.run([sys.executable, '-c', COLD_START_CODE, json.dumps(transaction)],
+                                   cwd=workdir, env=env, capture_output=True, text=True)
+        total = time.perf_counter() - started
+        if completed.returncode != 0:
+            return {'error': completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else
+                    f'exit code {completed.returncode}'}
+        sample = json.loads(completed.stdout.strip().splitlines()[-1])
+        sample['total_seconds'] = total
+        samples.append(sample)
+
+    return {
+        'runs': runs,
+        'import_seconds': round(float(np.median([s['import_seconds'] for s in samples])), 4),
+        'first_request_ms': round(float(np.median([s['first_request_seconds'] for s in samples])) * 1e3, 3),
+        'total_seconds': round(float(np.median([s['total_seconds'] for s in samples])), 4),
+        'errors': sum(1 for s in samples if s['status'] != 200)
+    }
+
+
+def bench_latency(client, transactions, requests, warmup):
+    """Sequential /predict requests, one at a time"""
+    for transaction in transactions[:warmup]:
+        client.post('/predict', json=transaction)
+
+    timings = np.empty(requests)
+    errors = 0
+    for i in range(requests):
+        transaction = transactions[i % len(transactions)]
+        started = time.perf_counter()
+        response = client.post('/predict', json=transaction)
+        timings[i] = time.perf_counter() - started
+        errors += response.status_code != 200
+    return dict(summarize(timings), requests=requests, errors=errors)
+
+
+def bench_throughput(flask_app, transactions, clients, seconds):
+    """Requests per second with `clients` threads posting /predict back to back for `seconds`"""
+    timings = [[] for _ in range(clients)]
+    errors = [0] * clients
+    barrier = threading.Barrier(clients + 1)
+    deadline = [None]
+
+    def run_client(k):
+        client = flask_app.test_client()
+        barrier.wait()
+        i = k
+        while time.perf_counter() < deadline[0]:
+            started = time.perf_counter()
+            response = client.post('/predict', json=transactions[i % len(transactions)])
+            timings[k].append(time.perf_counter() - started)
+            errors[k] += response.status_code != 200
+            i += clients
+
+    threads = [threading.Thread(target=run_client, args=(k,), daemon=True) for k in range(clients)]
+    for thread in threads:
+        thread.start()
+    deadline[0] = time.perf_counter() + seconds
+    started = time.perf_counter()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    all_timings = [t for client_timings in timings for t in client_timings]
+    return dict(summarize(all_timings), clients=clients, requests=len(all_timings),
+                requests_per_second=round(len(all_timings) / elapsed, 1), errors=sum(errors))
+
+
+def bench_batch(client, transactions, batch_size, rows):
+    """/predict/batch latency for one batch size, over about `rows` transactions in total"""
+    repeats = max(3, min(100, rows // batch_size))
+    client.post('/predict/batch', json={'transactions': transactions[:batch_size]})
+
+    timings = np.empty(repeats)
+    errors = 0
+    for i in range(repeats):
+        start = (i * batch_size) % max(1, len(transactions) - batch_size)
+        batch = transactions[start:start + batch_size]
+        started = time.perf_counter()
+        response = client.post('/predict/batch', json={'transactions': batch})
+        timings[i] = time.perf_counter() - started
+        errors += response.status_code != 200
+    median = float(np.median(timings))
+    return dict(summarize(timings), batch_size=batch_size, batches=repeats, errors=errors,
+                per_transaction_us=round(median / batch_size * 1e6, 3),
+                transactions_per_second=round(batch_size / median, 1))
+
+
+def model_artifacts(models_dir):
+    """(name, loader) for every model pickle, compiled model and pipeline artifact in models_dir"""
+    artifacts = []
+    for name in sorted(os.listdir(models_dir)):
+        path = os.path.join(models_dir, name)
+        if name.endswith('.pkl') and not name.startswith('feature_scaler'):
+            artifacts.append((name, lambda path=path: load_model(path, prefer_compiled=False)))
+            if os.path.exists(compiled_path(path)):
+                artifacts.append((os.path.basename(compiled_path(path)),
+                                  lambda path=path: load_model(compiled_path(path), prefer_compiled=True)))
+        elif name.startswith('scoring_pipeline') and name.endswith('.npz'):
+            artifacts.append((name, lambda path=path: ScoringPipeline.load(path, mmap=True)))
+    return artifacts
+
+
+def _inference(model):
+    """The scoring call /predict makes on this kind of artifact"""
+    if isinstance(model, ScoringPipeline):
+        return model.model_scores
+    if getattr(model, 'kind', None) == 'isolation_forest' or not hasattr(model, 'predict_proba'):
+        return model.decision_function
+    return model.predict_proba
+
+
+def bench_model(load, single_rows=200, batch_rows=1000, batch_repeats=10):
+    """Load time and single-row/batch inference time of one artifact"""
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        started = time.perf_counter()
+        model = load()
+        load_seconds = time.perf_counter() - started
+    load_warnings = sorted({warning.category.__name__ for warning in caught})
+
+    n_features = getattr(model, 'n_features_in_', None)
+    if not n_features:
+        return {'error': 'Unknown number of features', 'load_ms': round(load_seconds * 1e3, 3)}
+    predict = _inference(model)
+    rng = np.random.default_rng(0)
+    X = rng.random((batch_rows, int(n_features))).astype(np.float32)
+
+    predict(X[:1])
+    single = np.empty(single_rows)
+    for i in range(single_rows):
+        started = time.perf_counter()
+        predict(X[i % batch_rows:i % batch_rows + 1])
+        single[i] = time.perf_counter() - started
+
+    batch = np.empty(batch_repeats)
+    for i in range(batch_repeats):
+        started = time.perf_counter()
+        predict(X)
+        batch[i] = time.perf_counter() - started
+
+    return {
+        'class': getattr(model, 'source_class', model.__class__.__name__),
+        'n_features': int(n_features),
+        'load_ms': round(load_seconds * 1e3, 3),
+        'single_p50_us': round(float(np.percentile(single, 50)) * 1e6, 3),
+        'single_p99_us': round(float(np.percentile(single, 99)) * 1e6, 3),
+        'batch_rows': batch_rows,
+        'batch_per_row_us': round(float(np.median(batch)) / batch_rows * 1e6, 3),
+        'load_warnings': load_warnings
+    }
+
+
+def bench_models(models_dir):
+    results = {}
+    for name, load in model_artifacts(models_dir):
+        try:
+            results[name] = bench_model(load)
+        except Exception as e:
+            # Pickles from other library versions, feature-count mismatches, ...
+            results[name] = {'error': f'{e.__class__.__name__}: {e}'}
+    return results
+
+
+def _version(distribution):
+    try:
+        return metadata.version(distribution)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'created': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': _version('numpy'),
+        'sklearn': _version('scikit-learn'),
+        'flask': _version('flask')
+    }
+
+
+def run(args):
+    sections = args.sections.split(',') if args.sections else list(SECTIONS)
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        raise SystemExit(f"Unknown sections: {', '.join(sorted(unknown))} (expected {', '.join(SECTIONS)})")
+
+    transactions = sample_transactions(args.transactions)
+    results = {'environment': environment(), 'settings': vars(args).copy()}
+
+    # The app writes its prediction log and store relative to the working directory
+    workdir = tempfile.mkdtemp(prefix='fraudshield-bench-')
+    previous_cwd = os.getcwd()
+    try:
+        os.chdir(workdir)
+        if 'cold_start' in sections:
+            results['cold_start'] = bench_cold_start(transactions[0], args.cold_runs, workdir)
+
+        if any(section in sections for section in ('latency', 'throughput', 'batch')):
+            import app as app_module
+            client = app_module.app.test_client()
+
+            if 'latency' in sections:
+                results['latency'] = bench_latency(client, transactions, args.requests, args.warmup)
+            if 'throughput' in sections:
+                results['throughput'] = {str(clients): bench_throughput(app_module.app, transactions, clients,
+                                                                        args.duration)
+                                         for clients in args.clients}
+            if 'batch' in sections:
+                results['batch'] = {str(size): bench_batch(client, transactions, size, args.batch_rows)
+                                    for size in args.batch_sizes if size <= len(transactions)}
+            app_module.prediction_writer.close()
+
+        if 'models' in sections:
+            results['models'] = bench_models(os.path.join(REPO_DIR, 'models'))
+    finally:
+        os.chdir(previous_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def flatten_metrics(results, prefix=''):
+    """Comparable metrics as {dotted.name: (value, higher_is_better)}"""
+    metrics = {}
+    for key, value in results.items():
+        if key in ('environment', 'settings'):
+            continue
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            metrics.update(flatten_metrics(value, f'{name}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            for suffix, higher_is_better in METRIC_DIRECTIONS:
+                if key.endswith(suffix):
+                    metrics[name] = (float(value), higher_is_better)
+                    break
+    return metrics
+
+
+def compare(current, baseline, threshold=0.1):
+    """
+    Metrics of `current` that are worse than `baseline` by more than `threshold`
+
+    Returns:
+        (regressions, rows): regressions is a list of metric names, rows one
+        (name, baseline, current, relative change) per metric found in both
+    """
+    current_metrics = flatten_metrics(current)
+    baseline_metrics = flatten_metrics(baseline)
+    regressions, rows = [], []
+    for name, (value, higher_is_better) in current_metrics.items():
+        if name not in baseline_metrics:
+            continue
+        base = baseline_metrics[name][0]
+        change = (value - base) / base if base else 0.0
+        rows.append((name, base, value, change))
+        if (change < -threshold) if higher_is_better else (change > threshold):
+            regressions.append(name)
+    return regressions, rows
+
+
+def print_comparison(regressions, rows, threshold):
+    width = max([len(name) for name, _, _, _ in rows] + [6])
+    print(f"{'metric':<{width}}  {'baseline':>12}  {'current':>12}  {'change':>8}")
+    for name, base, value, change in rows:
+        flag = '  REGRESSION' if name in regressions else ''
+        print(f'{name:<{width}}  {base:>12.3f}  {value:>12.3f}  {change:>+8.1%}{flag}')
+    print(f'{len(regressions)} regression(s) beyond {threshold:.0%} in {len(rows)} metrics')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', help='Write results to this JSON file (default: print them)')
+    parser.add_argument('--baseline', help='Compare the results with this saved run')
+    parser.add_argument('--compare', nargs=2, metavar=('CURRENT', 'BASELINE'),
+                        help='Only compare two saved runs')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Relative change counted as a regression')
+    parser.add_argument('--sections', help=f"Comma-separated subset of: {', '.join(SECTIONS)}")
+    parser.add_argument('--transactions', type=int, default=2000, help='Distinct synthetic transactions to send')
+    parser.add_argument('--requests', type=int, default=2000, help='Sequential /predict requests')
+    parser.add_argument('--warmup', type=int, default=100)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds per throughput level')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--batch-rows', type=int, default=20000, help='Transactions scored per batch size')
+    parser.add_argument('--cold-runs', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            results = json.load(f)
+        baseline_path = args.compare[1]
+    else:
+        results = run(args)
+        baseline_path = args.baseline
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+        else:
+            print(json.dumps(results, indent=2))
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions, rows = compare(results, baseline, args.threshold)
+        print_comparison(regressions, rows, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+"""
+Compiled, array-backed inference for the tree ensembles used in scoring.
+
+A trained RandomForestClassifier, GradientBoostingClassifier or IsolationForest
+is flattened into contiguous NumPy node arrays (feature, threshold, left/right
+children, leaf value). All trees share one set of arrays and are evaluated
+together, level by level, with vectorized NumPy operations. This skips the
+per-call estimator overhead of sklearn (input validation, joblib dispatch,
+per-tree Python loops), which dominates when scoring one or a few rows.
+
+Scores match the source estimators within floating point tolerance.
+"""
+import io
+import json
+import os
+import struct
+import zipfile
+
+import numpy as np
+
+COMPILED_FORMAT_VERSION = 1
+COMPILED_EXTENSION = '.npz'
+
+_ARRAY_FIELDS = ('feature', 'threshold', 'left', 'right', 'value', 'roots')
+
+# Array data in saved archives starts on this boundary so memory-mapped arrays are aligned
+_ARCHIVE_ALIGNMENT = 64
+_PADDING_EXTRA_ID = 0x6e70  # private zip extra field holding alignment padding
+
+
+def _average_path_length(n_samples):
+    """Expected path length of an unsuccessful BST search, c(n) in the Isolation Forest paper"""
+    n_samples = np.asarray(n_samples, dtype=np.float64)
+    result = np.zeros_like(n_samples)
+
+    mask_two = n_samples == 2
+    mask_big = n_samples > 2
+    result[mask_two] = 1.0
+    n = n_samples[mask_big]
+    result[mask_big] = 2.0 * (np.log(n - 1.0) + np.euler_gamma) - 2.0 * (n - 1.0) / n
+    return result
+
+
+def _node_depths(left, right):
+    """Depth of every node of one tree (root at depth 0)"""
+    depths = np.zeros(left.shape[0], dtype=np.int32)
+    frontier = np.array([0])
+    depth = 0
+    while frontier.size:
+        children = np.concatenate([left[frontier], right[frontier]])
+        children = children[children >= 0]
+        depth += 1
+        depths[children] = depth
+        frontier = children
+    return depths
+
+
+def save_arrays(path, arrays):
+    """
+    Write arrays as an uncompressed .npz that np.load reads as usual
+
+    Each member is padded (through a zip extra field) so that its array data
+    starts on a 64-byte file offset, which keeps memory-mapped arrays aligned.
+    The archive is written to a temporary file and renamed into place, so a
+    process that has the old file mapped keeps reading it intact.
+    """
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    with open(tmp_path, 'wb') as f, zipfile.ZipFile(f, 'w', zipfile.ZIP_STORED) as archive:
+        for name, array in arrays.items():
+            buffer = io.BytesIO()
+            np.lib.format.write_array(buffer, np.asanyarray(array), allow_pickle=False)
+            info = zipfile.ZipInfo(name + '.npy', date_time=(1980, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_STORED
+            # .npy headers are padded to 64 bytes, so aligning the member aligns the data
+            data_start = f.tell() + 30 + len(info.filename.encode('utf-8')) + 4
+            padding = -data_start % _ARCHIVE_ALIGNMENT
+            info.extra = struct.pack('<HH', _PADDING_EXTRA_ID, padding) + b'\0' * padding
+            archive.writestr(info, buffer.getvalue())
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_arrays(path, mmap=False):
+    """
+    Read every array of an .npz into a dict
+
+    With mmap=True, arrays stored uncompressed (as np.savez writes them) are
+    memory-mapped read-only straight from the archive instead of copied into
+    process memory: loading is near-instant and the pages are shared by every
+    process that maps the same file. Compressed or 0-d members are read
+    normally.
+    """
+    if not mmap:
+        with np.load(path, allow_pickle=False) as arrays:
+            return {name: arrays[name] for name in arrays.files}
+
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            array = None
+            if info.compress_type == zipfile.ZIP_STORED:
+                # Member data follows the local header and its variable-length fields
+                f.seek(info.header_offset)
+                header = f.read(30)
+                name_length, extra_length = struct.unpack('<HH', header[26:30])
+                f.seek(info.header_offset + 30 + name_length + extra_length)
+                version = np.lib.format.read_magic(f)
+                read_header = {(1, 0): np.lib.format.read_array_header_1_0,
+                               (2, 0): np.lib.format.read_array_header_2_0}.get(version)
+                shape, fortran_order, dtype = read_header(f) if read_header else ((), False, None)
+                if shape and not dtype.hasobject:
+                    array = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                      order='F' if fortran_order else 'C')
+            if array is None:
+                with archive.open(info) as member:
+                    array = np.lib.format.read_array(member, allow_pickle=False)
+            arrays[name] = array
+    return arrays
+
+
+class CompiledForest:
+    """
+    A tree ensemble stored as flat node arrays
+
+    All trees are concatenated: `roots[t]` is the index of tree t's root in the
+    shared arrays. Leaves point to themselves as both children so the
+    level-synchronous traversal can run a fixed number of steps.
+
+    kind is one of 'random_forest', 'gradient_boosting' or 'isolation_forest'.
+    """
+
+    def __init__(self, kind, feature, threshold, left, right, value, roots,
+                 n_features, max_depth, init_score=0.0, offset=0.0, proba_scale=1.0,
+                 source_class=None):
+        self.kind = kind
+        self.feature = np.ascontiguousarray(feature, dtype=np.int32)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.left = np.ascontiguousarray(left, dtype=np.int32)
+        self.right = np.ascontiguousarray(right, dtype=np.int32)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.int32)
+        self.n_features_in_ = int(n_features)
+        self.max_depth = int(max_depth)
+        self.init_score = float(init_score)
+        self.offset = float(offset)
+        self.proba_scale = float(proba_scale)
+        self.source_class = source_class or kind
+
+    @property
+    def n_trees(self):
+        return int(self.roots.shape[0])
+
+    def _prepare(self, X):
+        # sklearn trees compare float32 feature values against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f'X has {X.shape[1]} features, but the model expects {self.n_features_in_}')
+        return np.ascontiguousarray(X)
+
+    def _tree_values(self, X):
+        """Leaf value reached by every row in every tree, shape (n_rows, n_trees)"""
+        n_rows = X.shape[0]
+        flat_X = X.ravel()
+        row_offsets = (np.arange(n_rows, dtype=np.intp) * self.n_features_in_)[:, None]
+
+        nodes = np.broadcast_to(self.roots, (n_rows, self.n_trees)).copy()
+        for _ in range(self.max_depth):
+            go_left = flat_X[row_offsets + self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        return self.value[nodes]
+
+    def _raw_scores(self, X):
+        """Summed (or averaged) tree output per row"""
+        X = self._prepare(X)
+        values = self._tree_values(X)
+        if self.kind == 'random_forest':
+            return values.sum(axis=1) / self.n_trees
+        return values.sum(axis=1)
+
+    def predict_proba(self, X):
+        """Class probabilities, shape (n_rows, 2), like the source classifier"""
+        if self.kind == 'random_forest':
+            positive = self._raw_scores(X)
+        elif self.kind == 'gradient_boosting':
+            raw = self.init_score + self._raw_scores(X)
+            positive = 1.0 / (1.0 + np.exp(-self.proba_scale * raw))
+        else:
+            raise AttributeError(f'{self.source_class} does not support predict_proba')
+        return np.column_stack([1.0 - positive, positive])
+
+    def score_samples(self, X):
+        """Isolation Forest anomaly score (lower is more abnormal)"""
+        if self.kind != 'isolation_forest':
+            raise AttributeError(f'{self.source_class} does not support score_samples')
+        # value already holds depth + c(n_samples_in_leaf); init_score holds T * c(max_samples)
+        depths = self._raw_scores(X)
+        denominator = self.init_score
+        scores = 2 ** (-np.divide(depths, denominator, out=np.ones_like(depths), where=denominator != 0))
+        return -scores
+
+    def decision_function(self, X):
+        """Isolation Forest decision function, or raw log-odds for gradient boosting"""
+        if self.kind == 'isolation_forest':
+            return self.score_samples(X) - self.offset
+        if self.kind == 'gradient_boosting':
+            return self.init_score + self._raw_scores(X)
+        raise AttributeError(f'{self.source_class} does not support decision_function')
+
+    def to_arrays(self, prefix=''):
+        """Flatten to a dict of arrays suitable for np.savez"""
+        arrays = {prefix + name: getattr(self, name) for name in _ARRAY_FIELDS}
+        arrays[prefix + 'meta'] = np.array(json.dumps({
+            'format_version': COMPILED_FORMAT_VERSION,
+            'kind': self.kind,
+            'n_features': self.n_features_in_,
+            'max_depth': self.max_depth,
+            'init_score': self.init_score,
+            'offset': self.offset,
+            'proba_scale': self.proba_scale,
+            'source_class': self.source_class
+        }))
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix=''):
+        """Rebuild from the dict produced by to_arrays (or an opened .npz)"""
+        meta = json.loads(str(arrays[prefix + 'meta']))
+        if meta.get('format_version') != COMPILED_FORMAT_VERSION:
+            raise ValueError(f"Unsupported compiled model format: {meta.get('format_version')}")
+        return cls(
+            meta['kind'],
+            *(arrays[prefix + name] for name in _ARRAY_FIELDS),
+            n_features=meta['n_features'],
+            max_depth=meta['max_depth'],
+            init_score=meta['init_score'],
+            offset=meta['offset'],
+            proba_scale=meta['proba_scale'],
+            source_class=meta['source_class']
+        )
+
+    def save(self, path):
+        """Write the compiled model as an uncompressed .npz"""
+        return save_arrays(path, self.to_arrays())
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        """Load a compiled model; mmap=True maps the node arrays instead of copying them"""
+        return cls.from_arrays(load_arrays(path, mmap=mmap))
+
+
+def _concatenate_trees(trees, leaf_values, feature_maps=None):
+    """Merge sklearn Tree objects into shared node arrays with global indices"""
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+
+    for t, tree in enumerate(trees):
+        n_nodes = tree.node_count
+        node_ids = np.arange(n_nodes, dtype=np.int64)
+        is_leaf = tree.children_left == -1
+
+        feature = np.where(is_leaf, 0, tree.feature).astype(np.int64)
+        if feature_maps is not None:
+            # Trees fitted on a feature subset index into that subset
+            feature = np.asarray(feature_maps[t], dtype=np.int64)[feature]
+
+        features.append(feature)
+        thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+        lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+        rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+        values.append(leaf_values[t])
+        roots.append(offset)
+
+        offset += n_nodes
+        max_depth = max(max_depth, int(tree.max_depth))
+
+    return (np.concatenate(features), np.concatenate(thresholds), np.concatenate(lefts),
+            np.concatenate(rights), np.concatenate(values), np.array(roots), max_depth)
+
+
+def _compile_random_forest(model):
+    if len(model.classes_) != 2:
+        raise ValueError('Only binary classifiers can be compiled')
+
+    trees = [estimator.tree_ for estimator in model.estimators_]
+    leaf_values = []
+    for tree in trees:
+        # Normalize class counts/fractions to probabilities like predict_proba does
+        value = tree.value[:, 0, :]
+        totals = value.sum(axis=1)
+        totals[totals == 0] = 1.0
+        leaf_values.append(value[:, 1] / totals)
+
+    arrays = _concatenate_trees(trees, leaf_values)
+    return CompiledForest('random_forest', *arrays[:6], n_features=model.n_features_in_,
+                          max_depth=arrays[6], source_class=model.__class__.__name__)
+
+
+def _compile_gradient_boosting(model):
+    if model.estimators_.shape[1] != 1:
+        raise ValueError('Only binary gradient boosting classifiers can be compiled')
+
+    trees = [estimator.tree_ for estimator in model.estimators_[:, 0]]
+    leaf_values = [tree.value[:, 0, 0] * model.learning_rate for tree in trees]
+
+    # The init estimator's prediction is constant across rows
+    init_score = float(model._raw_predict_init(np.zeros((1, model.n_features_in_), dtype=np.float32))[0, 0])
+    proba_scale = 2.0 if getattr(model, 'loss', 'log_loss') == 'exponential' else 1.0
+
+    arrays = _concatenate_trees(trees, leaf_values)
+    return CompiledForest('gradient_boosting', *arrays[:6], n_features=model.n_features_in_,
+                          max_depth=arrays[6], init_score=init_score, proba_scale=proba_scale,
+                          source_class=model.__class__.__name__)
+
+
+def _compile_isolation_forest(model):
+    trees = [estimator.tree_ for estimator in model.estimators_]
+    leaf_values = []
+    for tree in trees:
+        # Path length to the leaf plus the expected remaining length for its samples
+        depths = _node_depths(tree.children_left, tree.children_right)
+        leaf_values.append(depths + _average_path_length(tree.n_node_samples))
+
+    arrays = _concatenate_trees(trees, leaf_values, feature_maps=model.estimators_features_)
+    denominator = len(trees) * float(_average_path_length([model.max_samples_])[0])
+    return CompiledForest('isolation_forest', *arrays[:6], n_features=model.n_features_in_,
+                          max_depth=arrays[6], init_score=denominator, offset=model.offset_,
+                          source_class=model.__class__.__name__)
+
+
+def compile_model(model):
+    """Compile a fitted RandomForest, GradientBoosting or IsolationForest model"""
+    from sklearn.ensemble import GradientBoostingClassifier, IsolationForest, RandomForestClassifier
+
+    if isinstance(model, RandomForestClassifier):
+        return _compile_random_forest(model)
+    if isinstance(model, GradientBoostingClassifier):
+        return _compile_gradient_boosting(model)
+    if isinstance(model, IsolationForest):
+        return _compile_isolation_forest(model)
+    raise TypeError(f'Cannot compile model of type {model.__class__.__name__}')
+
+
+def compiled_path(pkl_path):
+    """Path of the compiled artifact that sits next to a .pkl model"""
+    return os.path.splitext(pkl_path)[0] + COMPILED_EXTENSION
+
+
+def save_compiled(model, pkl_path):
+    """Compile `model` and write it next to `pkl_path`; returns the artifact path"""
+    return compile_model(model).save(compiled_path(pkl_path))
+
+
+def load_model(pkl_path, prefer_compiled=True, mmap=False):
+    """
+    Load a model, preferring its compiled artifact when present
+
+    The compiled artifact is only used if it is at least as new as the .pkl,
+    so a pickle replaced by hand never runs with stale compiled trees. With
+    mmap=True its node arrays are memory-mapped (see load_arrays).
+    """
+    npz_path = compiled_path(pkl_path)
+    if prefer_compiled and os.path.exists(npz_path):
+        if not os.path.exists(pkl_path) or os.path.getmtime(npz_path) >= os.path.getmtime(pkl_path):
+            try:
+                return CompiledForest.load(npz_path, mmap=mmap)
+            except (OSError, ValueError, KeyError):
+                # Unreadable or incompatible artifact: fall back to the pickle
+                if not os.path.exists(pkl_path):
+                    raise
+
+    import joblib
+    return joblib.load(pkl_path)
+
+
+if __name__ == '__main__':
+    # Compile existing pickles in place, e.g.
+    #   python -m models.compiled_trees models/supervised_model.pkl models/anomaly_model.pkl
+    import sys
+    import joblib
+
+    for pkl_path in sys.argv[1:]:
+        print(f'{pkl_path} -> {save_compiled(joblib.load(pkl_path), pkl_path)}')
@@ -0,0 +1,179 @@
+"""
+Incremental updates of the serving forests from a window of new feedback.
+
+Instead of refitting from scratch, an update trains a few new trees on the
+recent feedback (plus a replay sample of older data, so that both classes
+are present and the new trees do not only know the latest days) and adds
+them to a copy of the current forest. Then it retires as many old trees as
+it added, so the ensemble keeps a fixed size:
+
+- 'oldest' retires the trees that came from the earliest windows
+- 'weakest' retires the old trees with the lowest validation AUC
+  (supervised forest only; the isolation forest always retires the oldest)
+
+Trees are independent in both forests, so a forest is updated by editing its
+list of fitted trees (and the per-tree arrays sklearn keeps next to it). The
+isolation forest's score threshold is recomputed on the refreshed normal
+reference. Every tree carries a provenance entry (the feedback window it was
+trained on), kept in the model metadata as tree_windows.
+"""
+import copy
+import json
+import os
+
+import numpy as np
+from sklearn.ensemble import IsolationForest, RandomForestClassifier
+from sklearn.metrics import roc_auc_score
+
+from models.registry import current_version_label
+
+RETIRE_POLICIES = ('oldest', 'weakest')
+
+# Fitted attributes holding one entry per tree, in estimators_ order
+_PER_TREE_ATTRIBUTES = ('estimators_', 'estimators_features_', '_average_path_length_per_tree',
+                        '_decision_path_lengths', '_seeds')
+
+
+def _refit_params(model):
+    """Constructor params of a fitted forest for training extra trees"""
+    params = model.get_params()
+    for key in ('n_estimators', 'warm_start', 'n_jobs', 'random_state', 'verbose'):
+        params.pop(key, None)
+    return params
+
+
+def _combine(model, fresh, keep):
+    """Copy of `model` whose per-tree attributes are the `keep` entries of model's then fresh's trees"""
+    updated = copy.deepcopy(model)
+    for attribute in _PER_TREE_ATTRIBUTES:
+        if hasattr(model, attribute) and hasattr(fresh, attribute):
+            combined = list(getattr(model, attribute)) + list(getattr(fresh, attribute))
+            values = [combined[i] for i in keep]
+            if isinstance(getattr(model, attribute), np.ndarray):
+                values = np.asarray(values)
+            elif isinstance(getattr(model, attribute), tuple):
+                values = tuple(values)
+            setattr(updated, attribute, values)
+    updated.n_estimators = len(keep)
+    return updated
+
+
+def _tree_auc(tree, X, y):
+    scores = tree.predict_proba(X)[:, 1]
+    return roc_auc_score(y, scores)
+
+
+def _retire(n_old, n_new, retire, tree_scores=None):
+    """Indices (into old + new trees) to keep so that the forest keeps n_old trees"""
+    n_retire = min(n_new, n_old)
+    if retire == 'weakest' and tree_scores is not None:
+        retired = set(np.argsort(tree_scores, kind='stable')[:n_retire].tolist())
+    else:
+        retired = set(range(n_retire))
+    return [i for i in range(n_old) if i not in retired] + list(range(n_old, n_old + n_new))
+
+
+def update_random_forest(model, X_window, y_window, new_trees, tree_windows, window,
+                         retire='oldest', X_validation=None, y_validation=None, random_state=None):
+    """
+    Add trees trained on a feedback window to a fitted RandomForestClassifier
+
+    Args:
+        model: Fitted RandomForestClassifier (left unchanged)
+        X_window, y_window: Training data for the new trees
+        new_trees: Trees to add (and retire); at most the forest size
+        tree_windows: Provenance entry per existing tree
+        window: Provenance entry for the new trees
+        retire: One of RETIRE_POLICIES
+        X_validation, y_validation: Held-out data ranking the trees for 'weakest'
+
+    Returns:
+        (updated forest, tree_windows of the updated forest, retirement info)
+    """
+    if not isinstance(model, RandomForestClassifier):
+        raise TypeError(f'Incremental updates need a RandomForestClassifier, got {model.__class__.__name__}')
+    if retire not in RETIRE_POLICIES:
+        raise ValueError(f'Unknown retire policy: {retire} (expected one of {RETIRE_POLICIES})')
+
+    n_old = len(model.estimators_)
+    new_trees = max(1, min(int(new_trees), n_old))
+    fresh = RandomForestClassifier(n_estimators=new_trees, random_state=random_state, **_refit_params(model))
+    fresh.fit(X_window, y_window)
+    if not np.array_equal(fresh.classes_, model.classes_):
+        raise ValueError(f'Window labels {fresh.classes_.tolist()} do not cover the model classes '
+                         f'{model.classes_.tolist()}')
+
+    tree_scores = None
+    if retire == 'weakest' and X_validation is not None and len(np.unique(y_validation)) > 1:
+        X_validation = np.asarray(X_validation, dtype=np.float32)
+        tree_scores = [_tree_auc(tree, X_validation, y_validation) for tree in model.estimators_]
+
+    keep = _retire(n_old, new_trees, retire, tree_scores)
+    windows = list(tree_windows) + [window] * new_trees
+    info = {
+        'added': new_trees,
+        'retired': n_old + new_trees - len(keep),
+        'policy': 'weakest' if tree_scores is not None else 'oldest'
+    }
+    return _combine(model, fresh, keep), [windows[i] for i in keep], info
+
+
+def update_isolation_forest(model, X_normal, new_trees, tree_windows, window, random_state=None):
+    """
+    Add trees fitted on recent normal transactions to a fitted IsolationForest
+
+    The new trees subsample as many rows as the existing ones (resampling the
+    window if it is smaller), so path lengths stay comparable. The oldest
+    trees are retired. With a numeric contamination the score threshold is
+    recomputed on X_normal.
+
+    Returns:
+        (updated forest, tree_windows of the updated forest, retirement info)
+    """
+    if not isinstance(model, IsolationForest):
+        raise TypeError(f'Incremental updates need an IsolationForest, got {model.__class__.__name__}')
+
+    X_normal = np.asarray(X_normal)
+    n_old = len(model.estimators_)
+    new_trees = max(1, min(int(new_trees), n_old))
+    max_samples = int(model.max_samples_)
+    rng = np.random.default_rng(random_state)
+    X_fit = X_normal if len(X_normal) >= max_samples else X_normal[rng.choice(len(X_normal), max_samples)]
+
+    fresh = IsolationForest(n_estimators=new_trees, random_state=random_state,
+                            **dict(_refit_params(model), max_samples=max_samples))
+    fresh.fit(X_fit)
+
+    keep = _retire(n_old, new_trees, 'oldest')
+    updated = _combine(model, fresh, keep)
+    if updated.contamination != 'auto':
+        updated.offset_ = np.percentile(updated.score_samples(X_normal), 100.0 * updated.contamination)
+
+    windows = list(tree_windows) + [window] * new_trees
+    info = {'added': new_trees, 'retired': n_old + new_trees - len(keep), 'policy': 'oldest'}
+    return updated, [windows[i] for i in keep], info
+
+
+def load_tree_windows(models_dir, n_supervised, n_anomaly):
+    """
+    Provenance of the current models' trees from their metadata
+
+    Trees without a recorded window (models trained from scratch) are
+    attributed to the version they were trained in.
+    """
+    version = current_version_label(models_dir)
+    windows = {}
+    if version:
+        try:
+            with open(os.path.join(models_dir, f'model_metadata_v{version}.json')) as f:
+                windows = json.load(f).get('tree_windows') or {}
+        except (OSError, ValueError):
+            windows = {}
+
+    base = {'window': 'full', 'version': version or 'current'}
+    supervised = windows.get('supervised')
+    anomaly = windows.get('anomaly')
+    return {
+        'supervised': supervised if supervised and len(supervised) == n_supervised else [base] * n_supervised,
+        'anomaly': anomaly if anomaly and len(anomaly) == n_anomaly else [base] * n_anomaly
+    }
@@ -1,3 +1,8 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
 import numpy as np
 # import tensorflow as tf # Removed TensorFlow import
 import torch # Added PyTorch import
@@ -5,43 +10,207 @@ from transformers import AutoModel, AutoTokenizer # Changed TFAutoModel to AutoM
 from models.numerical_model import NumericalModel
 from models.fusion_model import FusionModel
 
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'multimodal')
+
+# 'fp32' runs DistilBERT as downloaded; 'int8' applies dynamic quantization to its linear layers
+INFERENCE_MODES = ('fp32', 'int8')
+
+# Longest text (in tokens) fed to DistilBERT; shorter batches are padded only to their longest string
+MAX_TEXT_TOKENS = 128
+
+# Transaction fields encoded by DistilBERT, in the order detect_anomalies embeds them
+TEXT_FIELDS = ('description', 'user_agent', 'email')
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of text embeddings
+
+    Args:
+        capacity: Maximum number of embeddings kept (0 disables caching)
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = max(0, int(capacity))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, key, embedding):
+        if self.capacity == 0:
+            return
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def info(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'size': len(self._entries),
+                'capacity': self.capacity
+            }
+
+
+def configure_torch_threads(num_threads=None, interop_threads=None):
+    """
+    Pin torch's intra-op and inter-op thread pools to a per-worker budget
+
+    Both settings are process-wide. The inter-op pool can only be sized before
+    torch first uses it, so a late call keeps the existing inter-op size.
+    """
+    if num_threads:
+        torch.set_num_threads(int(num_threads))
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(int(interop_threads))
+        except RuntimeError:
+            pass
+    return {'intra_op': torch.get_num_threads(), 'inter_op': torch.get_num_interop_threads()}
+
+
+def quantize_text_model(model):
+    """Dynamically quantize a transformer's nn.Linear layers to int8 (CPU only)"""
+    from torch.ao.quantization import quantize_dynamic
+    return quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
 class MultimodalAnomalyDetector:
-    def __init__(self, model_path='e:/fraudshield/models/multimodal'):
+    def __init__(self, model_path=None, embedding_cache_size=4096, inference_mode=None, num_threads=None,
+                 interop_threads=None):
+        model_path = model_path or os.environ.get('FRAUDSHIELD_MULTIMODAL_PATH', DEFAULT_MODEL_PATH)
+        inference_mode = inference_mode or os.environ.get('FRAUDSHIELD_TEXT_INFERENCE', 'fp32')
+        self.threads = configure_torch_threads(
+            num_threads or os.environ.get('FRAUDSHIELD_TORCH_THREADS'),
+            interop_threads or os.environ.get('FRAUDSHIELD_TORCH_INTEROP_THREADS'))
+
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.text_model = AutoModel.from_pretrained('distilbert-base-uncased').to(self.device)
         self.text_tokenizer = AutoTokenizer.from_pretrained('distilbert-base-uncased')
+        self.text_model.eval()
+        self.inference_mode = 'fp32'
+        # The uncased tokenizer lower-cases anyway, so case-folding before hashing is lossless
+        self._lowercase = bool(getattr(self.text_tokenizer, 'do_lower_case', False))
+        self.embedding_cache = EmbeddingCache(embedding_cache_size)
 
         # Instantiate and load weights for numerical model
         self.numerical_model = NumericalModel()
-        self.numerical_model.load_state_dict(torch.load(f'{model_path}/numerical_model.pt', map_location=self.device))
+        self.numerical_model.load_state_dict(torch.load(os.path.join(model_path, 'numerical_model.pt'), map_location=self.device))
         self.numerical_model.to(self.device)
         self.numerical_model.eval()
 
         # Instantiate and load weights for fusion model
         self.fusion_model = FusionModel(input_dim=776)
-        self.fusion_model.load_state_dict(torch.load(f'{model_path}/fusion_model.pt', map_location=self.device))
+        self.fusion_model.load_state_dict(torch.load(os.path.join(model_path, 'fusion_model.pt'), map_location=self.device))
         self.fusion_model.to(self.device)
         self.fusion_model.eval()
-    def process_text(self, text_data):
-        """Process transaction descriptions and other text data"""
-        tokens = self.text_tokenizer(
-            text_data, 
-            padding='max_length', 
-            truncation=True, 
-            max_length=128,
-            return_tensors='pt' # Changed to 'pt' for PyTorch
-        ).to(self.device) # Move tensors to the appropriate device
-        
-        with torch.no_grad(): # Disable gradient calculation for inference
-            outputs = self.text_model(
-                input_ids=tokens['input_ids'], 
-                attention_mask=tokens['attention_mask']
-            )
-            # Use last hidden state's CLS token representation
-            text_features = outputs.last_hidden_state[:, 0, :] 
-        
-        return text_features
-    
+
+        self.set_inference_mode(inference_mode)
+
+    def set_inference_mode(self, mode):
+        """
+        Switch the text encoder to 'fp32' or 'int8'
+
+        Quantization replaces the fp32 weights to save memory, so an int8
+        detector cannot go back to fp32.
+        """
+        if mode not in INFERENCE_MODES:
+            raise ValueError(f'Unknown inference mode: {mode} (expected one of {INFERENCE_MODES})')
+        if mode == self.inference_mode:
+            return
+        if mode == 'fp32':
+            raise ValueError('Cannot restore fp32 weights after quantization; create a new detector')
+        if self.device.type != 'cpu':
+            raise ValueError('int8 dynamic quantization is only supported on CPU')
+
+        self.text_model = quantize_text_model(self.text_model)
+        self.inference_mode = mode
+        # Cached embeddings came from the previous weights
+        self.embedding_cache.clear()
+
+    def _normalize_text(self, text):
+        """Collapse whitespace (and case, for uncased tokenizers) so equivalent strings share a cache entry"""
+        text = ' '.join(str(text).split())
+        return text.lower() if self._lowercase else text
+
+    def process_text(self, text_data, timer=None):
+        """
+        Process transaction descriptions and other text data
+
+        Embeddings are served from the LRU cache where possible; the remaining
+        strings go through DistilBERT in one forward pass, padded only to the
+        longest string in that batch. A StageTimer, if given, records the
+        embedding_cache, tokenization and text_forward stages.
+        """
+        texts = [self._normalize_text(text) for text in text_data]
+        keys = [hashlib.sha1(text.encode('utf-8')).digest() for text in texts]
+
+        embeddings = [None] * len(texts)
+        missing = OrderedDict()  # key -> positions still needing an embedding
+        for i, key in enumerate(keys):
+            embedding = self.embedding_cache.get(key) if key not in missing else None
+            if embedding is None:
+                missing.setdefault(key, []).append(i)
+            else:
+                embeddings[i] = embedding
+        if timer is not None:
+            timer.stage('embedding_cache')
+
+        if missing:
+            tokens = self.text_tokenizer(
+                [texts[positions[0]] for positions in missing.values()],
+                padding=True,
+                truncation=True,
+                max_length=MAX_TEXT_TOKENS,
+                return_tensors='pt'
+            ).to(self.device)
+            if timer is not None:
+                timer.stage('tokenization')
+
+            with torch.no_grad(): # Disable gradient calculation for inference
+                outputs = self.text_model(
+                    input_ids=tokens['input_ids'],
+                    attention_mask=tokens['attention_mask']
+                )
+                # Use last hidden state's CLS token representation
+                cls_features = outputs.last_hidden_state[:, 0, :]
+
+            for (key, positions), embedding in zip(missing.items(), cls_features):
+                # clone() so the cached row does not keep the whole hidden-state tensor alive
+                embedding = embedding.clone()
+                self.embedding_cache.put(key, embedding)
+                for i in positions:
+                    embeddings[i] = embedding
+            if timer is not None:
+                timer.stage('text_forward')
+
+        return torch.stack(embeddings)
+
+    def cache_info(self):
+        """Embedding cache hit/miss counters"""
+        return self.embedding_cache.info()
+
     def process_numerical(self, numerical_data):
         """Process numerical transaction features"""
         # Convert numpy array to PyTorch tensor
@@ -50,12 +219,13 @@ class MultimodalAnomalyDetector:
             processed_features = self.numerical_model(numerical_tensor)
         return processed_features
     
-    def detect_anomalies(self, transaction):
+    def detect_anomalies(self, transaction, timer=None):
         """
         Detect anomalies using multimodal approach
         
         Args:
             transaction: Dictionary containing transaction data
+            timer: Optional StageTimer recording the text, numerical_model and fusion stages
             
         Returns:
             anomaly_score: Float indicating anomaly level
@@ -81,11 +251,14 @@ class MultimodalAnomalyDetector:
         ]], dtype=np.float32) # Specify dtype
         
         # Process each modality
-        text_features = self.process_text(text_data)
+        text_features = self.process_text(text_data, timer=timer)
         numerical_features = self.process_numerical(numerical_features_np)
+        if timer is not None:
+            timer.stage('numerical_model')
         
-        # Combine features using PyTorch
-        combined_features = torch.cat([text_features, numerical_features], dim=1)
+        # Combine features using PyTorch: the fusion model takes one 768-d text vector,
+        # so the description/user_agent/email embeddings are averaged
+        combined_features = torch.cat([text_features.mean(dim=0, keepdim=True), numerical_features], dim=1)
         
         # Get anomaly score using PyTorch model
         with torch.no_grad():
@@ -93,6 +266,8 @@ class MultimodalAnomalyDetector:
         
         # Extract scalar value from tensor
         anomaly_score = anomaly_score_tensor.item() if anomaly_score_tensor.numel() == 1 else anomaly_score_tensor[0][0].item()
+        if timer is not None:
+            timer.stage('fusion')
 
         # Calculate feature importance (simplified example using tensor means)
         # NOTE: Integrated Gradients would require a PyTorch implementation (e.g., using Captum library)
@@ -104,4 +279,86 @@ class MultimodalAnomalyDetector:
             'location': (numerical_features[0][3].item() + numerical_features[0][4].item()) / 2
         }
         
-        return anomaly_score, feature_importance
\ No newline at end of file
+        return anomaly_score, feature_importance
+
+
+def compare_inference_modes(detector, transactions, threshold=0.5):
+    """
+    Measure how far int8 text encoding moves the detector's outputs from fp32
+
+    Scores every transaction with the (fp32) detector, quantizes it in place
+    and scores them again.
+
+    Returns:
+        Dict with CLS-embedding cosine similarity, fusion score deviation and
+        the share of transactions whose score crosses `threshold` differently
+    """
+    if detector.inference_mode != 'fp32':
+        raise ValueError('compare_inference_modes needs an fp32 detector')
+
+    def run():
+        scores = []
+        embeddings = []
+        for transaction in transactions:
+            scores.append(detector.detect_anomalies(transaction)[0])
+            embeddings.append(detector.process_text([str(transaction.get(field, '')) for field in TEXT_FIELDS]))
+        return np.asarray(scores, dtype=np.float64), torch.cat(embeddings)
+
+    fp32_scores, fp32_embeddings = run()
+    detector.set_inference_mode('int8')
+    int8_scores, int8_embeddings = run()
+
+    similarity = torch.nn.functional.cosine_similarity(fp32_embeddings, int8_embeddings, dim=1).numpy()
+    deviation = np.abs(int8_scores - fp32_scores)
+    return {
+        'transactions': len(fp32_scores),
+        'embedding_cosine_mean': float(similarity.mean()),
+        'embedding_cosine_min': float(similarity.min()),
+        'score_abs_diff_mean': float(deviation.mean()),
+        'score_abs_diff_p95': float(np.percentile(deviation, 95)),
+        'score_abs_diff_max': float(deviation.max()),
+        'threshold': threshold,
+        'threshold_flip_rate': float(np.mean((fp32_scores > threshold) != (int8_scores > threshold)))
+    }
+
+
+def load_transactions(path, limit=None):
+    """Transactions from a .csv or .jsonl file (the first `limit` of them)"""
+    import csv
+    import json
+
+    with open(path, 'r', newline='') as f:
+        if path.endswith('.jsonl'):
+            transactions = [json.loads(line) for line in f if line.strip()]
+        else:
+            transactions = list(csv.DictReader(f))
+    return transactions[:limit] if limit else transactions
+
+
+def main():
+    """Report int8 drift on held-out transactions before enabling FRAUDSHIELD_TEXT_INFERENCE=int8"""
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Compare fp32 and int8 text encoding on held-out transactions')
+    parser.add_argument('holdout', help='CSV or JSONL transactions with description, user_agent and email fields '
+                                        '(no labels needed), not used to train the fusion model')
+    parser.add_argument('--limit', type=int, default=None, help='Only score the first N transactions')
+    parser.add_argument('--threshold', type=float, default=0.5, help='Score threshold for the flip rate')
+    parser.add_argument('--model-path', default=None, help='Directory with the numerical and fusion weights')
+    args = parser.parse_args()
+
+    holdout = load_transactions(args.holdout, args.limit)
+    if not holdout:
+        parser.error(f'No transactions in {args.holdout}')
+    if not any(transaction.get(field) for transaction in holdout for field in TEXT_FIELDS):
+        # Empty strings embed identically in both modes, which would report no drift at all
+        parser.error(f'{args.holdout} has no {", ".join(TEXT_FIELDS)} text to encode')
+
+    detector = MultimodalAnomalyDetector(model_path=args.model_path, inference_mode='fp32')
+    print(json.dumps(compare_inference_modes(detector, holdout, threshold=args.threshold), indent=2))
+
+
+if __name__ == '__main__':
+    # e.g. python -m models.multimodal_detector logs/holdout.jsonl --limit 500
+    main()
\ No newline at end of file
@@ -0,0 +1,361 @@
+"""
+Model registry: atomic, validated hot-swaps of the serving models.
+
+Everything /predict scores with (both models, the fused pipeline and the
+version label) lives in one immutable ModelSet. Request handlers read
+`registry.current` once and use that snapshot until they finish, so a swap
+can never mix a new supervised model with an old anomaly model, and
+in-flight requests complete on the version they started with.
+
+A new version is loaded off the request path (compiled arrays memory-mapped,
+so loading costs little more than mapping the file), scored on a warm-up
+batch that must produce finite, in-range scores, and only then published with
+a single reference assignment. Activating a version also installs its files
+as the current models with atomic renames, never overwriting a file that a
+running process may have mapped.
+
+Whether a version's models were trained on StandardScaler-scaled features is
+recorded in its metadata ('scaled'). The fused pipeline carries its scaler;
+when a version is served from its pickles instead, its feature_scaler file
+is loaded with them, so a version is scored the same way whichever artifact
+serves it.
+"""
+import datetime
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from models.compiled_trees import CompiledForest, compiled_path, load_model
+from models.scoring_pipeline import ScoringPipeline, pipeline_path
+
+WARMUP_ROWS = 64
+
+# Written when a version is installed as current, so every process that
+# reloads the current files reports the same version label
+CURRENT_VERSION_FILENAME = 'current_version.txt'
+
+
+class ModelSet:
+    """Immutable snapshot of the models served together"""
+
+    __slots__ = ('version', 'pipeline', 'source', 'loaded_at', 'load_seconds')
+
+    def __init__(self, version, pipeline, source, load_seconds=None):
+        self.version = version
+        self.pipeline = pipeline
+        self.source = source
+        self.loaded_at = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.load_seconds = load_seconds
+
+    @property
+    def supervised(self):
+        return self.pipeline.supervised
+
+    @property
+    def anomaly(self):
+        return self.pipeline.anomaly
+
+    @property
+    def compiled(self):
+        return isinstance(self.supervised, CompiledForest) and isinstance(self.anomaly, CompiledForest)
+
+    def describe(self):
+        return {
+            'version': self.version,
+            'source': self.source,
+            'loaded_at': self.loaded_at,
+            'load_ms': round(self.load_seconds * 1000.0, 2) if self.load_seconds is not None else None,
+            'pipeline': self.pipeline.describe()
+        }
+
+
+def model_paths(models_dir, version=None):
+    """(supervised .pkl, anomaly .pkl, fused pipeline .npz) for a version, or the current models"""
+    suffix = f'_v{version}' if version else ''
+    return (os.path.join(models_dir, f'supervised_model{suffix}.pkl'),
+            os.path.join(models_dir, f'anomaly_model{suffix}.pkl'),
+            pipeline_path(models_dir, version))
+
+
+def scaler_path(models_dir, version=None):
+    """Path of the current (or a versioned) fitted feature scaler"""
+    suffix = f'_v{version}' if version else ''
+    return os.path.join(models_dir, f'feature_scaler{suffix}.pkl')
+
+
+def version_metadata(models_dir, version):
+    """Training metadata of a version ({} if it has none)"""
+    try:
+        with open(os.path.join(models_dir, f'model_metadata_v{version}.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def version_scaled(models_dir, version=None):
+    """
+    Whether a version (or the current models) was trained on scaled features
+
+    Returns None when it was not recorded (models saved before the flag).
+    """
+    label = version or current_version_label(models_dir)
+    if not label:
+        return None
+    return version_metadata(models_dir, label).get('scaled')
+
+
+def load_feature_scaler(models_dir, version=None):
+    """
+    The fitted scaler a version's models expect, or None for unscaled models
+
+    Raises FileNotFoundError if the version is scaled but its scaler is missing.
+    """
+    if not version_scaled(models_dir, version):
+        return None
+    label = version or current_version_label(models_dir)
+    # Activation installs the current models' scaler as feature_scaler.pkl; a version keeps its own
+    candidates = [scaler_path(models_dir, version)] if version else \
+        [scaler_path(models_dir), scaler_path(models_dir, label)]
+    for path in candidates:
+        if os.path.exists(path):
+            import joblib
+            return joblib.load(path)
+    raise FileNotFoundError(f'Model version {label} was trained on scaled features but has no feature scaler')
+
+
+def current_version_label(models_dir):
+    """
+    Version installed as current, or None
+
+    The marker is ignored once the current pickles are newer than it (for
+    example after retraining wrote them directly).
+    """
+    marker = os.path.join(models_dir, CURRENT_VERSION_FILENAME)
+    supervised_path, anomaly_path, _ = model_paths(models_dir)
+    try:
+        marker_mtime = os.path.getmtime(marker)
+        if any(os.path.exists(path) and os.path.getmtime(path) > marker_mtime
+               for path in (supervised_path, anomaly_path)):
+            return None
+        with open(marker) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def load_model_set(models_dir, version=None, mmap=True):
+    """
+    Load a version (or the current models) into a ModelSet
+
+    A fused pipeline artifact wins if it is not older than the pickles; next
+    come the per-model compiled artifacts, then the pickles themselves, with
+    the version's feature scaler if its metadata says it was scaled.
+    """
+    started = time.perf_counter()
+    supervised_path, anomaly_path, fused_path = model_paths(models_dir, version)
+
+    if os.path.exists(fused_path) and all(
+            not os.path.exists(path) or os.path.getmtime(fused_path) >= os.path.getmtime(path)
+            for path in (supervised_path, anomaly_path)):
+        pipeline = ScoringPipeline.load(fused_path, mmap=mmap)
+        source = 'pipeline'
+        scaled = version_scaled(models_dir, version)
+        if scaled is not None and scaled != pipeline.has_scaler:
+            raise ValueError(f"Pipeline artifact {fused_path} is {'un' if scaled else ''}scaled, "
+                             f"but its models were trained {'with' if scaled else 'without'} scaling")
+    else:
+        supervised = load_model(supervised_path, mmap=mmap)
+        anomaly = load_model(anomaly_path, mmap=mmap)
+        pipeline = ScoringPipeline.from_models(supervised, anomaly, scaler=load_feature_scaler(models_dir, version),
+                                               version=version, compile_trees=False)
+        source = 'compiled' if isinstance(supervised, CompiledForest) and isinstance(anomaly, CompiledForest) \
+            else 'pickle'
+
+    label = version or current_version_label(models_dir) or pipeline.version or 'current'
+    return ModelSet(label, pipeline, source, load_seconds=time.perf_counter() - started)
+
+
+def warmup_features(n_features, rows=WARMUP_ROWS):
+    """Deterministic warm-up batch spanning the 0-1 range the features are normalized to"""
+    return np.random.default_rng(0).random((rows, n_features))
+
+
+def model_set_features(model_set):
+    """Number of input features the models in a set expect (0 if unknown)"""
+    pipeline = model_set.pipeline
+    return pipeline.n_features_in_ or int(getattr(pipeline.anomaly, 'n_features_in_', 0))
+
+
+def validate_model_set(model_set, features=None, expected_features=None):
+    """
+    Score a warm-up batch; raises ValueError if the models misbehave
+
+    Scoring also faults in the memory-mapped pages the hot path will touch.
+    With `expected_features`, models built for a different feature vector
+    are rejected too.
+    """
+    pipeline = model_set.pipeline
+    n_features = model_set_features(model_set)
+    if not n_features:
+        raise ValueError('Cannot determine the number of model features')
+    if expected_features and n_features != expected_features:
+        raise ValueError(f'Models expect {n_features} features, serving provides {expected_features}')
+    if features is None:
+        features = warmup_features(n_features)
+
+    supervised_scores, anomaly_scores = pipeline.model_scores(features)
+    rows = features.shape[0]
+    if supervised_scores.shape != (rows,) or anomaly_scores.shape != (rows,):
+        raise ValueError('Warm-up scores have the wrong shape')
+    for name, scores in (('supervised', supervised_scores), ('anomaly', anomaly_scores)):
+        if not np.all(np.isfinite(scores)) or scores.min() < 0.0 or scores.max() > 1.0:
+            raise ValueError(f'Warm-up {name} scores are not finite probabilities')
+
+
+def _atomic_copy(source, destination):
+    """Copy next to the destination, then rename over it in one step"""
+    tmp_path = f'{destination}.tmp-{os.getpid()}'
+    shutil.copy2(source, tmp_path)
+    os.replace(tmp_path, destination)
+
+
+def _remove_if_exists(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def write_current_version(models_dir, version):
+    """Record which version the current model files are (call after writing them)"""
+    marker = os.path.join(models_dir, CURRENT_VERSION_FILENAME)
+    tmp_path = f'{marker}.tmp-{os.getpid()}'
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, marker)
+
+
+def install_version_files(models_dir, version):
+    """
+    Make a version's files the current ones
+
+    The current pickles are backed up first. Every current file is replaced
+    by rename, so processes that memory-mapped the old file keep reading it
+    intact; stale compiled, pipeline or scaler artifacts are removed rather
+    than left to shadow the new ones.
+    """
+    supervised_version, anomaly_version, pipeline_version = model_paths(models_dir, version)
+    supervised_current, anomaly_current, pipeline_current = model_paths(models_dir)
+
+    backup_time = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    for current_path, name in ((supervised_current, 'supervised'), (anomaly_current, 'anomaly')):
+        if os.path.exists(current_path):
+            shutil.copy2(current_path, os.path.join(models_dir, f'{name}_model_backup_{backup_time}.pkl'))
+
+    for version_path, current_path in ((supervised_version, supervised_current),
+                                       (anomaly_version, anomaly_current)):
+        _atomic_copy(version_path, current_path)
+        if os.path.exists(compiled_path(version_path)):
+            _atomic_copy(compiled_path(version_path), compiled_path(current_path))
+        else:
+            _remove_if_exists(compiled_path(current_path))
+
+    for version_path, current_path in ((pipeline_version, pipeline_current),
+                                       (scaler_path(models_dir, version), scaler_path(models_dir))):
+        if os.path.exists(version_path):
+            _atomic_copy(version_path, current_path)
+        else:
+            _remove_if_exists(current_path)
+
+    write_current_version(models_dir, version)
+
+
+class ModelRegistry:
+    """
+    Holds the published ModelSet and performs validated swaps
+
+    Args:
+        models_dir: Directory with the current and versioned model files
+        mmap: Memory-map compiled arrays instead of copying them
+    """
+
+    def __init__(self, models_dir, mmap=True):
+        self.models_dir = models_dir
+        self.mmap = mmap
+        self._current = None
+        # One load/activation at a time; readers never take it
+        self._swap_lock = threading.Lock()
+        self.swaps = 0
+        self.loading = None
+        self.last_error = None
+
+    @property
+    def current(self):
+        """The published ModelSet (None until the first successful load)"""
+        return self._current
+
+    def publish(self, model_set):
+        """Make `model_set` the one new requests use, in one reference assignment"""
+        self._current = model_set
+        self.swaps += 1
+
+    def _load_validated(self, version):
+        model_set = load_model_set(self.models_dir, version, mmap=self.mmap)
+        # A swap must not change the feature vector the serving code builds
+        current = self._current
+        validate_model_set(model_set, expected_features=model_set_features(current) if current else None)
+        return model_set
+
+    def reload(self):
+        """Load, validate and publish the current model files; returns the ModelSet"""
+        with self._swap_lock:
+            self.loading = 'current'
+            try:
+                model_set = self._load_validated(None)
+                self.publish(model_set)
+                self.last_error = None
+                return model_set
+            except Exception as e:
+                self.last_error = f'{e.__class__.__name__}: {e}'
+                raise
+            finally:
+                self.loading = None
+
+    def activate(self, version):
+        """
+        Load and validate a version, install it as current, then publish it
+
+        Nothing is installed or published if loading or validation fails; the
+        previously published models keep serving.
+        """
+        with self._swap_lock:
+            self.loading = version
+            try:
+                supervised_path, anomaly_path, _ = model_paths(self.models_dir, version)
+                if not os.path.exists(supervised_path) or not os.path.exists(anomaly_path):
+                    raise FileNotFoundError(f'Model version {version} not found')
+
+                model_set = self._load_validated(version)
+                install_version_files(self.models_dir, version)
+                self.publish(model_set)
+                self.last_error = None
+                return model_set
+            except Exception as e:
+                self.last_error = f'{e.__class__.__name__}: {e}'
+                raise
+            finally:
+                self.loading = None
+
+    def status(self):
+        model_set = self._current
+        return {
+            'current': model_set.describe() if model_set else None,
+            'swaps': self.swaps,
+            'loading': self.loading,
+            'last_error': self.last_error,
+            'mmap': self.mmap
+        }
@@ -0,0 +1,189 @@
+"""
+Fused scoring pipeline: feature scaling, both model evaluations and anomaly
+score normalization behind a single call.
+
+The pipeline is built once at training time from the fitted scaler and models
+and saved as one versioned .npz artifact (compiled trees plus scaler
+parameters). At serving time it is loaded with one call and evaluated over
+preallocated per-thread buffers, so the hot path performs no DataFrame
+construction and no reshape copies.
+
+Final risk fusion stays in utils.scoring.calculate_risk_score because its
+rules also look at the raw transaction payload, not only at model outputs.
+"""
+import datetime
+import json
+import os
+import threading
+
+import numpy as np
+
+from models.compiled_trees import CompiledForest, compile_model, load_arrays, save_arrays
+
+PIPELINE_FORMAT_VERSION = 1
+PIPELINE_FILENAME = 'scoring_pipeline.npz'
+
+
+def pipeline_path(models_dir='models', version=None):
+    """Path of the current (or a versioned) pipeline artifact"""
+    if version:
+        return os.path.join(models_dir, f'scoring_pipeline_v{version}.npz')
+    return os.path.join(models_dir, PIPELINE_FILENAME)
+
+
+class ScoringPipeline:
+    """
+    Raw feature vector(s) -> (supervised fraud probability, normalized anomaly score)
+
+    Args:
+        supervised: Classifier exposing predict_proba (compiled or sklearn)
+        anomaly: Anomaly detector exposing decision_function (compiled or sklearn)
+        scaler_mean, scaler_scale: StandardScaler parameters, or None when the
+            models were trained on unscaled features
+        version: Model version the pipeline was built from
+    """
+
+    def __init__(self, supervised, anomaly, scaler_mean=None, scaler_scale=None,
+                 version=None, created=None, initial_capacity=64):
+        self.supervised = supervised
+        self.anomaly = anomaly
+        self.n_features_in_ = int(getattr(supervised, 'n_features_in_', 0)) or None
+        self.scaler_mean = None if scaler_mean is None else np.asarray(scaler_mean, dtype=np.float64)
+        self.scaler_scale = None if scaler_scale is None else np.asarray(scaler_scale, dtype=np.float64)
+        self.version = version
+        self.created = created or datetime.datetime.now().isoformat()
+        self.initial_capacity = initial_capacity
+        self._local = threading.local()
+
+    @classmethod
+    def from_models(cls, supervised, anomaly, scaler=None, version=None, compile_trees=True):
+        """Build a pipeline from fitted estimators and an optional fitted StandardScaler"""
+        if compile_trees:
+            supervised = compile_model(supervised)
+            anomaly = compile_model(anomaly)
+
+        scaler_mean = scaler_scale = None
+        if scaler is not None:
+            n_features = scaler.n_features_in_
+            scaler_mean = scaler.mean_ if scaler.mean_ is not None and scaler.with_mean else np.zeros(n_features)
+            scaler_scale = scaler.scale_ if scaler.scale_ is not None and scaler.with_std else np.ones(n_features)
+
+        return cls(supervised, anomaly, scaler_mean, scaler_scale, version=version)
+
+    @property
+    def has_scaler(self):
+        return self.scaler_mean is not None
+
+    def _buffers(self, n_rows, n_features):
+        """Per-thread float64 scratch and float32 model input, grown on demand"""
+        local = self._local
+        buffers = getattr(local, 'buffers', None)
+        if buffers is None or buffers[0].shape[0] < n_rows or buffers[0].shape[1] != n_features:
+            capacity = max(n_rows, self.initial_capacity,
+                           2 * buffers[0].shape[0] if buffers is not None else 0)
+            buffers = (np.empty((capacity, n_features), dtype=np.float64),
+                       np.empty((capacity, n_features), dtype=np.float32))
+            local.buffers = buffers
+        return buffers[0][:n_rows], buffers[1][:n_rows]
+
+    def model_scores(self, features, timer=None):
+        """
+        Evaluate both models on one feature vector or an N x F matrix
+
+        A StageTimer (utils.metrics), if given, records the scale,
+        predict_proba and decision_function stages.
+
+        Returns:
+            supervised_scores: Fraud probability per row, shape (N,)
+            anomaly_scores: Sigmoid-normalized anomaly score per row, shape (N,)
+        """
+        features = np.asarray(features, dtype=np.float64)
+        if features.ndim == 1:
+            features = features[np.newaxis, :]
+        n_rows, n_features = features.shape
+        if self.n_features_in_ is not None and n_features != self.n_features_in_:
+            raise ValueError(f'Expected {self.n_features_in_} features, got {n_features}')
+
+        scratch, model_input = self._buffers(n_rows, n_features)
+
+        # Scale in float64 like StandardScaler.transform, then hand the trees float32
+        if self.has_scaler:
+            np.subtract(features, self.scaler_mean, out=scratch)
+            np.divide(scratch, self.scaler_scale, out=scratch)
+            model_input[...] = scratch
+        else:
+            model_input[...] = features
+        if timer is not None:
+            timer.stage('scale')
+
+        supervised_scores = self.supervised.predict_proba(model_input)[:, 1]
+        if timer is not None:
+            timer.stage('predict_proba')
+
+        # Same sigmoid as the original /predict: 1 / (1 + exp(-x)), computed in place
+        anomaly_scores = np.asarray(self.anomaly.decision_function(model_input), dtype=np.float64)
+        np.negative(anomaly_scores, out=anomaly_scores)
+        np.exp(anomaly_scores, out=anomaly_scores)
+        anomaly_scores += 1.0
+        np.reciprocal(anomaly_scores, out=anomaly_scores)
+        if timer is not None:
+            timer.stage('decision_function')
+
+        return supervised_scores, anomaly_scores
+
+    def save(self, path):
+        """Write the whole pipeline (compiled models + scaler) to one .npz"""
+        if not isinstance(self.supervised, CompiledForest) or not isinstance(self.anomaly, CompiledForest):
+            raise TypeError('Only pipelines with compiled models can be saved')
+
+        arrays = {}
+        arrays.update(self.supervised.to_arrays('supervised/'))
+        arrays.update(self.anomaly.to_arrays('anomaly/'))
+        if self.has_scaler:
+            arrays['scaler/mean'] = self.scaler_mean
+            arrays['scaler/scale'] = self.scaler_scale
+        arrays['pipeline_meta'] = np.array(json.dumps({
+            'format_version': PIPELINE_FORMAT_VERSION,
+            'version': self.version,
+            'created': self.created,
+            'has_scaler': self.has_scaler,
+            'n_features': self.n_features_in_
+        }))
+
+        return save_arrays(path, arrays)
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        """Load a pipeline artifact written by save(); mmap=True maps the tree arrays"""
+        arrays = load_arrays(path, mmap=mmap)
+        meta = json.loads(str(arrays['pipeline_meta']))
+        if meta.get('format_version') != PIPELINE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported pipeline format: {meta.get('format_version')}")
+
+        supervised = CompiledForest.from_arrays(arrays, 'supervised/')
+        anomaly = CompiledForest.from_arrays(arrays, 'anomaly/')
+        scaler_mean = arrays['scaler/mean'] if meta['has_scaler'] else None
+        scaler_scale = arrays['scaler/scale'] if meta['has_scaler'] else None
+
+        return cls(supervised, anomaly, scaler_mean, scaler_scale,
+                   version=meta.get('version'), created=meta.get('created'))
+
+    def describe(self):
+        """Summary for status endpoints"""
+        return {
+            'version': self.version,
+            'created': self.created,
+            'scaled': self.has_scaler,
+            'supervised': getattr(self.supervised, 'source_class', self.supervised.__class__.__name__),
+            'anomaly': getattr(self.anomaly, 'source_class', self.anomaly.__class__.__name__),
+            'compiled': isinstance(self.supervised, CompiledForest) and isinstance(self.anomaly, CompiledForest)
+        }
+
+
+def save_pipeline(supervised, anomaly, scaler=None, version=None, models_dir='models', current=True):
+    """Build, compile and save the versioned and (unless current=False) the current pipeline artifacts"""
+    pipeline = ScoringPipeline.from_models(supervised, anomaly, scaler=scaler, version=version)
+    paths = [pipeline.save(pipeline_path(models_dir, version))] if version else []
+    if current or not version:
+        paths.append(pipeline.save(pipeline_path(models_dir)))
+    return paths
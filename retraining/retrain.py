@@ -4,6 +4,8 @@ import pandas as pd
 import numpy as np
 import joblib
 import datetime
+import json
+import time
 import logging
 from sklearn.ensemble import RandomForestClassifier, IsolationForest
 from sklearn.model_selection import train_test_split, GridSearchCV
@@ -13,7 +15,30 @@ from sklearn.calibration import calibration_curve
 
 # Add parent directory to path to import from utils
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils.feature_engineering import extract_features
+from utils.batch_features import extract_features_batch
+from models.compiled_trees import save_compiled
+from utils.feedback_store import FeedbackStore
+from utils.retrain_jobs import report_progress, report_version
+from utils.hyperparameter_search import cv_folds, load_previous_best_params, successive_halving
+from models.incremental_forest import (RETIRE_POLICIES, load_tree_windows, update_isolation_forest,
+                                       update_random_forest)
+from models.registry import ModelRegistry, load_feature_scaler, scaler_path, version_scaled
+from models.scoring_pipeline import ScoringPipeline, pipeline_path, save_pipeline
+
+# Cores for grid search and fitting; the background job runner sets a budget, a manual run uses them all
+N_JOBS = int(os.environ.get('FRAUDSHIELD_RETRAIN_N_JOBS', -1))
+
+# 'halving' searches within a fit/time budget; 'grid' is the exhaustive GridSearchCV
+SEARCH_MODE = os.environ.get('FRAUDSHIELD_RETRAIN_SEARCH', 'halving')
+SEARCH_MAX_FITS = int(os.environ.get('FRAUDSHIELD_RETRAIN_MAX_FITS', 60))
+SEARCH_MAX_SECONDS = float(os.environ.get('FRAUDSHIELD_RETRAIN_MAX_SECONDS', 0)) or None
+
+# 'incremental' (or --incremental) adds trees trained on the new feedback to the current forests
+RETRAIN_MODE = 'incremental' if '--incremental' in sys.argv else os.environ.get('FRAUDSHIELD_RETRAIN_MODE', 'full')
+INCREMENTAL_TREES = int(os.environ.get('FRAUDSHIELD_INCREMENTAL_TREES', 10))
+INCREMENTAL_RETIRE = os.environ.get('FRAUDSHIELD_INCREMENTAL_RETIRE', 'oldest')
+INCREMENTAL_REPLAY_ROWS = int(os.environ.get('FRAUDSHIELD_INCREMENTAL_REPLAY_ROWS', 2000))
+INCREMENTAL_MIN_LABELS = int(os.environ.get('FRAUDSHIELD_INCREMENTAL_MIN_LABELS', 20))
 
 # Configure logging
 logging.basicConfig(
@@ -36,6 +61,30 @@ def load_feedback_data(feedback_file='data/feedback.csv'):
     
     return pd.read_csv(feedback_file)
 
+# Analyst decisions that translate into a training label
+DECISION_LABELS = {'BLOCK': 1, 'FRAUD': 1, 'ALLOW': 0, 'LEGITIMATE': 0}
+
+def feedback_records_to_frame(records):
+    """
+    Turn analyst feedback records into training rows
+
+    A record is usable when it carries the transaction fields (user_id,
+    amount, timestamp) and either an explicit is_fraud label or a
+    corrected_decision that maps to one.
+    """
+    rows = []
+    for record in records:
+        label = record.get('is_fraud')
+        if label is None:
+            label = DECISION_LABELS.get(str(record.get('corrected_decision', '')).upper())
+        if label is None or any(record.get(field) is None for field in ('user_id', 'amount', 'timestamp')):
+            continue
+        row = dict(record)
+        row['is_fraud'] = int(label)
+        rows.append(row)
+    
+    return pd.DataFrame(rows)
+
 def load_existing_models():
     """
     Load the existing models for comparison
@@ -52,34 +101,32 @@ def load_existing_models():
     
     return supervised_model, anomaly_model
 
+def current_feature_scaler():
+    """
+    The fitted scaler the current models were trained behind, or None if they are unscaled
+    
+    Raises FileNotFoundError when the current models are scaled but their scaler is missing.
+    """
+    scaler = load_feature_scaler('models')
+    if scaler is None and version_scaled('models') is None and os.path.exists(pipeline_path('models')):
+        # Models saved before metadata recorded scaling: the current pipeline artifact tells
+        if ScoringPipeline.load(pipeline_path('models')).has_scaler:
+            if not os.path.exists(scaler_path('models')):
+                raise FileNotFoundError("The current models are scaled but models/feature_scaler.pkl is missing")
+            scaler = joblib.load(scaler_path('models'))
+    return scaler
+
 def prepare_training_data(feedback_data):
     """
     Prepare training data from feedback
     """
-    X = []
-    y = []
-    
-    for _, row in feedback_data.iterrows():
-        # Create a transaction object from the feedback data
-        transaction = {
-            'user_id': row['user_id'],
-            'amount': row['amount'],
-            'timestamp': row['timestamp'],
-            'device_id': row.get('device_id', 'unknown'),
-            'location': {
-                'latitude': row.get('latitude', 0),
-                'longitude': row.get('longitude', 0)
-            }
-        }
-        
-        # Extract features
-        features = extract_features(transaction)
-        X.append(features)
-        
-        # Get corrected label
-        y.append(row['is_fraud'])
+    # One pass over column lists instead of iterrows()
+    X = extract_features_batch(feedback_data, n_jobs=os.cpu_count() if N_JOBS < 0 else N_JOBS)
     
-    return np.array(X), np.array(y)
+    # Corrected labels
+    y = feedback_data['is_fraud'].to_numpy()
+    
+    return X, y
 
 def compare_model_performance(old_model, new_model, X_test, y_test):
     """
@@ -153,25 +200,45 @@ def tune_hyperparameters(X_train, y_train):
     else:
         X_tune, y_tune = X_train, y_train
     
-    # Create grid search
-    rf = RandomForestClassifier(random_state=42)
-    grid_search = GridSearchCV(
-        estimator=rf,
-        param_grid=param_grid,
-        cv=3,
-        scoring='roc_auc',
-        n_jobs=-1,
-        verbose=1
-    )
-    
-    # Perform grid search
-    grid_search.fit(X_tune, y_tune)
-    
-    # Get best parameters
-    best_params = grid_search.best_params_
-    logger.info(f"Best parameters: {best_params}")
-    
-    return best_params
+    # Same folds for every candidate (and the same split on the same data next run)
+    folds = cv_folds(X_tune, y_tune, n_splits=3)
+    grid_fits = len(folds) * int(np.prod([len(values) for values in param_grid.values()]))
+    
+    if SEARCH_MODE == 'grid':
+        started = time.perf_counter()
+        grid_search = GridSearchCV(
+            estimator=RandomForestClassifier(random_state=42),
+            param_grid=param_grid,
+            cv=folds,
+            scoring='roc_auc',
+            n_jobs=N_JOBS,
+            verbose=1
+        )
+        grid_search.fit(X_tune, y_tune)
+        best_params = grid_search.best_params_
+        search = {'mode': 'grid', 'fits': grid_fits, 'seconds': time.perf_counter() - started,
+                  'best_score': float(grid_search.best_score_)}
+        logger.info(f"Best parameters: {best_params}")
+        return best_params, search
+    
+    # Budgeted successive halving, seeded with the previous run's best parameters
+    previous_params = load_previous_best_params('models')
+    search = successive_halving(
+        RandomForestClassifier(random_state=42, n_jobs=N_JOBS), param_grid, X_tune, y_tune, folds,
+        scoring='roc_auc', max_fits=SEARCH_MAX_FITS, max_seconds=SEARCH_MAX_SECONDS,
+        warm_start_params=previous_params)
+    search['mode'] = 'halving'
+    best_params = search['best_params']
+    
+    logger.info(f"Best parameters: {best_params} (CV AUC {search['best_score']:.4f}, "
+                f"warm start: {search['warm_start_params']})")
+    logger.info(f"Search used {search['fits']} fits in {search['seconds']:.1f}s instead of {grid_fits} "
+                f"for the full grid{' (stopped at the time budget)' if search['stopped_early'] else ''}")
+    if search['estimated_grid_seconds']:
+        logger.info(f"Exhaustive grid search estimated at {search['estimated_grid_seconds']:.0f}s: "
+                    f"saved ~{search['estimated_grid_seconds'] - search['seconds']:.0f}s")
+    
+    return best_params, search
 
 def retrain_models(X, y, test_size=0.2, tune_params=True):
     """
@@ -181,15 +248,19 @@ def retrain_models(X, y, test_size=0.2, tune_params=True):
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=42)
     
     # Tune hyperparameters if requested
+    search = None
     if tune_params:
-        best_params = tune_hyperparameters(X_train, y_train)
+        best_params, search = tune_hyperparameters(X_train, y_train)
     else:
         best_params = {'n_estimators': 100, 'random_state': 42}
     
     # Train supervised model (Random Forest)
     logger.info("Training supervised model (Random Forest)...")
-    rf_model = RandomForestClassifier(**best_params)
+    report_progress(55, 'Training supervised model')
+    rf_model = RandomForestClassifier(n_jobs=N_JOBS, **best_params)
     rf_model.fit(X_train, y_train)
+    # Serving predicts one transaction at a time: no worker pool per call
+    rf_model.set_params(n_jobs=None)
     
     # Evaluate supervised model
     y_pred = rf_model.predict(X_test)
@@ -197,7 +268,8 @@ def retrain_models(X, y, test_size=0.2, tune_params=True):
     
     logger.info("\nRandom Forest Performance:")
     logger.info(classification_report(y_test, y_pred))
-    logger.info(f"AUC-ROC: {roc_auc_score(y_test, y_prob):.4f}")
+    auc_roc = roc_auc_score(y_test, y_prob)
+    logger.info(f"AUC-ROC: {auc_roc:.4f}")
     
     # Get feature importances
     feature_importances = pd.DataFrame({
@@ -210,32 +282,142 @@ def retrain_models(X, y, test_size=0.2, tune_params=True):
     
     # Train anomaly detection model (Isolation Forest)
     logger.info("\nTraining anomaly detection model (Isolation Forest)...")
+    report_progress(70, 'Training anomaly model')
     # Train only on legitimate transactions
     X_train_normal = X_train[y_train == 0]
     
     iso_model = IsolationForest(n_estimators=100, contamination=0.05, random_state=42)
     iso_model.fit(X_train_normal)
     
-    return rf_model, iso_model, X_test, y_test
+    training_info = {
+        'best_params': best_params,
+        'search': search,
+        'metrics': {'random_forest': {'auc_roc': float(auc_roc)}},
+        'training_samples': int(len(X_train)),
+        'test_samples': int(len(X_test)),
+        'fraud_ratio': float(np.mean(y))
+    }
+    return rf_model, iso_model, X_test, y_test, training_info
 
-def save_models(rf_model, iso_model):
+def incremental_update(old_supervised, old_anomaly, window_data, history_data, window, scaler=None):
     """
-    Save the retrained models
+    Update the current forests with trees trained on a feedback window
+
+    The new trees see the window plus a replay sample of older feedback
+    (never the window's own transactions, which would then land on both
+    sides of the split); a fifth of that is held out to rank trees and to
+    evaluate the update. When
+    the current models were trained behind `scaler`, the new trees are fitted
+    (and the update validated) on features scaled the same way, so the
+    combined forest works in one feature space.
+    """
+    if 'transaction_id' in history_data.columns and 'transaction_id' in window_data.columns:
+        window_ids = set(window_data['transaction_id'].astype(str))
+        history_data = history_data[~history_data['transaction_id'].astype(str).isin(window_ids)]
+    replay_data = history_data.sample(n=min(INCREMENTAL_REPLAY_ROWS, len(history_data)), random_state=42)
+    window['replay_rows'] = int(len(replay_data))
+    X, y = prepare_training_data(pd.concat([window_data, replay_data], ignore_index=True))
+    if scaler is not None:
+        X = scaler.transform(X)
+    
+    stratify = y if np.bincount(y.astype(int)).min() >= 2 else None
+    X_fit, X_val, y_fit, y_val = train_test_split(X, y, test_size=0.2, random_state=42, stratify=stratify)
+    
+    tree_windows = load_tree_windows('models', len(old_supervised.estimators_), len(old_anomaly.estimators_))
+    
+    logger.info(f"Adding {INCREMENTAL_TREES} trees trained on {len(window_data)} new labels "
+                f"and {len(replay_data)} replayed rows ({INCREMENTAL_RETIRE} trees retired)")
+    rf_model, supervised_windows, supervised_update = update_random_forest(
+        old_supervised, X_fit, y_fit, INCREMENTAL_TREES, tree_windows['supervised'], window,
+        retire=INCREMENTAL_RETIRE, X_validation=X_val, y_validation=y_val, random_state=42)
+    rf_model.set_params(n_jobs=None)
+    
+    # Same share of the isolation forest is refreshed from the window's legitimate transactions
+    anomaly_trees = max(1, round(INCREMENTAL_TREES * len(old_anomaly.estimators_) / len(old_supervised.estimators_)))
+    iso_model, anomaly_windows, anomaly_update = update_isolation_forest(
+        old_anomaly, X_fit[y_fit == 0], anomaly_trees, tree_windows['anomaly'], window, random_state=42)
+    
+    metrics = {}
+    if stratify is not None:
+        old_auc = roc_auc_score(y_val, old_supervised.predict_proba(X_val)[:, 1])
+        new_auc = roc_auc_score(y_val, rf_model.predict_proba(X_val)[:, 1])
+        logger.info(f"Validation AUC-ROC: {old_auc:.4f} before, {new_auc:.4f} after the update")
+        metrics = {'random_forest': {'auc_roc': float(new_auc), 'previous_auc_roc': float(old_auc)}}
+    
+    training_info = {
+        'mode': 'incremental',
+        'best_params': load_previous_best_params('models'),
+        'window': window,
+        'updates': {'supervised': supervised_update, 'anomaly': anomaly_update},
+        'tree_windows': {'supervised': supervised_windows, 'anomaly': anomaly_windows},
+        'metrics': metrics,
+        'training_samples': int(len(X_fit)),
+        'test_samples': int(len(X_val)),
+        'fraud_ratio': float(np.mean(y))
+    }
+    return rf_model, iso_model, X_val, y_val, training_info
+
+def save_models(rf_model, iso_model, training_info=None, scaler=None):
+    """
+    Save the retrained models as a new version (and their metadata, which seeds the next search)
+    
+    `scaler` is the fitted StandardScaler the models were trained behind, or
+    None when they were trained on unscaled features.
     """
     os.makedirs('models', exist_ok=True)
     version = datetime.datetime.now().strftime('%Y%m%d_%H%M')
-    
+    if os.path.exists(f'models/supervised_model_v{version}.pkl'):
+        # Never overwrite a saved (possibly the current) version
+        version = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+
     # Save versioned models
     joblib.dump(rf_model, f'models/supervised_model_v{version}.pkl')
     joblib.dump(iso_model, f'models/anomaly_model_v{version}.pkl')
-    
-    # Save as current models
-    joblib.dump(rf_model, 'models/supervised_model.pkl')
-    joblib.dump(iso_model, 'models/anomaly_model.pkl')
-    
+    if scaler is not None:
+        joblib.dump(scaler, scaler_path('models', version))
+    
+    if training_info is not None:
+        metadata = dict(training_info, version=version, timestamp=datetime.datetime.now().isoformat(),
+                        scaled=scaler is not None)
+        with open(f'models/model_metadata_v{version}.json', 'w') as f:
+            json.dump(metadata, f, indent=2, default=str)
+    
+    # Save compiled (array-backed) versions next to the pickles for fast serving
+    try:
+        for model, path in [(rf_model, f'models/supervised_model_v{version}.pkl'),
+                            (iso_model, f'models/anomaly_model_v{version}.pkl')]:
+            save_compiled(model, path)
+        logger.info("Compiled model artifacts saved")
+        
+        # Fused pipeline (scaled only if the models were trained behind a scaler)
+        save_pipeline(rf_model, iso_model, scaler=scaler, version=version, current=False)
+        logger.info("Scoring pipeline saved")
+    except Exception as e:
+        logger.warning(f"Could not compile models, serving will use the pickles: {e}")
+    
+    # Only versioned files are written: the current models change when the
+    # registry has validated this version and installs it (see activate_saved_version)
     logger.info(f"\nModels trained and saved successfully (version: {version})")
     return version
 
+def activate_saved_version(version):
+    """
+    Validate a saved version and install it as the current models
+    
+    A background job (--no-activate) leaves this to the serving process,
+    which validates, installs and swaps the version in one step.
+    """
+    if '--no-activate' in sys.argv:
+        logger.info(f"Version {version} will be activated by the server once validated")
+        return
+    try:
+        ModelRegistry('models', mmap=False).activate(version)
+    except Exception as e:
+        logger.error(f"Version {version} was rejected and not activated: {e}")
+        sys.exit(1)
+    logger.info(f"Version {version} validated and installed as the current models "
+                "(running servers load it on their next reload, e.g. SIGHUP to serve.py)")
+
 def main():
     logger.info("FraudShield AI - Model Retraining")
     logger.info("=================================")
@@ -244,9 +426,12 @@ def main():
     os.makedirs('logs', exist_ok=True)
     os.makedirs('data', exist_ok=True)
     os.makedirs('models', exist_ok=True)
+    if INCREMENTAL_RETIRE not in RETIRE_POLICIES:
+        raise ValueError(f"Unknown FRAUDSHIELD_INCREMENTAL_RETIRE: {INCREMENTAL_RETIRE}")
     
     # Load feedback data
     logger.info("Loading feedback data...")
+    report_progress(5, 'Loading feedback data')
     feedback_data = load_feedback_data()
     
     if feedback_data is None:
@@ -258,11 +443,63 @@ def main():
         feedback_data.to_csv('data/feedback.csv', index=False)
         logger.info(f"Sample feedback data saved to data/feedback.csv")
     
+    feedback_store = FeedbackStore()
+    
     # Load existing models for comparison
     old_supervised, old_anomaly = load_existing_models()
     
+    if RETRAIN_MODE == 'incremental':
+        # New trees must see the features the current trees were trained on
+        current_scaler, scaler_error = None, None
+        try:
+            current_scaler = current_feature_scaler()
+        except (OSError, ValueError) as e:
+            scaler_error = e
+        if not isinstance(old_supervised, RandomForestClassifier) or not isinstance(old_anomaly, IsolationForest):
+            logger.info("Incremental mode needs a current Random Forest and Isolation Forest; running a full retrain")
+        elif scaler_error is not None:
+            logger.info(f"Cannot scale features like the current models ({scaler_error}); running a full retrain")
+        else:
+            # Only the feedback appended since the last successful run is parsed
+            new_records, feedback_offset = feedback_store.read_new()
+            logger.info(f"Analyst feedback: {len(new_records)} labelled transactions since last run")
+            window_data = feedback_records_to_frame(new_records)
+            if len(window_data) < INCREMENTAL_MIN_LABELS:
+                logger.info(f"Only {len(window_data)} new labels (need {INCREMENTAL_MIN_LABELS}); models left unchanged")
+                report_progress(100, 'Not enough new feedback')
+                return
+            
+            window = {
+                'window': 'feedback',
+                'feedback_offsets': [feedback_store.read_checkpoint(), feedback_offset],
+                'labels': int(len(window_data)),
+                'trained_at': datetime.datetime.now().isoformat()
+            }
+            report_progress(25, 'Updating models incrementally')
+            rf_model, iso_model, X_val, y_val, training_info = incremental_update(
+                old_supervised, old_anomaly, window_data, feedback_data, window, scaler=current_scaler)
+            
+            report_progress(90, 'Saving models')
+            version = save_models(rf_model, iso_model, training_info, scaler=current_scaler)
+            feedback_store.commit(feedback_offset)
+            logger.info(f"Incremental update saved as version: {version}")
+            report_version(version)
+            activate_saved_version(version)
+            return
+    
+    # Add analyst feedback labels (latest label per transaction); one read, so
+    # the committed offset covers exactly the feedback used
+    analyst_records, feedback_offset = feedback_store.read_all()
+    logger.info(f"Analyst feedback: {len(analyst_records)} labelled transactions")
+    
+    analyst_data = feedback_records_to_frame(analyst_records)
+    if len(analyst_data):
+        feedback_data = pd.concat([feedback_data, analyst_data], ignore_index=True)
+        logger.info(f"Using {len(analyst_data)} analyst labels for training")
+    
     # Prepare training data
     logger.info("Preparing training data...")
+    report_progress(15, 'Preparing training data')
     X, y = prepare_training_data(feedback_data)
     
     # Check class balance
@@ -271,18 +508,25 @@ def main():
     
     # Retrain models
     logger.info("Retraining models...")
-    rf_model, iso_model, X_test, y_test = retrain_models(X, y)
+    report_progress(25, 'Retraining models')
+    rf_model, iso_model, X_test, y_test, training_info = retrain_models(X, y)
     
     # Compare with old model if available
     if old_supervised is not None:
+        report_progress(80, 'Comparing with the current models')
         compare_model_performance(old_supervised, rf_model, X_test, y_test)
     
     # Save models
-    version = save_models(rf_model, iso_model)
+    report_progress(90, 'Saving models')
+    version = save_models(rf_model, iso_model, training_info)
+    
+    # Mark the feedback consumed by this successful run
+    feedback_store.commit(feedback_offset)
     
     logger.info("\nRetraining complete!")
     logger.info(f"New models saved as version: {version}")
-    logger.info("The models have been set as the current active models.")
+    report_version(version)
+    activate_saved_version(version)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,283 @@
+"""
+Production launcher: load the models once, then fork worker processes.
+
+The parent imports the app, which loads and validates the serving models
+(compiled tree arrays memory-mapped) and, with --preload-multimodal, the
+DistilBERT detector. It then freezes the garbage collector and forks the
+workers. Model memory is shared: the mapped arrays through the page cache,
+everything else copy-on-write. gc.freeze() moves the objects loaded so far
+out of the collector's reach, so collections in a worker do not write to
+(and so privately copy) the pages holding them.
+
+All workers accept connections on one listening socket opened by the
+parent. Each worker gets a share of the cores for torch so that N workers
+do not each start a thread per core.
+
+The parent restarts workers that die and logs every worker's RSS and PSS
+(the worker's share of the memory it has in common with the others). Sending
+SIGHUP to the parent makes every worker reload the current models; the app
+does this itself after activating a version or retraining. SIGUSR2 to the
+parent (or to one worker) starts a sampling profile capture of every worker
+(or that one) for --profile-seconds, written to logs/profiles.
+
+Limitations:
+
+- Each worker serves with werkzeug's threaded development server. It has no
+  request timeouts, no limit on concurrent connections and no protection
+  from slow clients, so run it behind a reverse proxy (nginx or similar)
+  that buffers requests and enforces timeouts. Where that is not enough,
+  serve app:app with gunicorn --preload instead, which also loads the
+  models once before forking; the memory reports, SIGHUP reload and
+  SIGUSR2 profiling here are then not available.
+- Live feature state (behavior profiles, velocity counters, geo index,
+  device store), the micro-batcher and the request profiler are per worker
+  and nothing routes a user to one worker. With N workers each one sees
+  about 1/N of a user's transactions, so live velocity counts and
+  familiarities are per-worker estimates, not exact counts across the
+  service. Run a single worker where they must be exact.
+
+    python serve.py --workers 4 --port 5000
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from utils.process_memory import process_memory
+
+# Seconds a worker must stay up before a crash restarts it without delay
+RESTART_BACKOFF = 1.0
+
+
+def env_flag(name):
+    return os.environ.get(name, '').lower() in ('1', 'true', 'yes')
+
+
+def parse_args():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default=os.environ.get('FRAUDSHIELD_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('FRAUDSHIELD_PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('FRAUDSHIELD_WORKERS', cpus)),
+                        help='Worker processes (default: one per core)')
+    parser.add_argument('--torch-threads', type=int, default=int(os.environ.get('FRAUDSHIELD_TORCH_THREADS', 0)),
+                        help='Torch intra-op threads per worker (default: cores / workers)')
+    parser.add_argument('--backlog', type=int, default=2048, help='Listen backlog of the shared socket')
+    parser.add_argument('--preload-multimodal', action='store_true', default=env_flag('FRAUDSHIELD_PRELOAD_MULTIMODAL'),
+                        help='Load the multimodal detector in the parent so workers share it')
+    parser.add_argument('--profile-seconds', type=float,
+                        default=float(os.environ.get('FRAUDSHIELD_PROFILE_SIGNAL_SECONDS', 30)),
+                        help='Length of the profile capture SIGUSR2 starts')
+    parser.add_argument('--memory-report-interval', type=float,
+                        default=float(os.environ.get('FRAUDSHIELD_MEMORY_REPORT_INTERVAL', 60)),
+                        help='Seconds between per-worker memory reports (0 disables)')
+    args = parser.parse_args()
+    args.workers = max(1, args.workers)
+    args.torch_threads = args.torch_threads or max(1, cpus // args.workers)
+    return args
+
+
+def listen(host, port, backlog):
+    """Listening socket shared by every worker (the kernel spreads accepts over them)"""
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def start_profile(application, seconds):
+    """SIGUSR2 in a worker: sample its requests for `seconds` (see utils/profiler.py)"""
+    try:
+        capture = application.request_profiler.start(seconds=seconds, collector='sampling')
+        application.logger.info(f"Profiling capture {capture['id']} started for {seconds}s")
+    except application.ProfilerBusy as e:
+        application.logger.warning(str(e))
+
+
+def run_worker(application, sock, args):
+    """Serve requests in a forked worker until SIGTERM"""
+    from werkzeug.serving import make_server
+
+    for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP, signal.SIGUSR2):
+        signal.signal(signum, signal.SIG_DFL)
+
+    if 'torch' in sys.modules:
+        from models.multimodal_detector import configure_torch_threads
+        configure_torch_threads(args.torch_threads)
+
+    server = make_server(args.host, args.port, application.app, threaded=True, fd=sock.fileno())
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever to return, so it cannot run on this (the serving) thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    def reload(signum, frame):
+        threading.Thread(target=application.reload_models, name='model-reload', daemon=True).start()
+
+    def profile(signum, frame):
+        threading.Thread(target=start_profile, args=(application, args.profile_seconds), name='profile-start',
+                         daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent handles Ctrl-C
+    signal.signal(signal.SIGHUP, reload)
+    signal.signal(signal.SIGUSR2, profile)
+    server.serve_forever()
+
+
+class Launcher:
+    """Forks the workers, restarts them when they exit and reports their memory"""
+
+    def __init__(self, application, sock, args):
+        self.application = application
+        self.sock = sock
+        self.args = args
+        self.workers = {}  # pid -> (worker number, start time)
+        self.stopping = False
+        self.reload_requested = False
+        self.profile_requested = False
+        self.restarts = 0
+
+    def spawn(self, number):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.application, self.sock, self.args)
+            except Exception as e:
+                print(f'Worker {number} failed: {e}', file=sys.stderr)
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = (number, time.monotonic())
+        return pid
+
+    def signal_workers(self, signum):
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def reap(self):
+        """Collect exited workers and start replacements"""
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            number, started = self.workers.pop(pid, (None, None))
+            if number is None or self.stopping:
+                continue
+            self.application.logger.warning(f'Worker {number} (pid {pid}) exited with status {status}; restarting')
+            if time.monotonic() - started < RESTART_BACKOFF:
+                time.sleep(RESTART_BACKOFF)
+            self.restarts += 1
+            self.spawn(number)
+
+    def memory_report(self):
+        """Per-worker RSS/PSS plus the total PSS of the parent and all workers"""
+        parent = process_memory()
+        workers = [dict(process_memory(pid), worker=number) for pid, (number, _) in sorted(self.workers.items())]
+        total_pss = sum(memory.get('pss_mb', 0.0) for memory in [parent] + workers)
+        return {'parent': parent, 'workers': workers, 'total_pss_mb': round(total_pss, 1), 'restarts': self.restarts}
+
+    def run(self):
+        def request_stop(signum, frame):
+            self.stopping = True
+
+        def request_reload(signum, frame):
+            self.reload_requested = True
+
+        def request_profile(signum, frame):
+            self.profile_requested = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGHUP, request_reload)
+        signal.signal(signal.SIGUSR2, request_profile)
+
+        for number in range(self.args.workers):
+            self.spawn(number)
+        self.application.logger.info(
+            f'Serving on {self.args.host}:{self.args.port} with {self.args.workers} workers '
+            f'({self.args.torch_threads} torch threads each)')
+
+        interval = self.args.memory_report_interval
+        next_report = time.monotonic() + interval
+        while not self.stopping:
+            time.sleep(0.5)
+            if self.reload_requested:
+                self.reload_requested = False
+                self.signal_workers(signal.SIGHUP)
+            if self.profile_requested:
+                self.profile_requested = False
+                self.signal_workers(signal.SIGUSR2)
+            self.reap()
+            if interval > 0 and time.monotonic() >= next_report:
+                self.application.logger.info(f'Worker memory: {self.memory_report()}')
+                next_report = time.monotonic() + interval
+
+        self.shutdown()
+
+    def shutdown(self, timeout=10.0):
+        self.signal_workers(signal.SIGTERM)
+        deadline = time.monotonic() + timeout
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        self.signal_workers(signal.SIGKILL)
+        for pid in list(self.workers):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.workers.clear()
+
+
+def main():
+    args = parse_args()
+
+    # Read by the multimodal detector whenever it is built, in the parent or a worker
+    os.environ['FRAUDSHIELD_TORCH_THREADS'] = str(args.torch_threads)
+    os.environ.setdefault('FRAUDSHIELD_TORCH_INTEROP_THREADS', '1')
+    os.environ['FRAUDSHIELD_LAUNCHER_PID'] = str(os.getpid())
+    # Workers share metrics through logs/metrics/<launcher pid>; drop those of earlier runs
+    from utils.metrics import remove_stale_share_dirs
+    remove_stale_share_dirs(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'metrics'),
+                            keep=os.getpid())
+
+    sock = listen(args.host, args.port, args.backlog)
+
+    import app as application
+    if application.model_registry.current is None:
+        sys.exit('No serving models could be loaded; not starting workers')
+    # Also wait for a background warm-up: it must not be mid-load when the workers fork
+    if args.preload_multimodal or env_flag('FRAUDSHIELD_MULTIMODAL_WARMUP'):
+        try:
+            application.multimodal_detector.get()
+        except application.ResourceUnavailable as e:
+            application.logger.warning(f'Multimodal detector not preloaded: {e}')
+
+    if args.workers > 1 and application.live_features.mode != 'off':
+        application.logger.warning(
+            f'Live features ({application.live_features.mode}) are computed per worker: with {args.workers} '
+            'workers each sees only the transactions it serves, so velocity counts are not exact')
+
+    gc.collect()
+    gc.freeze()
+
+    launcher = Launcher(application, sock, args)
+    launcher.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+feature_engineering = pytest.importorskip('utils.feature_engineering')
+
+from utils.batch_features import extract_features_batch
+
+SAMPLE_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data',
+                          'sample_transactions.csv')
+
+
+def row_features(frame):
+    """The per-row path retraining used before batching (iterrows + extract_features)"""
+    X = []
+    for _, row in frame.iterrows():
+        transaction = {
+            'user_id': row['user_id'],
+            'amount': row['amount'],
+            'timestamp': row['timestamp'],
+            'device_id': row.get('device_id', 'unknown'),
+            'location': {
+                'latitude': row.get('latitude', 0),
+                'longitude': row.get('longitude', 0)
+            }
+        }
+        X.append(feature_engineering.extract_features(transaction))
+    return np.array(X, dtype=np.float64)
+
+
+@pytest.fixture
+def sample_frame():
+    return pd.read_csv(SAMPLE_CSV).head(500)
+
+
+def test_batch_matches_row_path(sample_frame):
+    np.testing.assert_array_equal(extract_features_batch(sample_frame), row_features(sample_frame))
+
+
+def test_missing_optional_columns_take_row_path_defaults(sample_frame):
+    frame = sample_frame[['user_id', 'amount', 'timestamp']]
+    np.testing.assert_array_equal(extract_features_batch(frame), row_features(frame))
+
+
+def test_parallel_chunks_match_serial(sample_frame, monkeypatch):
+    monkeypatch.setattr('utils.batch_features.PARALLEL_MIN_ROWS', 100)
+    np.testing.assert_array_equal(extract_features_batch(sample_frame, n_jobs=2), extract_features_batch(sample_frame))
+
+
+def test_empty_frame():
+    frame = pd.DataFrame(columns=['user_id', 'amount', 'timestamp'])
+    assert extract_features_batch(frame).shape[0] == 0
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import IsolationForest, RandomForestClassifier
+
+from models.scoring_pipeline import ScoringPipeline
+
+feature_engineering = pytest.importorskip('utils.feature_engineering')
+scoring = pytest.importorskip('utils.scoring')
+
+from utils.batch_scoring import format_result, score_transactions
+
+TRANSACTIONS = [
+    {'user_id': f'user_{i}', 'amount': amount, 'timestamp': f'2025-04-{10 + i}T{hour:02d}:15:00',
+     'device_id': f'device_{i % 2}', 'location': {'latitude': 40.7, 'longitude': -74.0}}
+    for i, (amount, hour) in enumerate([(12.5, 9), (250.0, 2), (8000.0, 23), (45.0, 14), (999.99, 4), (3.2, 18)])
+]
+
+
+@pytest.fixture(scope='module')
+def models():
+    n_features = len(feature_engineering.extract_features(TRANSACTIONS[0]))
+    rng = np.random.default_rng(0)
+    X = rng.random((400, n_features))
+    y = (X[:, 0] + X[:, 1] > 1.0).astype(int)
+    return (RandomForestClassifier(n_estimators=20, max_depth=6, random_state=0).fit(X, y),
+            IsolationForest(n_estimators=20, random_state=0).fit(X))
+
+
+def predict_one(transaction, supervised, anomaly):
+    """What /predict computes for a single transaction"""
+    features = np.asarray(feature_engineering.extract_features(transaction), dtype=np.float64).reshape(1, -1)
+    supervised_score = supervised.predict_proba(features)[0][1]
+    anomaly_score = 1 / (1 + np.exp(-anomaly.decision_function(features)[0]))
+    risk_score = scoring.calculate_risk_score(supervised_score, anomaly_score, transaction_data=transaction)
+    decision, message = scoring.get_decision(risk_score, user_id=transaction.get('user_id'),
+                                             amount=float(transaction.get('amount', 0)))
+    return risk_score, decision, message
+
+
+def score(transactions, models):
+    # The compiled pipeline must give what the sklearn models give one row at a time
+    return score_transactions(transactions, ScoringPipeline.from_models(*models))
+
+
+def test_batch_matches_single_predictions(models):
+    results = score(TRANSACTIONS, models)
+    assert [result['index'] for result in results] == list(range(len(TRANSACTIONS)))
+    for transaction, result in zip(TRANSACTIONS, results):
+        risk_score, decision, message = predict_one(transaction, *models)
+        assert result['risk_score'] == pytest.approx(risk_score, abs=1e-12)
+        assert (result['decision'], result['message']) == (decision, message)
+        assert format_result(result, 'v1') == {'index': result['index'], 'risk_score': int(risk_score * 100),
+                                               'decision': decision, 'message': message, 'model_version': 'v1'}
+
+
+def test_invalid_items_fail_on_their_own(models):
+    results = score(['not a transaction', TRANSACTIONS[0], None, TRANSACTIONS[1]], models)
+    assert [('error' in result) for result in results] == [True, False, True, False]
+    assert results[0]['error'] == 'Prediction error: Transaction must be a JSON object'
+    assert format_result(results[2], 'v1') == {'index': 2, 'error': results[2]['error']}
+    assert results[3]['risk_score'] == pytest.approx(predict_one(TRANSACTIONS[1], *models)[0], abs=1e-12)
+
+
+def test_empty_and_all_invalid_batches(models):
+    assert score([], models) == []
+    assert [result['index'] for result in score([1, 2], models)] == [0, 1]
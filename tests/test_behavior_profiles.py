@@ -0,0 +1,110 @@
+import datetime
+
+import pytest
+
+from utils.behavior_profiles import BehaviorProfileStore, haversine_km
+from utils.live_features import LiveFeatureEngine
+
+START = datetime.datetime(2025, 4, 17, 12, 0)
+
+
+def at(hours):
+    return START + datetime.timedelta(hours=hours)
+
+
+def test_users_without_history_have_no_features():
+    store = BehaviorProfileStore(capacity=10)
+    assert store.features('u1', 50.0, START) is None
+    store.update('u1', 50.0, START)
+    # One transaction: no amount spread yet, the rest is known
+    features = store.features('u1', 50.0, at(1))
+    assert 'amount_deviation' not in features
+    assert features['hour_familiarity'] == 0.0
+    assert 0 < features['time_since_last'] < 1
+    assert store.features('u2', 50.0, START) is None
+
+
+def test_amount_deviation_grows_with_the_z_score():
+    store = BehaviorProfileStore(capacity=10)
+    for i, amount in enumerate([40.0, 50.0, 60.0, 45.0, 55.0]):
+        store.update('u1', amount, at(i))
+    usual = store.features('u1', 50.0, at(5))['amount_deviation']
+    unusual = store.features('u1', 500.0, at(5))['amount_deviation']
+    assert usual < 0.1
+    assert unusual == 1.0
+
+
+def test_hour_and_device_familiarity_are_relative_to_the_most_used():
+    store = BehaviorProfileStore(capacity=10)
+    for day in range(4):
+        store.update('u1', 20.0, at(24 * day), device_id='phone')
+    store.update('u1', 20.0, at(24 * 4 + 6), device_id='laptop')
+
+    features = store.features('u1', 20.0, at(24 * 5 + 6), device_id='laptop')
+    assert features['hour_familiarity'] == 0.25
+    assert features['device_familiarity'] == 0.25
+    assert store.features('u1', 20.0, at(24 * 5), device_id='phone')['device_familiarity'] == 1.0
+    assert store.features('u1', 20.0, at(24 * 5), device_id='tablet')['device_familiarity'] == 0.0
+
+
+def test_location_centroid_is_correct_across_the_antimeridian():
+    store = BehaviorProfileStore(capacity=10)
+    store.update('u1', 20.0, START, location=(10.0, 179.5))
+    store.update('u1', 20.0, at(1), location=(10.0, -179.5))
+
+    features = store.features('u1', 20.0, at(2), location=(10.0, 180.0))
+    assert features['geo_diff'] < 0.001
+    assert features['location_familiarity'] > 0.99
+    assert haversine_km(10.0, 179.5, 10.0, -179.5) == pytest.approx(109.5, abs=0.5)
+
+
+def test_capacity_bounds_the_users_tracked():
+    store = BehaviorProfileStore(capacity=4)
+    for i in range(10):
+        store.update(f'u{i}', 20.0, at(i))
+        if i == 3:
+            full = store.memory_bytes()
+    assert len(store) == 4
+    assert store.evictions == 6
+    assert store.memory_bytes() == full
+    # The most recent user is always kept
+    assert store.features('u9', 20.0, at(10)) is not None
+
+
+def test_memory_budget_sizes_the_store():
+    store = BehaviorProfileStore.from_memory_budget(1024 * 1024)
+    assert store.capacity > 0
+    for i in range(store.capacity):
+        store.update(f'u{i}', 20.0, START)
+    assert store.memory_bytes() <= 1024 * 1024
+
+
+@pytest.mark.parametrize('mode, expected', [('fill', 0.9), ('override', 0.0)])
+def test_engine_fills_or_overrides_payload_features(mode, expected):
+    engine = LiveFeatureEngine(BehaviorProfileStore(capacity=10), mode=mode)
+    for i in range(3):
+        engine.observe({'user_id': 'u1', 'amount': 20.0, 'timestamp': at(i).isoformat()})
+
+    transaction = {'user_id': 'u1', 'amount': 20.0, 'timestamp': at(3).isoformat(), 'amount_deviation': 0.9}
+    enriched = engine.observe(transaction)
+    assert enriched['amount_deviation'] == expected
+    assert 'time_since_last' in enriched
+    assert transaction['amount_deviation'] == 0.9 and 'time_since_last' not in transaction
+    assert engine.stats()['observed'] == 4
+
+
+def test_engine_off_passes_transactions_through():
+    engine = LiveFeatureEngine(BehaviorProfileStore(capacity=10), mode='off')
+    transaction = {'user_id': 'u1', 'amount': 20.0}
+    assert engine.observe(transaction) is transaction
+    assert len(engine.profiles) == 0
+    with pytest.raises(ValueError, match='Unknown live feature mode'):
+        LiveFeatureEngine(mode='sometimes')
+
+
+def test_engine_off_holds_no_state():
+    engine = LiveFeatureEngine(mode='off')
+    assert engine.profiles is None
+    assert engine.observe({'user_id': 'u1', 'amount': 20.0}) == {'user_id': 'u1', 'amount': 20.0}
+    assert engine.stats() == {'mode': 'off', 'observed': 0, 'profiles': None, 'velocity': None,
+                              'geo': None, 'devices': None}
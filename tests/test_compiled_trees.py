@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import GradientBoostingClassifier, IsolationForest, RandomForestClassifier
+
+from models.compiled_trees import CompiledForest, compile_model, load_model, save_compiled
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.random((400, 6))
+    y = ((X[:, 0] + X[:, 1] * X[:, 2] + 0.2 * rng.standard_normal(400)) > 0.8).astype(int)
+    # Rows the trees were not fitted on, including values on and outside the training range
+    X_test = np.vstack([rng.random((200, 6)), rng.random((20, 6)) * 3 - 1, X[:20]])
+    return X, y, X_test
+
+
+def test_random_forest_matches_sklearn(data):
+    X, y, X_test = data
+    model = RandomForestClassifier(n_estimators=25, max_depth=8, random_state=0).fit(X, y)
+    np.testing.assert_allclose(compile_model(model).predict_proba(X_test), model.predict_proba(X_test),
+                               rtol=0, atol=1e-12)
+
+
+def test_gradient_boosting_matches_sklearn(data):
+    X, y, X_test = data
+    model = GradientBoostingClassifier(n_estimators=30, max_depth=3, random_state=0).fit(X, y)
+    compiled = compile_model(model)
+    np.testing.assert_allclose(compiled.predict_proba(X_test), model.predict_proba(X_test), rtol=0, atol=1e-12)
+    np.testing.assert_allclose(compiled.decision_function(X_test), model.decision_function(X_test),
+                               rtol=0, atol=1e-12)
+
+
+def test_isolation_forest_matches_sklearn(data):
+    X, _, X_test = data
+    model = IsolationForest(n_estimators=40, max_samples=128, contamination=0.05, random_state=0).fit(X)
+    compiled = compile_model(model)
+    np.testing.assert_allclose(compiled.score_samples(X_test), model.score_samples(X_test), rtol=0, atol=1e-12)
+    np.testing.assert_allclose(compiled.decision_function(X_test), model.decision_function(X_test),
+                               rtol=0, atol=1e-12)
+
+
+def test_single_row_and_feature_count(data):
+    X, y, X_test = data
+    compiled = compile_model(RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y))
+    np.testing.assert_array_equal(compiled.predict_proba(X_test[0]), compiled.predict_proba(X_test[:1]))
+    with pytest.raises(ValueError):
+        compiled.predict_proba(X_test[:, :5])
+
+
+@pytest.mark.parametrize('mmap', [False, True])
+def test_saved_artifact_scores_like_the_model(data, tmp_path, mmap):
+    import joblib
+
+    X, y, X_test = data
+    model = RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y)
+    pkl_path = str(tmp_path / 'supervised_model.pkl')
+    joblib.dump(model, pkl_path)
+    save_compiled(model, pkl_path)
+
+    loaded = load_model(pkl_path, mmap=mmap)
+    assert isinstance(loaded, CompiledForest)
+    np.testing.assert_allclose(loaded.predict_proba(X_test), model.predict_proba(X_test), rtol=0, atol=1e-12)
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from utils.device_familiarity import DeviceSketchStore, ExactDeviceStore, create_device_store
+
+NOW = 1745000000.0
+DAY = 86400.0
+
+
+@pytest.fixture(params=['exact', 'sketch'])
+def store(request):
+    return create_device_store(request.param, expected_pairs=10000)
+
+
+def test_familiarity_is_relative_to_the_most_used_device(store):
+    assert store.familiarity('u1', 'phone', NOW) is None
+    for _ in range(4):
+        store.record('u1', 'phone', NOW)
+    store.record('u1', 'laptop', NOW)
+
+    assert store.familiarity('u1', 'phone', NOW) == 1.0
+    assert store.familiarity('u1', 'laptop', NOW) == 0.25
+    assert store.familiarity('u1', 'tablet', NOW) == 0.0
+    assert store.familiarity('u2', 'phone', NOW) is None
+
+
+def test_counts_halve_every_half_life(store):
+    for _ in range(4):
+        store.record('u1', 'phone', NOW)
+    store.record('u1', 'laptop', NOW)
+    later = NOW + 31 * DAY
+    assert store.count('u1', 'phone', later) == 2
+    store.record('u1', 'laptop', later)
+    assert store.familiarity('u1', 'laptop', later) == 0.5
+
+
+def test_sketch_matches_exact_on_the_profile_scale():
+    rng = np.random.default_rng(0)
+    exact = ExactDeviceStore()
+    sketch = DeviceSketchStore(expected_pairs=5000, false_positive_rate=0.001)
+    for _ in range(5000):
+        user, device = f'u{rng.integers(500)}', f'd{rng.integers(4)}'
+        exact.record(user, device, NOW)
+        sketch.record(user, device, NOW)
+
+    differences = [abs(exact.familiarity(f'u{u}', f'd{d}', NOW) - sketch.familiarity(f'u{u}', f'd{d}', NOW))
+                   for u in range(500) for d in range(4) if exact.familiarity(f'u{u}', f'd{d}', NOW) is not None]
+    assert np.mean(differences) < 0.01
+
+
+def test_sketch_never_undercounts_and_tracks_its_false_positive_rate():
+    sketch = DeviceSketchStore(expected_pairs=2000, false_positive_rate=0.01)
+    for i in range(2000):
+        for _ in range(i % 3 + 1):
+            sketch.record(f'u{i // 4}', f'd{i}', NOW)
+    assert all(sketch.count(f'u{i // 4}', f'd{i}', NOW) >= i % 3 + 1 for i in range(2000))
+
+    unseen = np.mean([sketch.count('x', f'unseen{i}', NOW) > 0 for i in range(20000)])
+    estimate = sketch.false_positive_rate()
+    assert estimate == pytest.approx(float(np.prod(np.count_nonzero(sketch._counters, axis=1) / sketch.width)))
+    assert unseen == pytest.approx(estimate, abs=0.01)
+
+    # Decay recounts the occupied counters
+    sketch.record('u0', 'd0', NOW + 61 * DAY)
+    assert sketch.false_positive_rate() == pytest.approx(
+        float(np.prod(np.count_nonzero(sketch._counters, axis=1) / sketch.width)))
+
+
+def test_sketch_memory_cap_covers_both_sketches():
+    sketch = DeviceSketchStore(expected_pairs=10 ** 8, max_bytes=1024 * 1024)
+    assert sketch.stats()['memory_bytes'] <= 1024 * 1024
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from utils.feedback_store import FeedbackStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return FeedbackStore(str(tmp_path / 'feedback.jsonl'))
+
+
+def ids(records):
+    return [(record['transaction_id'], record['label']) for record in records]
+
+
+def test_read_new_only_returns_feedback_after_the_checkpoint(store):
+    assert store.read_new() == ([], 0)
+    store.append({'transaction_id': 't1', 'label': 0})
+    store.append({'transaction_id': 't2', 'label': 1})
+
+    records, offset = store.read_new()
+    assert ids(records) == [('t1', 0), ('t2', 1)]
+    # Not committed yet: the same feedback is offered again
+    assert store.read_new()[1] == offset
+
+    store.commit(offset)
+    assert store.read_new() == ([], offset)
+    store.append({'transaction_id': 't3', 'label': 1})
+    records, new_offset = store.read_new()
+    assert ids(records) == [('t3', 1)]
+    assert new_offset == os.path.getsize(store.path)
+
+
+def test_partial_line_is_left_for_the_next_read(store):
+    store.append({'transaction_id': 't1', 'label': 0})
+    complete = os.path.getsize(store.path)
+    with open(store.path, 'ab') as f:
+        f.write(b'{"transaction_id": "t2", "la')
+
+    records, offset = store.read_new()
+    assert ids(records) == [('t1', 0)]
+    assert offset == complete
+    store.commit(offset)
+
+    with open(store.path, 'ab') as f:
+        f.write(b'bel": 1}\n')
+    assert ids(store.read_new()[0]) == [('t2', 1)]
+
+
+def test_last_label_wins(store):
+    store.append({'transaction_id': 't1', 'label': 0})
+    store.append({'transaction_id': 't2', 'label': 0})
+    store.append({'transaction_id': 't1', 'label': 1})
+    records, _ = store.read_all()
+    assert ids(records) == [('t1', 1), ('t2', 0)]
+
+
+def test_replaced_log_starts_over(store):
+    for i in range(5):
+        store.append({'transaction_id': f't{i}', 'label': 0})
+    store.commit(store.read_new()[1])
+
+    os.remove(store.path)
+    store.append({'transaction_id': 'new', 'label': 1})
+    assert ids(store.read_new()[0]) == [('new', 1)]
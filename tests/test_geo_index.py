@@ -0,0 +1,100 @@
+import pytest
+
+from utils.geo_index import MAX_CELLS_PER_USER, POPULATION_BUDGET_SHARE, GeoIndex, cell_of
+
+NOW = 1745000000.0
+
+
+def test_familiarity_and_distance_come_from_the_users_cells():
+    index = GeoIndex(capacity=10)
+    for i in range(3):
+        index.update('user_1', (40.75, -73.95), NOW + i)
+    index.update('user_1', (34.05, -118.25), NOW + 3)
+
+    home = index.features('user_1', (40.76, -73.96), NOW + 4)
+    assert home['location_familiarity'] == pytest.approx(0.75, abs=1e-3)
+    assert home['nearest_known_km'] < 2 and home['geo_diff'] < 0.01
+
+    away = index.features('user_1', (51.5, -0.12), NOW + 4)
+    assert away['location_familiarity'] == 0.0
+    assert 5000 < away['nearest_known_km'] < 6000 and away['geo_diff'] == 1.0
+
+
+def test_users_without_history_get_population_features_only():
+    index = GeoIndex(capacity=10)
+    index.update('user_1', (40.75, -73.95), NOW)
+    features = index.features('user_2', (40.75, -73.95), NOW)
+    assert set(features) == {'population_cell_weight', 'new_location_for_population'}
+    assert features['population_cell_weight'] == pytest.approx(1.0)
+    assert index.features('user_2', (10.05, 10.05), NOW)['new_location_for_population']
+
+
+def test_visits_decay_with_the_half_life():
+    index = GeoIndex(capacity=10, half_life_days=1.0)
+    index.update('user_1', (40.75, -73.95), NOW)
+    weight = index.features('user_2', (40.75, -73.95), NOW + 86400)['population_cell_weight']
+    assert weight == pytest.approx(0.5, rel=1e-6)
+
+
+def test_neighbour_cells_wrap_at_the_antimeridian():
+    index = GeoIndex(capacity=10)
+    index.update('user_1', (10.05, 179.95), NOW)
+    features = index.features('user_1', (10.05, -179.95), NOW)
+    assert features['location_familiarity'] == 1.0
+    assert features['nearest_known_km'] < 15
+
+
+def test_cells_per_user_and_users_are_bounded():
+    index = GeoIndex(capacity=4)
+    for i in range(MAX_CELLS_PER_USER + 4):
+        index.update('user_1', (i * 1.05, 0.05), NOW + i)
+    assert (index._cells[index._index['user_1']] != -1).sum() == MAX_CELLS_PER_USER
+
+    for i in range(10):
+        index.update(f'other_{i}', (0.05, 0.05), NOW + 100 + i)
+    stats = index.stats()
+    assert stats['users'] == 4 and stats['evictions'] == 7
+
+
+def test_population_table_is_an_lru_of_cells():
+    index = GeoIndex(capacity=10, max_population_cells=3)
+    points = [(10.05, 10.05), (20.05, 20.05), (30.05, 30.05), (40.05, 40.05)]
+
+    for i, point in enumerate(points[:3]):
+        index.update(f'user_{i}', point, NOW + i)
+    # Revisiting the first cell makes the second the least recently visited
+    index.update('user_9', points[0], NOW + 3)
+    index.update('user_3', points[3], NOW + 4)
+
+    stats = index.stats()
+    assert stats['population_cells'] == 3
+    assert stats['population_evictions'] == 1
+    evicted = index.features('someone', points[1], NOW + 5)
+    assert evicted['population_cell_weight'] == 0.0
+    assert evicted['new_location_for_population']
+    for point in (points[0], points[2], points[3]):
+        assert index.features('someone', point, NOW + 5)['population_cell_weight'] > 0
+
+
+def test_revisits_accumulate_weight():
+    index = GeoIndex(capacity=10, max_population_cells=2)
+    for i in range(3):
+        index.update(f'user_{i}', (10.05, 10.05), NOW + i)
+    first = index.features('someone', (10.05, 10.05), NOW + 3)['population_cell_weight']
+    index.update('user_3', (10.05, 10.05), NOW + 3)
+    assert index.features('someone', (10.05, 10.05), NOW + 3)['population_cell_weight'] > first
+    assert index.stats()['population_evictions'] == 0
+
+
+def test_memory_budget_reserves_the_population_share():
+    budget = 8 * 1024 * 1024
+    index = GeoIndex.from_memory_budget(budget)
+    assert 0 < index.max_population_cells * 250 <= budget * POPULATION_BUDGET_SHARE
+    for i in range(2000):
+        index.update(f'user_{i}', (i * 0.1 % 80, i * 0.37 % 170), NOW + i)
+    assert index.memory_bytes() <= budget
+
+
+def test_cells_snap_to_the_grid():
+    assert cell_of(10.01, 10.09) == cell_of(10.09, 10.01)
+    assert cell_of(10.01, 10.01) != cell_of(10.11, 10.01)
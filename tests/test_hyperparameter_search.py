@@ -0,0 +1,80 @@
+import json
+
+import numpy as np
+import pytest
+from sklearn.tree import DecisionTreeClassifier
+
+from utils.hyperparameter_search import (MIN_RESOURCES, _stratified_order, cv_folds, load_previous_best_params,
+                                         successive_halving)
+
+PARAM_GRID = {
+    'max_depth': [1, 2, 3, 4, 6, 8],
+    'min_samples_split': [2, 5, 10],
+    'min_samples_leaf': [1, 2, 4, 8, 16, 32]
+}
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.random((4000, 6))
+    # Needs depth: a single split cannot separate the classes
+    y = ((X[:, 0] > 0.5) ^ (X[:, 1] > 0.5) ^ (X[:, 2] > 0.7)).astype(int)
+    return X, y
+
+
+def search(data, **kwargs):
+    X, y = data
+    return successive_halving(DecisionTreeClassifier(random_state=0), PARAM_GRID, X, y, cv_folds(X, y),
+                              **kwargs)
+
+
+def test_survivors_are_scored_on_growing_shares(data):
+    result = search(data, max_fits=60)
+    rounds = result['rounds']
+    assert [r['share'] for r in rounds][-1] == 1
+    assert all(a['share'] < b['share'] for a, b in zip(rounds, rounds[1:]))
+    assert all(b['candidates'] == int(np.ceil(a['candidates'] / 3)) for a, b in zip(rounds, rounds[1:]))
+    assert rounds[0]['candidates'] == result['candidates'] < result['grid_size']
+    assert result['best_params']['max_depth'] >= 3
+    assert result['best_score'] == rounds[-1]['best_score']
+
+
+def test_warm_start_params_enter_the_first_round(data):
+    warm = {'max_depth': 8, 'min_samples_split': 2, 'min_samples_leaf': 1, 'unknown': 1}
+    # A budget for a single candidate: it has to be the warm start
+    result = search(data, max_fits=3, warm_start_params=warm)
+    assert result['warm_start_params'] == {'max_depth': 8, 'min_samples_split': 2, 'min_samples_leaf': 1}
+    assert result['best_params'] == result['warm_start_params']
+
+
+def test_time_budget_stops_after_the_first_scored_candidate(data):
+    result = search(data, max_fits=60, max_seconds=1e-9)
+    assert result['stopped_early']
+    assert result['fits'] == 3
+    assert result['rounds'] == [{'candidates': 1, 'share': result['rounds'][0]['share'],
+                                 'best_score': result['best_score']}]
+
+
+def test_stratified_order_keeps_the_class_balance_in_every_prefix():
+    y = np.array([1] * 20 + [0] * 980)
+    order = _stratified_order(y, np.random.default_rng(0))
+    assert sorted(order.tolist()) == list(range(1000))
+    for size in (50, 100, MIN_RESOURCES):
+        assert abs(y[order[:size]].sum() - size * 0.02) <= 1
+
+
+def test_previous_best_params_come_from_the_newest_metadata(tmp_path):
+    assert load_previous_best_params(str(tmp_path / 'missing')) is None
+    for version, params in [('20250101_0000', {'max_depth': 2}), ('20250301_0000', {'max_depth': 4}),
+                            ('20250401_0000', None)]:
+        with open(tmp_path / f'model_metadata_v{version}.json', 'w') as f:
+            json.dump({'best_params': params}, f)
+    assert load_previous_best_params(str(tmp_path)) == {'max_depth': 4}
+
+
+@pytest.mark.parametrize('max_fits', [8, 17, 20, 41, 60, 100])
+def test_fits_stay_within_the_budget(data, max_fits):
+    result = search(data, max_fits=max_fits)
+    # Survivors are rounded up (ceil of a third), and the plan counts them that way
+    assert result['fits'] == 3 * sum(r['candidates'] for r in result['rounds']) <= max_fits
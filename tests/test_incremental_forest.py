@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import IsolationForest, RandomForestClassifier
+from sklearn.metrics import roc_auc_score
+
+from models.compiled_trees import compile_model
+from models.incremental_forest import update_isolation_forest, update_random_forest
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.random((600, 5))
+    y = (X[:, 0] + X[:, 1] > 1.0).astype(int)
+    return X, y
+
+
+@pytest.fixture(scope='module')
+def forest(data):
+    X, y = data
+    return RandomForestClassifier(n_estimators=10, max_depth=6, random_state=0).fit(X, y)
+
+
+def tree_outputs(trees, X):
+    return [tree.predict_proba(X.astype(np.float32))[:, 1] for tree in trees]
+
+
+def test_oldest_trees_are_retired(data, forest):
+    X, y = data
+    windows = [{'window': 'full'}] * 10
+    updated, updated_windows, info = update_random_forest(
+        forest, X[:200], y[:200], new_trees=3, tree_windows=windows, window={'window': 'w1'}, random_state=1)
+
+    assert info == {'added': 3, 'retired': 3, 'policy': 'oldest'}
+    assert len(updated.estimators_) == updated.n_estimators == 10
+    assert updated_windows == [{'window': 'full'}] * 7 + [{'window': 'w1'}] * 3
+    # The source forest is left unchanged
+    assert len(forest.estimators_) == 10
+
+    kept = tree_outputs(updated.estimators_[:7], X)
+    for before, after in zip(tree_outputs(forest.estimators_[3:], X), kept):
+        np.testing.assert_array_equal(before, after)
+    # The forest's score is the mean of the trees it now holds
+    np.testing.assert_allclose(updated.predict_proba(X)[:, 1], np.mean(tree_outputs(updated.estimators_, X), axis=0))
+
+
+def test_weakest_trees_are_retired(data, forest):
+    X, y = data
+    X_validation, y_validation = X[400:], y[400:]
+    aucs = [roc_auc_score(y_validation, scores) for scores in tree_outputs(forest.estimators_, X_validation)]
+    weakest = set(np.argsort(aucs, kind='stable')[:2].tolist())
+
+    updated, _, info = update_random_forest(
+        forest, X[:200], y[:200], new_trees=2, tree_windows=[None] * 10, window='w1', retire='weakest',
+        X_validation=X_validation, y_validation=y_validation, random_state=1)
+
+    assert info['policy'] == 'weakest'
+    survivors = [i for i in range(10) if i not in weakest]
+    for before, after in zip(tree_outputs([forest.estimators_[i] for i in survivors], X),
+                             tree_outputs(updated.estimators_[:8], X)):
+        np.testing.assert_array_equal(before, after)
+
+
+def test_window_without_both_classes_is_rejected(data, forest):
+    X, y = data
+    with pytest.raises(ValueError, match='do not cover the model classes'):
+        update_random_forest(forest, X[y == 1][:50], y[y == 1][:50], new_trees=2,
+                             tree_windows=[None] * 10, window='w1')
+
+
+def test_isolation_forest_trees_stay_aligned(data):
+    X, _ = data
+    model = IsolationForest(n_estimators=12, max_samples=64, contamination=0.05, random_state=0).fit(X)
+    updated, windows, info = update_isolation_forest(model, X[:100], new_trees=4, tree_windows=['full'] * 12,
+                                                     window='w1', random_state=1)
+
+    assert info == {'added': 4, 'retired': 4, 'policy': 'oldest'}
+    assert len(updated.estimators_) == len(updated.estimators_features_) == 12
+    assert windows == ['full'] * 8 + ['w1'] * 4
+    # Per-tree attributes (features, path length tables) must follow their trees: the compiled
+    # forest, built from estimators_ alone, scores the same as sklearn's combined forest
+    np.testing.assert_allclose(compile_model(updated).score_samples(X), updated.score_samples(X), rtol=0, atol=1e-12)
+    # The threshold is recomputed on the new normal reference
+    assert np.mean(updated.decision_function(X[:100]) < 0) == pytest.approx(0.05, abs=0.011)
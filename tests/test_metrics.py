@@ -0,0 +1,113 @@
+import json
+import os
+import subprocess
+import sys
+
+from utils.metrics import PENDING_LIMIT, MetricsRegistry, RequestMetrics, remove_stale_share_dirs
+
+
+def parse(text):
+    """{sample name with labels: value} of a Prometheus text exposition"""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_histograms_render_cumulative_buckets():
+    registry = MetricsRegistry()
+    latency = registry.histogram('latency_seconds', 'Latency', ('endpoint',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        latency.labels('/predict').observe(value)
+
+    text = registry.render()
+    assert '# HELP fraudshield_latency_seconds Latency\n# TYPE fraudshield_latency_seconds histogram\n' in text
+    samples = parse(text)
+    # A value equal to a bound counts in that bound's bucket
+    assert samples['fraudshield_latency_seconds_bucket{endpoint="/predict",le="0.1"}'] == 2
+    assert samples['fraudshield_latency_seconds_bucket{endpoint="/predict",le="1.0"}'] == 3
+    assert samples['fraudshield_latency_seconds_bucket{endpoint="/predict",le="+Inf"}'] == 4
+    assert samples['fraudshield_latency_seconds_count{endpoint="/predict"}'] == 4
+    assert samples['fraudshield_latency_seconds_sum{endpoint="/predict"}'] == 2.65
+
+
+def test_pending_values_are_bucketed_in_bulk():
+    registry = MetricsRegistry()
+    series = registry.histogram('seconds', 'Seconds', buckets=(1.0,)).labels()
+    for _ in range(PENDING_LIMIT + 10):
+        series.observe(0.5)
+    assert len(series.pending) == 10
+    assert series.snapshot() == {'counts': [PENDING_LIMIT + 10, 0], 'sum': 0.5 * (PENDING_LIMIT + 10)}
+
+
+def test_counter_labels_are_escaped():
+    registry = MetricsRegistry()
+    counter = registry.counter('errors_total', 'Errors', ('message',))
+    counter.labels('say "hi"\n').inc(2)
+    assert parse(registry.render())['fraudshield_errors_total{message="say \\"hi\\"\\n"}'] == 2
+
+
+def test_request_stages_add_up_to_the_request():
+    registry = MetricsRegistry()
+    metrics = RequestMetrics(registry)
+    timer = metrics.timer('/predict')
+    for stage in ('parse', 'score', 'respond'):
+        timer.stage(stage)
+    timer.finish(200)
+    metrics.timer('/predict').finish(500)
+
+    samples = parse(registry.render())
+    assert samples['fraudshield_requests_total{endpoint="/predict",status="200"}'] == 1
+    assert samples['fraudshield_requests_total{endpoint="/predict",status="500"}'] == 1
+    assert samples['fraudshield_request_seconds_count{endpoint="/predict"}'] == 2
+    stages = sum(samples[f'fraudshield_stage_seconds_sum{{endpoint="/predict",stage="{stage}"}}']
+                 for stage in ('parse', 'score', 'respond'))
+    assert 0 < stages <= samples['fraudshield_request_seconds_sum{endpoint="/predict"}']
+
+
+def test_render_sums_the_snapshots_of_other_workers(tmp_path):
+    share_dir = str(tmp_path / 'metrics')
+    worker = MetricsRegistry(share_dir=share_dir, share_interval=3600)
+    RequestMetrics(worker).record('/predict', 200, 0.01)
+
+    # Another worker's snapshot, as its share thread would have written it
+    other = MetricsRegistry()
+    other_metrics = RequestMetrics(other)
+    for _ in range(3):
+        other_metrics.record('/predict', 200, 0.02)
+    os.makedirs(share_dir, exist_ok=True)
+    with open(os.path.join(share_dir, f'{os.getpid() + 100000}.json'), 'w') as f:
+        json.dump(other.snapshot(), f)
+
+    samples = parse(worker.render())
+    assert samples['fraudshield_requests_total{endpoint="/predict",status="200"}'] == 4
+    assert samples['fraudshield_request_seconds_count{endpoint="/predict"}'] == 4
+
+
+def test_scrapes_report_their_own_fresh_snapshot(tmp_path):
+    share_dir = str(tmp_path / 'metrics')
+    worker = MetricsRegistry(share_dir=share_dir, share_interval=3600)
+    metrics = RequestMetrics(worker)
+    metrics.record('/predict', 200, 0.01)
+    worker._merged_snapshot()
+    metrics.record('/predict', 200, 0.01)
+
+    # What is reported is what the snapshot file says, so any worker would report the same
+    merged = worker._merged_snapshot()
+    with open(os.path.join(share_dir, f'{os.getpid()}.json')) as f:
+        snapshot = json.load(f)
+    key = json.dumps(['/predict', '200'])
+    assert snapshot['fraudshield_requests_total'] == merged['fraudshield_requests_total'] == {key: 2}
+
+
+def test_share_dirs_of_exited_launchers_are_removed(tmp_path):
+    exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+    exited.wait()
+    for name in (str(exited.pid), str(os.getpid()), 'not-a-pid'):
+        os.makedirs(tmp_path / name)
+    os.makedirs(tmp_path / str(os.getppid()))
+
+    assert remove_stale_share_dirs(str(tmp_path), keep=os.getppid()) == [str(exited.pid)]
+    assert sorted(os.listdir(tmp_path)) == sorted([str(os.getpid()), str(os.getppid()), 'not-a-pid'])
@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+from utils.micro_batching import MicroBatcher
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('Timed out')
+        time.sleep(0.001)
+
+
+class BlockingScorer:
+    """Scores items as item * 10; holds the first batch until released so later items queue up"""
+
+    def __init__(self):
+        self.called = threading.Event()
+        self.release = threading.Event()
+        self.batches = []
+
+    def __call__(self, items):
+        if not self.called.is_set():
+            self.called.set()
+            self.release.wait(5.0)
+        self.batches.append(list(items))
+        return [item * 10 for item in items]
+
+
+def submit_in_order(batcher, items):
+    """Submit from one thread per item, each once the previous one is queued; returns {item: result}"""
+    results = {}
+
+    def run(item):
+        results[item] = batcher.submit(item, timeout=5.0)
+
+    threads = []
+    for item in items:
+        depth = batcher.stats()['queue_depth']
+        thread = threading.Thread(target=run, args=(item,))
+        thread.start()
+        threads.append(thread)
+        wait_for(lambda: batcher.stats()['queue_depth'] > depth)
+    return results, threads
+
+
+def test_results_follow_their_items_in_submission_order():
+    scorer = BlockingScorer()
+    batcher = MicroBatcher(scorer, max_batch_size=64, max_wait_ms=0)
+
+    first = threading.Thread(target=batcher.submit, args=(0,), kwargs={'timeout': 5.0})
+    first.start()
+    assert scorer.called.wait(5.0)
+
+    results, threads = submit_in_order(batcher, list(range(1, 21)))
+    scorer.release.set()
+    for thread in threads + [first]:
+        thread.join(5.0)
+
+    assert results == {item: item * 10 for item in range(1, 21)}
+    assert scorer.batches[0] == [0]
+    # Everything queued behind the first batch went out together, in arrival order
+    assert scorer.batches[1] == list(range(1, 21))
+
+
+def test_batches_are_capped_at_max_batch_size():
+    scorer = BlockingScorer()
+    batcher = MicroBatcher(scorer, max_batch_size=4, max_wait_ms=0)
+
+    first = threading.Thread(target=batcher.submit, args=(0,), kwargs={'timeout': 5.0})
+    first.start()
+    assert scorer.called.wait(5.0)
+
+    results, threads = submit_in_order(batcher, list(range(1, 11)))
+    scorer.release.set()
+    for thread in threads + [first]:
+        thread.join(5.0)
+
+    assert results == {item: item * 10 for item in range(1, 11)}
+    assert scorer.batches[1:] == [[1, 2, 3, 4], [5, 6, 7, 8], [9, 10]]
+
+
+def test_a_failed_batch_raises_in_every_caller():
+    def fail(items):
+        raise RuntimeError('scorer down')
+
+    batcher = MicroBatcher(fail, max_wait_ms=0)
+    with pytest.raises(RuntimeError, match='scorer down'):
+        batcher.submit(1, timeout=5.0)
+    assert batcher.stats()['errors'] == 1
+
+
+def test_wrong_number_of_results_is_an_error():
+    batcher = MicroBatcher(lambda items: items[:-1], max_wait_ms=0)
+    with pytest.raises(RuntimeError, match='0 results for 1 items'):
+        batcher.submit(1, timeout=5.0)
@@ -0,0 +1,96 @@
+import glob
+import json
+import os
+import time
+
+import pytest
+
+from utils.prediction_log_writer import PredictionLogWriter
+from utils.prediction_store import PredictionStore
+
+
+def logged(writer):
+    lines = []
+    for path in sorted(glob.glob(os.path.join(writer.log_dir, 'predictions-*.jsonl'))):
+        with open(path) as f:
+            lines.extend(json.loads(line) for line in f)
+    return lines
+
+
+def submit_while_held(writer, count):
+    """Submit `count` records while the writer thread cannot drain the queue"""
+    with writer._cond:
+        return [writer.submit({'user_id': f'user_{i}', 'amount': float(i)}, 0.1, 'ALLOW', 'v1')
+                for i in range(count)]
+
+
+@pytest.fixture
+def make_writer(tmp_path):
+    writers = []
+
+    def make(**kwargs):
+        writer = PredictionLogWriter(str(tmp_path / 'predictions'), flush_interval=0.01, **kwargs)
+        writers.append(writer)
+        return writer
+
+    yield make
+    for writer in writers:
+        writer.close()
+
+
+def test_one_commit_writes_every_queued_record(tmp_path, make_writer):
+    store = PredictionStore(str(tmp_path / 'predictions.db'), legacy_csv=None)
+    writer = make_writer(store=store)
+    assert all(submit_while_held(writer, 20))
+    writer.close()
+
+    stats = writer.stats()
+    assert stats['commits'] == 1 and stats['last_commit_size'] == 20
+    assert stats['written'] == 20 and stats['lag'] == 0 and stats['dropped'] == 0
+    assert [line['transaction']['user_id'] for line in logged(writer)] == [f'user_{i}' for i in range(20)]
+    assert store.count() == 20
+
+
+def test_drop_newest_rejects_records_beyond_the_queue(make_writer):
+    writer = make_writer(max_queue=3, drop_policy='drop_newest')
+    assert submit_while_held(writer, 5) == [True, True, True, False, False]
+    writer.close()
+    assert writer.stats()['rejected'] == 2
+    assert [line['transaction']['amount'] for line in logged(writer)] == [0.0, 1.0, 2.0]
+
+
+def test_drop_oldest_evicts_queued_records(make_writer):
+    writer = make_writer(max_queue=3, drop_policy='drop_oldest')
+    assert all(submit_while_held(writer, 5))
+    writer.close()
+    stats = writer.stats()
+    assert stats['evicted'] == 2 and stats['dropped'] == 2 and stats['lag'] == 0
+    assert [line['transaction']['amount'] for line in logged(writer)] == [2.0, 3.0, 4.0]
+
+
+def test_block_waits_for_the_writer_to_make_room(make_writer):
+    writer = make_writer(max_queue=2, drop_policy='block', block_timeout=5.0)
+    # The third submit releases the lock while it waits, so the writer can drain the queue
+    assert submit_while_held(writer, 3) == [True, True, True]
+    writer.close()
+    assert writer.stats()['rejected'] == 0
+    assert len(logged(writer)) == 3
+
+
+def test_segments_roll_over_at_the_size_cap(make_writer):
+    writer = make_writer(segment_max_bytes=200)
+    for commits in range(1, 4):
+        submit_while_held(writer, 2)
+        deadline = time.monotonic() + 5
+        while writer.stats()['commits'] < commits and time.monotonic() < deadline:
+            time.sleep(0.005)
+    writer.close()
+    # Each commit is larger than the cap on its own: every one starts a new segment
+    assert writer.stats()['commits'] == 3
+    assert len(glob.glob(os.path.join(writer.log_dir, 'predictions-*.jsonl'))) == 3
+    assert len(logged(writer)) == 6
+
+
+def test_unknown_drop_policy_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match='Unknown drop policy'):
+        PredictionLogWriter(str(tmp_path), drop_policy='drop_everything')
@@ -0,0 +1,68 @@
+import csv
+
+import pytest
+
+from utils.prediction_store import PredictionStore, decode_cursor, encode_cursor
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = PredictionStore(str(tmp_path / 'predictions.db'), legacy_csv=None)
+    # Rows sharing a timestamp are ordered by id, so ties never repeat or skip on a page boundary
+    store.add_many([(f'2025-04-17T10:00:{i // 3:02d}', f'user_{i % 4}', 10.0 * i, i / 30, 'ALLOW' if i % 2 else 'BLOCK',
+                     'v1') for i in range(30)])
+    return store
+
+
+def page_through(store, limit, **filters):
+    rows, cursor, pages = [], None, 0
+    while True:
+        page, cursor = store.query(limit=limit, cursor=cursor, **filters)
+        rows.extend(page)
+        pages += 1
+        if cursor is None:
+            return rows, pages
+
+
+def test_cursor_pages_cover_every_row_once_newest_first(store):
+    rows, pages = page_through(store, limit=7)
+    assert pages == 5
+    assert [row['amount'] for row in rows] == [10.0 * i for i in reversed(range(30))]
+    assert store.count() == 30
+
+
+def test_rows_added_after_the_first_page_do_not_shift_later_pages(store):
+    first, cursor = store.query(limit=10)
+    store.add('2025-04-17T11:00:00', 'user_0', 999.0, 0.9, 'BLOCK', 'v1')
+    second, _ = store.query(limit=10, cursor=cursor)
+    assert [row['amount'] for row in first + second] == [10.0 * i for i in reversed(range(10, 30))]
+
+
+def test_filters_apply_before_paging(store):
+    rows, _ = page_through(store, limit=2, user_id='user_1', decision='allow')
+    assert {(row['user_id'], row['decision']) for row in rows} == {('user_1', 'ALLOW')}
+    assert len(rows) == 8
+
+    high, _ = page_through(store, limit=100, risk_level='high', min_amount=250)
+    assert [row['amount'] for row in high] == [290.0, 280.0, 270.0, 260.0, 250.0]
+    with pytest.raises(ValueError, match='Unknown risk level'):
+        store.query(risk_level='extreme')
+
+
+def test_cursor_round_trip_and_malformed_cursors():
+    assert decode_cursor(encode_cursor('2025-04-17T10:00:00', 42)) == ('2025-04-17T10:00:00', 42)
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        decode_cursor('not a cursor')
+
+
+def test_legacy_csv_is_imported_once(tmp_path):
+    legacy = tmp_path / 'predictions.csv'
+    with open(legacy, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['timestamp', 'user_id', 'amount', 'risk_score', 'decision', 'model_version'])
+        writer.writerow(['2025-04-17T09:00:00', 'user_1', '12.5', '0.2', 'ALLOW', 'v0'])
+        writer.writerow(['2025-04-17T09:00:01', 'user_2', 'bad', '0.2', 'ALLOW', 'v0'])
+
+    db_path = str(tmp_path / 'predictions.db')
+    assert PredictionStore(db_path, legacy_csv=str(legacy)).count() == 1
+    assert PredictionStore(db_path, legacy_csv=str(legacy)).count() == 1
@@ -0,0 +1,82 @@
+import os
+import time
+
+import pytest
+
+flask = pytest.importorskip('flask')
+
+from utils.profiler import ProfilerBusy, RequestProfiler
+
+
+def busy_view():
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        pass
+    return 'ok'
+
+
+@pytest.fixture
+def app():
+    app = flask.Flask(__name__)
+    app.add_url_rule('/work', 'work', busy_view)
+    app.add_url_rule('/admin/profile', 'profile', lambda: 'status')
+    return app
+
+
+def wait_until_finished(profiler, timeout=5):
+    deadline = time.monotonic() + timeout
+    while profiler.status()['active'] is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return profiler.status()['last']
+
+
+def test_request_capture_profiles_the_next_requests_then_unwraps(app, tmp_path):
+    profiler = RequestProfiler(app, str(tmp_path))
+    original = app.wsgi_app
+    capture = profiler.start(requests=2)
+    assert app.wsgi_app != original
+    with pytest.raises(ProfilerBusy):
+        profiler.start(requests=1)
+
+    client = app.test_client()
+    # The profiler's own endpoint is never profiled nor counted
+    assert client.get('/admin/profile').data == b'status'
+    assert profiler.status()['active']['profiled_requests'] == 0
+    client.get('/work')
+    client.get('/work')
+
+    last = profiler.status()
+    assert last['active'] is None
+    assert last['last']['id'] == capture['id'] and last['last']['profiled_requests'] == 2
+    assert app.wsgi_app == original
+    assert last['last']['path'].endswith('-cprofile.pstats') and os.path.exists(last['last']['path'])
+    with open(last['last']['path'][:-len('.pstats')] + '.txt') as f:
+        assert 'busy_view' in f.read()
+
+
+def test_sampling_capture_writes_collapsed_stacks(app, tmp_path):
+    profiler = RequestProfiler(app, str(tmp_path), sample_interval=0.001)
+    profiler.start(seconds=0.3, collector='sampling')
+    app.test_client().get('/work')
+
+    last = wait_until_finished(profiler)
+    assert last['samples'] > 0
+    with open(last['path']) as f:
+        stacks = [line.rsplit(' ', 1) for line in f.read().splitlines()]
+    assert any('busy_view (test_profiler.py' in stack for stack, _ in stacks)
+    assert sum(int(count) for _, count in stacks) == last['samples']
+
+
+def test_capture_without_requests_writes_nothing(app, tmp_path):
+    profiler = RequestProfiler(app, str(tmp_path))
+    profiler.start(seconds=0.05)
+    last = wait_until_finished(profiler)
+    assert last['path'] is None and last['error'] == 'No requests were profiled'
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize('options', [{}, {'requests': 1, 'seconds': 1}, {'requests': 0}, {'seconds': 301},
+                                     {'requests': 1, 'collector': 'perf'}])
+def test_bad_captures_are_rejected(app, tmp_path, options):
+    with pytest.raises(ValueError):
+        RequestProfiler(app, str(tmp_path)).start(**options)
@@ -0,0 +1,131 @@
+import json
+import os
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import IsolationForest, RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+from models.registry import (CURRENT_VERSION_FILENAME, ModelRegistry, ModelSet, load_model_set, model_paths,
+                             scaler_path, validate_model_set)
+from models.scoring_pipeline import save_pipeline
+
+
+def fit_models(n_features, seed):
+    rng = np.random.default_rng(seed)
+    X = rng.random((300, n_features))
+    y = (X[:, 0] > 0.5).astype(int)
+    return (RandomForestClassifier(n_estimators=5, max_depth=4, random_state=seed).fit(X, y),
+            IsolationForest(n_estimators=5, max_samples=64, random_state=seed).fit(X))
+
+
+def save_version(models_dir, version, n_features=5, seed=0, scaled=None, pipeline=False):
+    supervised, anomaly = fit_models(n_features, seed)
+    supervised_path, anomaly_path, _ = model_paths(models_dir, version)
+    joblib.dump(supervised, supervised_path)
+    joblib.dump(anomaly, anomaly_path)
+    if pipeline:
+        save_pipeline(supervised, anomaly, version=version, models_dir=models_dir, current=False)
+    if scaled is not None:
+        with open(os.path.join(models_dir, f'model_metadata_v{version}.json'), 'w') as f:
+            json.dump({'scaled': scaled}, f)
+    return supervised, anomaly
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture
+def models_dir(tmp_path):
+    path = str(tmp_path)
+    save_version(path, 'v1', seed=1)
+    save_version(path, 'v2', seed=2, pipeline=True)
+    return path
+
+
+def test_activate_installs_and_publishes(models_dir):
+    registry = ModelRegistry(models_dir, mmap=False)
+    model_set = registry.activate('v1')
+
+    assert registry.current is model_set
+    assert model_set.version == 'v1'
+    assert read(model_paths(models_dir)[0]) == read(model_paths(models_dir, 'v1')[0])
+    assert read(os.path.join(models_dir, CURRENT_VERSION_FILENAME)) == b'v1'
+    # The current files load as the installed version
+    assert load_model_set(models_dir, mmap=False).version == 'v1'
+
+
+def test_rollback_to_an_earlier_version(models_dir):
+    registry = ModelRegistry(models_dir, mmap=False)
+    registry.activate('v1')
+    v1_scores = registry.current.pipeline.model_scores(np.full((1, 5), 0.3))
+
+    registry.activate('v2')
+    assert registry.current.source == 'pipeline'
+    assert os.path.exists(model_paths(models_dir)[2])
+
+    registry.activate('v1')
+    assert registry.current.version == 'v1'
+    # v1 has no fused pipeline: v2's must not be left to shadow v1's pickles
+    assert not os.path.exists(model_paths(models_dir)[2])
+    assert load_model_set(models_dir, mmap=False).source == 'pickle'
+    for before, after in zip(v1_scores, registry.current.pipeline.model_scores(np.full((1, 5), 0.3))):
+        np.testing.assert_array_equal(before, after)
+    assert registry.swaps == 3
+
+
+def test_failed_activation_keeps_serving_the_current_version(models_dir):
+    save_version(models_dir, 'v3', n_features=4, seed=3)
+    registry = ModelRegistry(models_dir, mmap=False)
+    current = registry.activate('v1')
+    installed = read(model_paths(models_dir)[0])
+
+    with pytest.raises(ValueError, match='Models expect 4 features, serving provides 5'):
+        registry.activate('v3')
+    with pytest.raises(FileNotFoundError):
+        registry.activate('missing')
+
+    assert registry.current is current
+    assert read(model_paths(models_dir)[0]) == installed
+    assert read(os.path.join(models_dir, CURRENT_VERSION_FILENAME)) == b'v1'
+    assert 'FileNotFoundError' in registry.status()['last_error']
+
+
+def test_scaled_version_needs_its_scaler(models_dir):
+    save_version(models_dir, 'v4', seed=4, scaled=True)
+    registry = ModelRegistry(models_dir, mmap=False)
+    with pytest.raises(FileNotFoundError, match='has no feature scaler'):
+        registry.activate('v4')
+
+    scaler = StandardScaler().fit(np.random.default_rng(4).random((50, 5)))
+    joblib.dump(scaler, scaler_path(models_dir, 'v4'))
+    assert registry.activate('v4').pipeline.has_scaler
+    assert os.path.exists(scaler_path(models_dir))
+
+    # Rolling back to an unscaled version removes the current scaler with it
+    registry.activate('v1')
+    assert not registry.current.pipeline.has_scaler
+    assert not os.path.exists(scaler_path(models_dir))
+
+
+class FixedScores:
+    """A pipeline stand-in returning given scores for any batch"""
+
+    n_features_in_ = 5
+
+    def __init__(self, supervised, anomaly):
+        self.scores = (supervised, anomaly)
+
+    def model_scores(self, features):
+        rows = features.shape[0]
+        return tuple(np.full(rows, value) for value in self.scores)
+
+
+@pytest.mark.parametrize('supervised, anomaly', [(np.nan, 0.5), (0.5, 1.5), (-0.1, 0.5)])
+def test_validation_rejects_non_probability_scores(supervised, anomaly):
+    with pytest.raises(ValueError, match='not finite probabilities'):
+        validate_model_set(ModelSet('bad', FixedScores(supervised, anomaly), 'pickle'))
+    validate_model_set(ModelSet('good', FixedScores(0.2, 0.9), 'pickle'))
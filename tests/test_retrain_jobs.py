@@ -0,0 +1,108 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from utils.retrain_jobs import RetrainJobQueue
+
+SCRIPT = """
+import os
+from utils.retrain_jobs import report_progress, report_version
+print('starting')
+report_progress(40, 'Training')
+print('niceness', os.nice(0))
+print('threads', os.environ['OMP_NUM_THREADS'])
+report_version('v9')
+"""
+
+
+def wait_for(queue, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in ('succeeded', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f'job {job_id} did not finish')
+
+
+def make_queue(tmp_path, script, **kwargs):
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return RetrainJobQueue([sys.executable, '-c', script], str(tmp_path / 'jobs'), cwd=repo_dir, n_jobs=2,
+                           **kwargs)
+
+
+@pytest.fixture
+def finished(tmp_path):
+    activations = []
+    queue = make_queue(tmp_path, SCRIPT, on_success=lambda job: activations.append(job['version']) or 'ok')
+    job = wait_for(queue, queue.submit()['id'])
+    return queue, job, activations
+
+
+def test_job_reports_progress_version_and_log(finished):
+    queue, job, activations = finished
+    assert job['status'] == 'succeeded'
+    assert job['version'] == 'v9'
+    assert job['progress'] == 100
+    assert activations == ['v9'] and job['activation'] == 'ok'
+
+    lines, _ = queue.read_log(job['id'])
+    # Marker lines are parsed out of the log
+    assert lines[0] == 'starting' and not any(line.startswith('##') for line in lines)
+    assert lines[2] == 'threads 2'
+    assert [listed['id'] for listed in queue.list()] == [job['id']]
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='niceness is POSIX only')
+def test_job_runs_niced(finished):
+    queue, job, _ = finished
+    lines, _ = queue.read_log(job['id'])
+    assert lines[1] == f'niceness {min(os.nice(0) + 10, 19)}'
+
+
+def test_failed_job_records_the_exit_code(tmp_path):
+    queue = make_queue(tmp_path, 'import sys; print("boom"); sys.exit(3)')
+    job = wait_for(queue, queue.submit()['id'])
+    assert job['status'] == 'failed'
+    assert job['returncode'] == 3
+    assert queue.read_log(job['id'])[0] == ['boom']
+
+
+def test_event_stream_resumes_after_the_last_event_id(finished):
+    queue, job, _ = finished
+    events = list(queue.events(job['id'], poll_interval=0.01))
+    logs = [event for event in events if 'event: log' in event]
+    assert [event.split('data: ')[1].strip() for event in logs] == queue.read_log(job['id'])[0]
+    assert events[-1].startswith('event: done')
+
+    # A client reconnecting with the first event's id gets only what followed it
+    first_id = int(logs[0].split('\n')[0][len('id: '):])
+    resumed = [event for event in queue.events(job['id'], offset=first_id, poll_interval=0.01)
+               if 'event: log' in event]
+    assert resumed == logs[1:]
+
+
+def test_queued_jobs_of_an_exited_worker_are_failed(tmp_path):
+    queue = make_queue(tmp_path, 'pass')
+    os.makedirs(queue.jobs_dir)
+    exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+    exited.wait()
+    with open(os.path.join(queue.jobs_dir, 'orphan.json'), 'w') as f:
+        json.dump({'id': 'orphan', 'status': 'queued', 'progress': 0, 'stage': 'Queued', 'owner_pid': exited.pid}, f)
+
+    # Reported as failed on read, and recorded as failed when a runner starts
+    assert queue.get('orphan')['status'] == 'failed'
+    assert queue.fail_orphaned() == ['orphan']
+    with open(os.path.join(queue.jobs_dir, 'orphan.json')) as f:
+        assert json.load(f)['status'] == 'failed'
+    assert queue.fail_orphaned() == []
+
+
+def test_unknown_job_streams_an_error(tmp_path):
+    queue = make_queue(tmp_path, 'pass')
+    assert queue.get('../etc') is None
+    assert list(queue.events('missing'))[0].startswith('event: error')
@@ -0,0 +1,88 @@
+import csv
+import os
+
+import pytest
+
+flask = pytest.importorskip('flask')
+
+from utils.sample_data_cache import SampleTransactionCache
+
+SAMPLE_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data',
+                          'sample_transactions.csv')
+
+
+@pytest.fixture(scope='module')
+def app():
+    return flask.Flask(__name__)
+
+
+def row_body(app, csv_path):
+    """The body /api/sample-transactions built before the cache: csv rows, float()/int(), jsonify"""
+    transactions = []
+    with open(csv_path, 'r') as f:
+        for row in csv.DictReader(f):
+            risk_score = min(float(row.get('amount_deviation', 0)) * 0.7 + float(row.get('geo_diff', 0)) * 0.3, 1.0)
+            decision = 'ALLOW'
+            if risk_score > 0.7:
+                decision = 'BLOCK'
+            elif risk_score > 0.4:
+                decision = 'CHALLENGE'
+            transactions.append({
+                'timestamp': row.get('timestamp', ''),
+                'user_id': row.get('user_id', ''),
+                'amount': float(row.get('amount', 0)),
+                'device_id': row.get('device_id', ''),
+                'latitude': float(row.get('latitude', 0)),
+                'longitude': float(row.get('longitude', 0)),
+                'hour': int(row.get('hour', 0)),
+                'velocity': int(row.get('velocity', 0)),
+                'geo_diff': float(row.get('geo_diff', 0)),
+                'amount_deviation': float(row.get('amount_deviation', 0)),
+                'is_weekend': int(row.get('is_weekend', 0)),
+                'device_familiarity': float(row.get('device_familiarity', 0)),
+                'location_familiarity': float(row.get('location_familiarity', 0)),
+                'time_since_last': float(row.get('time_since_last', 0)),
+                'is_fraud': int(row.get('is_fraud', 0)),
+                'risk_score': risk_score,
+                'decision': decision
+            })
+    transactions.sort(key=lambda x: x['timestamp'], reverse=True)
+    return app.json.response(transactions).get_data()
+
+
+def cache_for(app, csv_path):
+    return SampleTransactionCache(lambda records: app.json.response(records).get_data(as_text=True), csv_path)
+
+
+def test_body_is_byte_identical_to_the_row_path(app):
+    body, etag = cache_for(app, SAMPLE_CSV).get()
+    assert body == row_body(app, SAMPLE_CSV)
+    assert etag
+
+
+def test_ties_and_missing_columns(app, tmp_path):
+    csv_path = str(tmp_path / 'sample.csv')
+    with open(csv_path, 'w', newline='') as f:
+        f.write('user_id,amount,timestamp,amount_deviation,geo_diff,hour\n'
+                'u1,10.1,2025-03-26T05:54:33,0.9,0.9,5\n'
+                'u2,0.30000000000000004,2025-03-27T00:00:00,0.5,0.1,6\n'
+                'u3,7,2025-03-26T05:54:33,0.1,0.2,7\n'
+                'u4,1e-7,2025-03-26T05:54:33,0.6,0.0,8\n')
+    assert cache_for(app, csv_path).get()[0] == row_body(app, csv_path)
+
+
+def test_rebuilds_only_when_the_file_changes(app, tmp_path):
+    csv_path = str(tmp_path / 'sample.csv')
+    assert cache_for(app, csv_path).get() == (None, None)
+
+    with open(csv_path, 'w', newline='') as f:
+        f.write('user_id,amount,timestamp\nu1,1.0,2025-03-26T05:54:33\n')
+    cache = cache_for(app, csv_path)
+    body, etag = cache.get()
+    assert cache.get()[0] is body
+
+    with open(csv_path, 'a', newline='') as f:
+        f.write('u2,2.0,2025-03-27T05:54:33\n')
+    new_body, new_etag = cache.get()
+    assert new_etag != etag
+    assert new_body == row_body(app, csv_path)
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from utils.velocity import DEFAULT_WINDOWS, VelocityCounter
+
+
+def expected_counts(timestamps, now):
+    """Events in each window ending at `now`, counted to bucket resolution"""
+    counts = {}
+    for name, seconds, buckets in DEFAULT_WINDOWS:
+        size = seconds / buckets
+        current = int(now // size)
+        counts[name] = sum(1 for t in timestamps if current - buckets < int(t // size) <= current)
+    return counts
+
+
+def test_counts_are_exact_at_bucket_resolution():
+    rng = np.random.default_rng(0)
+    # Bursts and multi-hour gaps, so buckets expire partly and completely
+    gaps = np.concatenate([rng.exponential(20, 300), rng.exponential(3000, 60)])
+    rng.shuffle(gaps)
+    timestamps = 1745000000.0 + np.cumsum(gaps)
+
+    counter = VelocityCounter(capacity=10)
+    seen = []
+    for t in timestamps:
+        assert counter.counts('user', t) == expected_counts(seen, t)
+        counter.record('user', t)
+        seen.append(t)
+    later = timestamps[-1] + 1800
+    assert counter.counts('user', later) == expected_counts(seen, later)
+
+
+def test_late_events_count_only_in_windows_that_still_cover_them():
+    counter = VelocityCounter(capacity=10)
+    now = 1745000000.0
+    counter.record('card', now)
+    counter.record('card', now - 120)  # outside 1m, inside 1h and 24h
+    assert counter.counts('card', now) == {'1m': 1, '1h': 2, '24h': 2}
+
+
+def test_keys_are_independent_and_unknown_keys_are_zero():
+    counter = VelocityCounter(capacity=10)
+    counter.record(('user', '1'), 100.0)
+    counter.record(('device', '1'), 100.0)
+    counter.record(('device', '1'), 101.0)
+    assert counter.counts(('user', '1'), 102.0)['1m'] == 1
+    assert counter.counts(('device', '1'), 102.0)['1m'] == 2
+    assert counter.counts(('card', '1'), 102.0) == {'1m': 0, '1h': 0, '24h': 0}
+
+
+def test_capacity_evicts_least_recently_seen():
+    counter = VelocityCounter(capacity=2)
+    start = 1745000000.0
+    counter.record('a', start)
+    counter.record('b', start + 1)
+    counter.record('a', start + 2)
+    counter.record('c', start + 3)
+    assert len(counter) == 2
+    assert counter.evictions == 1
+    assert counter.counts('a', start + 3)['1m'] == 2
+    assert counter.counts('b', start + 3)['1m'] == 0
+
+
+def test_idle_keys_are_dropped_before_active_ones():
+    counter = VelocityCounter(capacity=2)
+    start = 1745000000.0
+    counter.record('a', start)
+    counter.record('b', start + 80000)
+    # 'a' is older than the longest window: it makes room without counting as an eviction
+    counter.record('c', start + 90000)
+    assert len(counter) == 2
+    assert counter.evictions == 0
+    assert counter.counts('b', start + 90000)['24h'] == 1
@@ -10,6 +10,10 @@ import matplotlib.pyplot as plt
 from sklearn.preprocessing import StandardScaler
 import logging
 
+from models.compiled_trees import save_compiled
+from models.scoring_pipeline import save_pipeline
+from models.registry import scaler_path, write_current_version
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -246,7 +250,8 @@ def train_models():
     os.makedirs('models', exist_ok=True)
     version = datetime.datetime.now().strftime('%Y%m%d_%H%M')
     
-    # Save both models with version
+    # Save both models with version (and the scaler they were trained with)
+    joblib.dump(scaler, scaler_path('models', version))
     joblib.dump(rf_model, f'models/rf_model_v{version}.pkl')
     joblib.dump(gb_model, f'models/gb_model_v{version}.pkl')
     joblib.dump(iso_model, f'models/anomaly_model_v{version}.pkl')
@@ -256,6 +261,21 @@ def train_models():
     joblib.dump(best_model, 'models/supervised_model.pkl')
     joblib.dump(iso_model, 'models/anomaly_model.pkl')
     
+    # Save compiled (array-backed) versions next to the pickles for fast serving
+    try:
+        for model, path in [(best_model, f'models/supervised_model_v{version}.pkl'),
+                            (iso_model, f'models/anomaly_model_v{version}.pkl'),
+                            (best_model, 'models/supervised_model.pkl'),
+                            (iso_model, 'models/anomaly_model.pkl')]:
+            save_compiled(model, path)
+        logger.info("Compiled model artifacts saved")
+        
+        # Fused pipeline: the models were trained on scaled features, so serving must scale too
+        save_pipeline(best_model, iso_model, scaler=scaler, version=version)
+        logger.info("Scoring pipeline saved")
+    except Exception as e:
+        logger.warning(f"Could not compile models, serving will use the pickles: {e}")
+    
     # Save model metadata
     model_metadata = {
         'version': version,
@@ -268,13 +288,18 @@ def train_models():
         'best_model': best_model_name,
         'training_samples': len(X_train),
         'test_samples': len(X_test),
-        'fraud_ratio': y.mean()
+        'fraud_ratio': y.mean(),
+        # Serving must scale features with feature_scaler_v<version>.pkl before scoring
+        'scaled': True
     }
     
     with open(f'models/model_metadata_v{version}.json', 'w') as f:
         import json
         json.dump(model_metadata, f, indent=2)
     
+    # The current files are this version (so serving finds its metadata and scaler)
+    write_current_version('models', version)
+    
     logger.info(f"\nModels trained and saved successfully (version: {version})")
     logger.info(f"Best model ({best_model_name}) set as default supervised model")
     
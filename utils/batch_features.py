@@ -0,0 +1,96 @@
+"""
+Batch feature extraction for training and retraining.
+
+Training used to walk the feedback DataFrame with iterrows(), build a dict
+per row and stack the per-row feature vectors. Almost all of that time goes
+into iterrows itself, which boxes every row into a pandas Series.
+
+extract_features_batch takes the columns out of the frame once, builds the
+transaction payloads by zipping plain column lists, and writes each
+extract_features result into a preallocated N x F matrix. Large frames can
+be split into chunks across worker processes. The per-transaction
+extract_features stays the one definition of the features, so training and
+serving use the same code; only the row handling around it is batched
+(tests/test_batch_features.py checks the result against the iterrows path).
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils.feature_engineering import extract_features
+
+# Columns copied into the transaction payload, with the default used when a column is absent
+# (None: the column is required)
+TRANSACTION_COLUMNS = (('user_id', None), ('amount', None), ('timestamp', None), ('device_id', 'unknown'))
+LOCATION_COLUMNS = (('latitude', 0), ('longitude', 0))
+
+# Below this many rows a process pool costs more than it saves
+PARALLEL_MIN_ROWS = 50000
+
+
+def _column(frame, name, default):
+    """A column as a plain list, or the default repeated when the frame lacks it"""
+    if name in frame.columns or default is None:
+        return frame[name].tolist()
+    return [default] * len(frame)
+
+
+def frame_transactions(frame):
+    """
+    Transaction payloads for every row of a feedback/training frame
+
+    Builds the same dict per row as the former iterrows() loop (missing
+    columns take their defaults, present values are passed through as-is).
+    """
+    names = [name for name, _ in TRANSACTION_COLUMNS]
+    columns = [_column(frame, name, default) for name, default in TRANSACTION_COLUMNS]
+    latitudes, longitudes = (_column(frame, name, default) for name, default in LOCATION_COLUMNS)
+
+    transactions = []
+    for values, latitude, longitude in zip(zip(*columns), latitudes, longitudes):
+        transaction = dict(zip(names, values))
+        transaction['location'] = {'latitude': latitude, 'longitude': longitude}
+        transactions.append(transaction)
+    return transactions
+
+
+def _extract_into(transactions, out):
+    for i, transaction in enumerate(transactions):
+        out[i] = extract_features(transaction)
+    return out
+
+
+def _extract_chunk(transactions):
+    """Process pool task: features of one chunk as a matrix"""
+    first = np.asarray(extract_features(transactions[0]), dtype=np.float64).reshape(-1)
+    out = np.empty((len(transactions), first.shape[0]), dtype=np.float64)
+    out[0] = first
+    _extract_into(transactions[1:], out[1:])
+    return out
+
+
+def extract_features_batch(frame, n_jobs=1):
+    """
+    Feature matrix for every row of a frame
+
+    Args:
+        frame: DataFrame with user_id, amount, timestamp and optionally
+            device_id, latitude and longitude columns
+        n_jobs: Worker processes for frames of PARALLEL_MIN_ROWS rows or more
+
+    Returns:
+        N x F float64 array, row i holding extract_features of row i
+    """
+    transactions = frame_transactions(frame)
+    if not transactions:
+        return np.empty((0, 0), dtype=np.float64)
+
+    n_jobs = max(1, int(n_jobs))
+    if n_jobs > 1 and len(transactions) >= PARALLEL_MIN_ROWS:
+        chunk_size = -(-len(transactions) // (n_jobs * 4))
+        chunks = [transactions[i:i + chunk_size] for i in range(0, len(transactions), chunk_size)]
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            return np.vstack(list(pool.map(_extract_chunk, chunks)))
+
+    return _extract_chunk(transactions)
+
@@ -0,0 +1,118 @@
+"""
+Vectorized scoring of many transactions at once.
+
+The single-transaction /predict path pays the model call overhead once per
+transaction. The helpers here build one N x F feature matrix and make exactly
+one scoring pipeline call (one predict_proba and one decision_function) for
+the whole batch, while producing the same per-transaction results as /predict.
+"""
+import numpy as np
+
+from utils.feature_engineering import extract_features
+from utils.scoring import calculate_risk_score, get_decision
+
+# Upper bound on the number of transactions accepted in one batch request
+MAX_BATCH_SIZE = 10000
+
+
+def build_feature_matrix(transactions, n_features=None):
+    """
+    Extract features for every transaction into one N x F matrix
+
+    Returns:
+        features: 2D float array with one row per valid transaction
+        indices: positions in `transactions` that the rows belong to
+        errors: dict mapping position -> error message for rejected items
+    """
+    rows = []
+    indices = []
+    errors = {}
+
+    for i, transaction in enumerate(transactions):
+        try:
+            if not isinstance(transaction, dict):
+                raise ValueError('Transaction must be a JSON object')
+
+            row = np.asarray(extract_features(transaction), dtype=np.float64).reshape(-1)
+
+            if n_features is None:
+                n_features = row.shape[0]
+            elif row.shape[0] != n_features:
+                raise ValueError(f'Expected {n_features} features, got {row.shape[0]}')
+
+            rows.append(row)
+            indices.append(i)
+        except Exception as e:
+            errors[i] = f"Prediction error: {str(e)}"
+
+    if rows:
+        features = np.vstack(rows)
+    else:
+        features = np.empty((0, n_features or 0), dtype=np.float64)
+
+    return features, indices, errors
+
+
+def score_transactions(transactions, pipeline, feature_engine=None):
+    """
+    Score a list of transactions with one call per model
+
+    Args:
+        transactions: List of transaction dicts (same payload as /predict)
+        pipeline: models.scoring_pipeline.ScoringPipeline to evaluate
+        feature_engine: Optional utils.live_features.LiveFeatureEngine; each
+            transaction is enriched from (and recorded into) live state in
+            input order, exactly as /predict would do one at a time
+
+    Returns:
+        List with one dict per input transaction, in input order. Successful
+        items carry 'risk_score' (0-1), 'decision' and 'message'; failed items
+        carry 'error' instead.
+    """
+    if feature_engine is not None:
+        transactions = [feature_engine.observe(transaction) for transaction in transactions]
+
+    n_features = getattr(pipeline, 'n_features_in_', None)
+    features, indices, errors = build_feature_matrix(transactions, n_features)
+
+    results = [None] * len(transactions)
+    for i, error in errors.items():
+        results[i] = {'index': i, 'error': error}
+
+    if not indices:
+        return results
+
+    # One pipeline call per batch instead of one per transaction
+    supervised_scores, anomaly_scores = pipeline.model_scores(features)
+
+    for row, i in enumerate(indices):
+        transaction = transactions[i]
+        try:
+            risk_score = calculate_risk_score(supervised_scores[row], anomaly_scores[row],
+                                              transaction_data=transaction)
+            decision, message = get_decision(risk_score, user_id=transaction.get('user_id'),
+                                             amount=float(transaction.get('amount', 0)))
+            results[i] = {
+                'index': i,
+                'risk_score': risk_score,
+                'decision': decision,
+                'message': message
+            }
+        except Exception as e:
+            results[i] = {'index': i, 'error': f"Prediction error: {str(e)}"}
+
+    return results
+
+
+def format_result(result, model_version):
+    """Shape a score_transactions() item like a /predict response"""
+    if 'error' in result:
+        return {'index': result['index'], 'error': result['error']}
+
+    return {
+        'index': result['index'],
+        'risk_score': int(result['risk_score'] * 100),
+        'decision': result['decision'],
+        'message': result['message'],
+        'model_version': model_version
+    }
@@ -0,0 +1,287 @@
+"""
+Live per-user behavior fingerprints.
+
+Each user's normal behavior is kept in fixed-size NumPy arrays (one row per
+user, struct-of-arrays) rather than per-user Python objects:
+
+- running mean/variance of log amounts (Welford)
+- an hour-of-day histogram
+- the last-seen timestamp
+- a location centroid (unit-vector mean, so it is correct across the
+  antimeridian; after a warm-up it becomes an exponential moving average so it
+  follows users who relocate)
+- a handful of recently used devices with use counts
+
+Reading the deviation features for a transaction and folding the transaction
+into the profile are both constant time. The store has a fixed capacity, so
+its memory use is bounded no matter how many users it sees; when it is full,
+the least recently seen of a few randomly sampled users is evicted
+(approximate LRU).
+"""
+import datetime
+import hashlib
+import math
+import random
+import threading
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+DEFAULT_CAPACITY = 1000000
+
+# Devices remembered per user
+RECENT_DEVICES = 4
+
+# Users sampled per eviction; the least recently seen one is evicted
+EVICTION_SAMPLES = 8
+
+# Location centroid weight floor: the first 1/LOCATION_ALPHA locations are averaged equally
+LOCATION_ALPHA = 0.05
+
+# Scaling of raw deviations into the 0-1 ranges the models were trained on
+AMOUNT_Z_SCALE = 4.0  # |z| of 4 or more -> amount_deviation 1.0
+GEO_DIFF_SCALE_KM = 1000.0  # 1000 km or more from the usual location -> geo_diff 1.0
+LOCATION_DECAY_KM = 100.0  # location_familiarity = exp(-distance / 100 km)
+TIME_SINCE_LAST_CAP_HOURS = 720.0  # 30 days or more -> time_since_last 1.0
+
+# Python-side overhead per tracked user (index dict entry and key string), for memory budgeting
+_INDEX_OVERHEAD_BYTES = 160
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in kilometres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def transaction_location(transaction):
+    """(latitude, longitude) from a payload's latitude/longitude or location.lat/lon, else None"""
+    location = transaction.get('location')
+    if isinstance(location, dict):
+        lat, lon = location.get('lat', location.get('latitude')), location.get('lon', location.get('longitude'))
+    else:
+        lat, lon = transaction.get('latitude'), transaction.get('longitude')
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+        return None
+    return lat, lon
+
+
+def transaction_datetime(transaction):
+    """Parsed transaction timestamp, falling back to now"""
+    timestamp = transaction.get('timestamp')
+    if timestamp:
+        try:
+            return datetime.datetime.fromisoformat(str(timestamp).replace('Z', '+00:00'))
+        except ValueError:
+            pass
+    return datetime.datetime.now()
+
+
+def stable_hash(value):
+    """Non-zero 63-bit hash that is stable across processes (unlike hash())"""
+    digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest()
+    return (int.from_bytes(digest, 'little') >> 1) or 1
+
+
+class BehaviorProfileStore:
+    """
+    Fixed-capacity, array-backed store of per-user behavior profiles
+
+    Args:
+        capacity: Maximum number of users tracked at once
+    """
+
+    # Array bytes per profile (see _allocate)
+    PROFILE_BYTES = 4 + 8 + 8 + 8 + 4 + 3 * 4 + 24 * 2 + RECENT_DEVICES * (8 + 4) + 8
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = max(1, int(capacity))
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+        self._allocate()
+
+    @classmethod
+    def from_memory_budget(cls, max_bytes):
+        """Largest store whose arrays and index fit in `max_bytes`"""
+        return cls(capacity=int(max_bytes) // (cls.PROFILE_BYTES + _INDEX_OVERHEAD_BYTES))
+
+    def _allocate(self):
+        n = self.capacity
+        self._count = np.zeros(n, dtype=np.uint32)
+        self._amount_mean = np.zeros(n, dtype=np.float64)
+        self._amount_m2 = np.zeros(n, dtype=np.float64)
+        self._last_seen = np.zeros(n, dtype=np.float64)
+        self._location_count = np.zeros(n, dtype=np.uint32)
+        self._location = np.zeros((n, 3), dtype=np.float32)  # unit-vector centroid
+        self._hours = np.zeros((n, 24), dtype=np.uint16)
+        self._devices = np.zeros((n, RECENT_DEVICES), dtype=np.uint64)
+        self._device_counts = np.zeros((n, RECENT_DEVICES), dtype=np.uint32)
+        self._touched = np.zeros(n, dtype=np.uint64)  # logical clock of the last update
+
+        self._index = {}
+        self._keys = [None] * n
+        self._size = 0
+        self._clock = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._index)
+
+    def _slot_for_update(self, key):
+        """Slot for `key`, claiming a free slot or evicting an old profile if needed"""
+        slot = self._index.get(key)
+        if slot is not None:
+            return slot
+
+        if self._size < self.capacity:
+            slot = self._size
+            self._size += 1
+        else:
+            candidates = [self._random.randrange(self.capacity) for _ in range(EVICTION_SAMPLES)]
+            slot = min(candidates, key=lambda s: self._touched[s])
+            del self._index[self._keys[slot]]
+            self.evictions += 1
+            self._clear(slot)
+
+        self._index[key] = slot
+        self._keys[slot] = key
+        return slot
+
+    def _clear(self, slot):
+        self._count[slot] = 0
+        self._amount_mean[slot] = 0.0
+        self._amount_m2[slot] = 0.0
+        self._last_seen[slot] = 0.0
+        self._location_count[slot] = 0
+        self._location[slot] = 0.0
+        self._hours[slot] = 0
+        self._devices[slot] = 0
+        self._device_counts[slot] = 0
+
+    def features(self, user_id, amount, when, location=None, device_id=None):
+        """
+        Deviation features of a transaction against the user's profile
+
+        Args:
+            user_id: User the transaction belongs to
+            amount: Transaction amount
+            when: Transaction datetime
+            location: (latitude, longitude) or None
+            device_id: Device identifier or None
+
+        Returns:
+            Dict of features in the 0-1 ranges used for training, or None for
+            a user without history. Features that cannot be computed (no
+            location or device on either side) are left out.
+        """
+        with self._lock:
+            slot = self._index.get(str(user_id))
+            if slot is None or self._count[slot] == 0:
+                return None
+
+            features = {}
+            count = int(self._count[slot])
+
+            log_amount = math.log1p(max(float(amount), 0.0))
+            if count >= 2:
+                std = math.sqrt(self._amount_m2[slot] / (count - 1))
+                deviation = abs(log_amount - self._amount_mean[slot])
+                z = deviation / std if std > 1e-9 else (0.0 if deviation < 1e-9 else AMOUNT_Z_SCALE)
+                features['amount_deviation'] = float(min(z / AMOUNT_Z_SCALE, 1.0))
+
+            elapsed_hours = max(when.timestamp() - self._last_seen[slot], 0.0) / 3600.0
+            features['time_since_last'] = float(min(math.log1p(elapsed_hours) / math.log1p(TIME_SINCE_LAST_CAP_HOURS), 1.0))
+
+            hours = self._hours[slot]
+            features['hour_familiarity'] = float(hours[when.hour]) / float(hours.max())
+
+            if location is not None and self._location_count[slot]:
+                distance = self._distance_to_centroid(slot, location)
+                features['geo_diff'] = min(distance / GEO_DIFF_SCALE_KM, 1.0)
+                features['location_familiarity'] = math.exp(-distance / LOCATION_DECAY_KM)
+
+            if device_id is not None and self._device_counts[slot].any():
+                matches = np.flatnonzero(self._devices[slot] == stable_hash(device_id))
+                uses = int(self._device_counts[slot][matches[0]]) if len(matches) else 0
+                features['device_familiarity'] = uses / float(self._device_counts[slot].max())
+
+            return features
+
+    def _distance_to_centroid(self, slot, location):
+        x, y, z = (float(v) for v in self._location[slot])
+        norm = math.sqrt(x * x + y * y + z * z)
+        if norm < 1e-9:
+            # Locations on opposite sides of the globe cancel out: no meaningful centroid
+            return GEO_DIFF_SCALE_KM
+        lat = math.degrees(math.asin(max(-1.0, min(1.0, z / norm))))
+        lon = math.degrees(math.atan2(y, x))
+        return haversine_km(lat, lon, location[0], location[1])
+
+    def update(self, user_id, amount, when, location=None, device_id=None):
+        """Fold one transaction into the user's profile"""
+        with self._lock:
+            slot = self._slot_for_update(str(user_id))
+            self._clock += 1
+            self._touched[slot] = self._clock
+
+            count = int(self._count[slot]) + 1
+            self._count[slot] = min(count, np.iinfo(np.uint32).max)
+            log_amount = math.log1p(max(float(amount), 0.0))
+            delta = log_amount - self._amount_mean[slot]
+            self._amount_mean[slot] += delta / count
+            self._amount_m2[slot] += delta * (log_amount - self._amount_mean[slot])
+
+            self._last_seen[slot] = max(self._last_seen[slot], when.timestamp())
+
+            hours = self._hours[slot]
+            if hours[when.hour] == np.iinfo(np.uint16).max:
+                hours //= 2  # keep the shape of the histogram, make room
+            hours[when.hour] += 1
+
+            if location is not None:
+                n = int(self._location_count[slot]) + 1
+                self._location_count[slot] = min(n, np.iinfo(np.uint32).max)
+                lat, lon = math.radians(location[0]), math.radians(location[1])
+                point = (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+                weight = max(1.0 / n, LOCATION_ALPHA)
+                self._location[slot] += weight * (np.asarray(point, dtype=np.float32) - self._location[slot])
+
+            if device_id is not None:
+                self._record_device(slot, stable_hash(device_id))
+
+    def _record_device(self, slot, device_hash):
+        devices = self._devices[slot]
+        counts = self._device_counts[slot]
+        matches = np.flatnonzero(devices == device_hash)
+        if len(matches):
+            position = matches[0]
+            if counts[position] == np.iinfo(np.uint32).max:
+                counts //= 2
+            counts[position] += 1
+        else:
+            # Replace the least used device (empty slots have count 0)
+            position = int(np.argmin(counts))
+            devices[position] = device_hash
+            counts[position] = 1
+
+    def memory_bytes(self):
+        """Bytes held by the profile arrays plus an estimate for the user index"""
+        arrays = (self._count, self._amount_mean, self._amount_m2, self._last_seen, self._location_count,
+                  self._location, self._hours, self._devices, self._device_counts, self._touched)
+        return sum(array.nbytes for array in arrays) + len(self._index) * _INDEX_OVERHEAD_BYTES
+
+    def stats(self):
+        return {
+            'users': len(self._index),
+            'capacity': self.capacity,
+            'evictions': self.evictions,
+            'memory_bytes': self.memory_bytes()
+        }
@@ -0,0 +1,247 @@
+"""
+Device familiarity stores: exact, or a bounded-memory sketch.
+
+Device familiarity asks how often a user has transacted from a device. Both
+stores below count (user_id, device_id) pairs with the same time decay (all
+counts halve every half-life) and report familiarity on the scale
+BehaviorProfileStore uses: the pair's count relative to the user's most used
+device (1.0 for that device, 0.0 for one never seen), or None for a user with
+no device history. So the models see one distribution whichever store fills
+the feature, and the stores can be swapped for each other:
+
+- ExactDeviceStore keeps a dict of users to dicts of devices. It is exact,
+  but its memory grows with every new pair.
+- DeviceSketchStore keeps a count-min sketch with conservative updates in a
+  fixed block of uint16 counters, plus a smaller sketch keyed by user that
+  holds each user's largest pair count. It is sized from the number of
+  active pairs expected and a target false-familiarity rate (the chance that
+  a pair never seen reports a non-zero count), then capped by a memory
+  budget. Pair counts can be overestimated, never underestimated.
+"""
+import hashlib
+import math
+import threading
+
+import numpy as np
+
+DEFAULT_HALF_LIFE_DAYS = 30.0
+
+DEVICE_STORES = ('exact', 'sketch')
+
+_COUNTER_MAX = np.iinfo(np.uint16).max
+
+# Pair counters per user-max counter in the sketch (users have a few devices each)
+USER_SKETCH_RATIO = 4
+
+# Rough CPython cost of one (user, device) entry in the exact store, for stats()
+_EXACT_PAIR_BYTES = 250
+
+
+def familiarity_from_counts(count, user_max):
+    """
+    Pair count relative to the user's most used device, as in BehaviorProfileStore
+
+    None when the user has no (undecayed) device history.
+    """
+    if user_max <= 0:
+        return None
+    return min(count / float(user_max), 1.0)
+
+
+class ExactDeviceStore:
+    """
+    Exact per-user device counts with halving decay
+
+    Args:
+        half_life_days: Counts halve after this long
+    """
+
+    kind = 'exact'
+
+    def __init__(self, half_life_days=DEFAULT_HALF_LIFE_DAYS):
+        self.half_life = half_life_days * 86400.0
+        self._lock = threading.Lock()
+        self._users = {}  # user -> {device: [count, epoch]}
+        self._pairs = 0
+
+    def _epoch(self, timestamp):
+        return int(timestamp // self.half_life)
+
+    def _decayed(self, entry, epoch):
+        return entry[0] >> min(max(epoch - entry[1], 0), 16)
+
+    def count(self, user_id, device_id, timestamp):
+        """Decayed number of times the user was seen on the device"""
+        with self._lock:
+            entry = self._users.get(str(user_id), {}).get(str(device_id))
+            return self._decayed(entry, self._epoch(timestamp)) if entry is not None else 0
+
+    def familiarity(self, user_id, device_id, timestamp):
+        epoch = self._epoch(timestamp)
+        with self._lock:
+            devices = self._users.get(str(user_id))
+            if not devices:
+                return None
+            entry = devices.get(str(device_id))
+            count = self._decayed(entry, epoch) if entry is not None else 0
+            user_max = max(self._decayed(other, epoch) for other in devices.values())
+        return familiarity_from_counts(count, user_max)
+
+    def record(self, user_id, device_id, timestamp):
+        epoch = self._epoch(timestamp)
+        with self._lock:
+            devices = self._users.setdefault(str(user_id), {})
+            entry = devices.get(str(device_id))
+            if entry is None:
+                devices[str(device_id)] = [1, epoch]
+                self._pairs += 1
+                return
+            if epoch > entry[1]:
+                entry[0] >>= min(epoch - entry[1], 16)
+                entry[1] = epoch
+            entry[0] = min(entry[0] + 1, _COUNTER_MAX)
+
+    def stats(self):
+        return {
+            'kind': self.kind,
+            'pairs': self._pairs,
+            'users': len(self._users),
+            'memory_bytes': self._pairs * _EXACT_PAIR_BYTES
+        }
+
+
+def sketch_dimensions(expected_pairs, false_positive_rate, max_bytes=None):
+    """
+    Count-min sketch (depth, width) for a target false-familiarity rate
+
+    With n distinct pairs in d rows of w counters, an unseen pair collides in
+    every row with probability (1 - exp(-n / w)) ** d; the optimum has
+    d = log2(1 / p) rows and d * w = -n ln p / ln(2)^2 counters. If that
+    exceeds max_bytes the width is reduced to fit, raising the actual rate.
+    """
+    n = max(int(expected_pairs), 1)
+    p = min(max(float(false_positive_rate), 1e-9), 0.5)
+    depth = max(1, int(round(math.log2(1.0 / p))))
+    width = max(1, int(math.ceil(-n * math.log(p) / (math.log(2) ** 2) / depth)))
+    if max_bytes is not None:
+        width = max(1, min(width, int(max_bytes) // (depth * np.dtype(np.uint16).itemsize)))
+    return depth, width
+
+
+class DeviceSketchStore:
+    """
+    Count-min sketch of (user, device) pair counts with halving decay
+
+    A second count-min sketch keyed by user keeps each user's largest pair
+    count (a max instead of a sum, so it too can only overestimate) for the
+    relative familiarity. It has 1/USER_SKETCH_RATIO of the pair counters and
+    both share the memory cap. The share of non-zero counters per row, which
+    gives the current false-familiarity rate, is kept up to date on every
+    record, so stats() never scans the counters.
+
+    Args:
+        expected_pairs: Distinct pairs expected within a few half-lives
+        false_positive_rate: Target chance that an unseen pair looks familiar
+        max_bytes: Memory cap for the counters of both sketches
+        half_life_days: Counts halve after this long
+    """
+
+    kind = 'sketch'
+
+    def __init__(self, expected_pairs=10000000, false_positive_rate=0.01, max_bytes=256 * 1024 * 1024,
+                 half_life_days=DEFAULT_HALF_LIFE_DAYS):
+        self.expected_pairs = int(expected_pairs)
+        self.target_false_positive_rate = false_positive_rate
+        pair_bytes = max_bytes * USER_SKETCH_RATIO / (USER_SKETCH_RATIO + 1) if max_bytes is not None else None
+        self.depth, self.width = sketch_dimensions(expected_pairs, false_positive_rate, pair_bytes)
+        self.user_width = max(1, self.width // USER_SKETCH_RATIO)
+        self.half_life = half_life_days * 86400.0
+        self._counters = np.zeros((self.depth, self.width), dtype=np.uint16)
+        self._user_max = np.zeros((self.depth, self.user_width), dtype=np.uint16)
+        self._occupied = np.zeros(self.depth, dtype=np.int64)  # non-zero pair counters per row
+        self._rows = np.arange(self.depth)
+        self._epoch = None
+        self._lock = threading.Lock()
+        self.records = 0
+
+    def _positions(self, key, width):
+        """One counter column per row (double hashing from a single digest)"""
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return np.array([(h1 + i * h2) % width for i in range(self.depth)], dtype=np.int64)
+
+    def _pair_positions(self, user_id, device_id):
+        return self._positions(f'{user_id}\x1f{device_id}', self.width)
+
+    def _user_positions(self, user_id):
+        return self._positions(f'{user_id}', self.user_width)
+
+    def _advance(self, timestamp):
+        """Halve every counter once per half-life that has passed"""
+        epoch = int(timestamp // self.half_life)
+        if self._epoch is None:
+            self._epoch = epoch
+        elif epoch > self._epoch:
+            shift = min(epoch - self._epoch, 16)
+            self._counters >>= shift
+            self._user_max >>= shift
+            # Halving already touches every counter; recount the occupied ones in the same pass
+            self._occupied = np.count_nonzero(self._counters, axis=1).astype(np.int64)
+            self._epoch = epoch
+
+    def count(self, user_id, device_id, timestamp):
+        """Decayed pair count; may overestimate, never underestimates"""
+        positions = self._pair_positions(user_id, device_id)
+        with self._lock:
+            self._advance(timestamp)
+            return int(self._counters[self._rows, positions].min())
+
+    def familiarity(self, user_id, device_id, timestamp):
+        pair_positions = self._pair_positions(user_id, device_id)
+        user_positions = self._user_positions(user_id)
+        with self._lock:
+            self._advance(timestamp)
+            count = int(self._counters[self._rows, pair_positions].min())
+            user_max = int(self._user_max[self._rows, user_positions].min())
+        return familiarity_from_counts(count, user_max)
+
+    def record(self, user_id, device_id, timestamp):
+        pair_positions = self._pair_positions(user_id, device_id)
+        user_positions = self._user_positions(user_id)
+        with self._lock:
+            self._advance(timestamp)
+            current = self._counters[self._rows, pair_positions]
+            # Conservative update: only raise counters that are below the new estimate
+            estimate = min(int(current.min()) + 1, _COUNTER_MAX)
+            self._counters[self._rows, pair_positions] = np.maximum(current, estimate)
+            self._occupied += current == 0
+            user_current = self._user_max[self._rows, user_positions]
+            self._user_max[self._rows, user_positions] = np.maximum(user_current, estimate)
+            self.records += 1
+
+    def false_positive_rate(self):
+        """Current chance that an unseen pair reports a non-zero count (no counter scan)"""
+        occupied = self._occupied.copy()
+        return float(np.prod(occupied / float(self.width)))
+
+    def stats(self):
+        return {
+            'kind': self.kind,
+            'depth': self.depth,
+            'width': self.width,
+            'user_width': self.user_width,
+            'records': self.records,
+            'memory_bytes': int(self._counters.nbytes + self._user_max.nbytes),
+            'target_false_positive_rate': self.target_false_positive_rate,
+            'false_positive_rate': round(self.false_positive_rate(), 6)
+        }
+
+
+def create_device_store(kind, **kwargs):
+    """Build an 'exact' or 'sketch' device familiarity store"""
+    if kind == 'exact':
+        return ExactDeviceStore(half_life_days=kwargs.get('half_life_days', DEFAULT_HALF_LIFE_DAYS))
+    if kind == 'sketch':
+        return DeviceSketchStore(**kwargs)
+    raise ValueError(f'Unknown device store: {kind} (expected one of {DEVICE_STORES})')
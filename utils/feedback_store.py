@@ -0,0 +1,145 @@
+"""
+Append-only store for analyst feedback.
+
+Each feedback POST is appended as one JSON line to data/feedback.jsonl with a
+single write under an exclusive file lock, so concurrent analysts (threads or
+processes) never interleave partial lines. Nothing is rewritten in place:
+duplicates are resolved on read, where the last label for a transaction_id
+wins.
+
+Retraining reads incrementally: a checkpoint file remembers the byte offset
+consumed by the last successful run, and read_new() only parses what was
+appended after it.
+"""
+import datetime
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+DEFAULT_FEEDBACK_PATH = os.path.join('data', 'feedback.jsonl')
+
+
+@contextmanager
+def _exclusive_lock(fd):
+    """Hold an exclusive advisory lock on an open file descriptor"""
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        # Lock a single byte far past any real data as the mutex
+        os.lseek(fd, 2 ** 30, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            os.lseek(fd, 2 ** 30, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class FeedbackStore:
+    """
+    Append-only JSON-lines feedback log with last-write-wins reads
+
+    Args:
+        path: Feedback log file
+        checkpoint_path: Where the offset consumed by the last successful
+            retraining run is kept (defaults to <path>.checkpoint)
+    """
+
+    def __init__(self, path=DEFAULT_FEEDBACK_PATH, checkpoint_path=None):
+        self.path = path
+        self.checkpoint_path = checkpoint_path or path + '.checkpoint'
+        self._lock = threading.Lock()
+
+    def append(self, feedback):
+        """Append one feedback record; safe under concurrent writers"""
+        record = dict(feedback)
+        record.setdefault('received_at', datetime.datetime.now().isoformat())
+        line = (json.dumps(record, default=str) + '\n').encode('utf-8')
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self._lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                with _exclusive_lock(fd):
+                    written = 0
+                    while written < len(line):
+                        written += os.write(fd, line[written:])
+            finally:
+                os.close(fd)
+        return record
+
+    def _read_from(self, offset):
+        """Parse complete lines after `offset`; returns (records, end_offset)"""
+        if not os.path.exists(self.path):
+            return [], offset
+
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+
+        # A writer may be mid-append: stop at the last complete line
+        end = data.rfind(b'\n') + 1
+        records = []
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        return records, offset + end
+
+    @staticmethod
+    def deduplicate(records):
+        """Keep the last record per transaction_id, in order of first appearance"""
+        latest = {}
+        for position, record in enumerate(records):
+            key = record.get('transaction_id')
+            latest[('_no_id', position) if key is None else str(key)] = record
+        return list(latest.values())
+
+    def read_all(self):
+        """Every transaction's latest feedback; returns (records, end_offset)"""
+        records, end_offset = self._read_from(0)
+        return self.deduplicate(records), end_offset
+
+    def read_checkpoint(self):
+        """Byte offset consumed by the last successful run (0 if none)"""
+        try:
+            with open(self.checkpoint_path, 'r') as f:
+                return int(json.load(f).get('offset', 0))
+        except (OSError, ValueError):
+            return 0
+
+    def read_new(self):
+        """
+        Feedback appended since the last committed checkpoint
+
+        Returns:
+            (records, end_offset); pass end_offset to commit() once the
+            consumer has finished successfully.
+        """
+        offset = self.read_checkpoint()
+        if os.path.exists(self.path) and os.path.getsize(self.path) < offset:
+            # The log was replaced; start over
+            offset = 0
+        records, end_offset = self._read_from(offset)
+        return self.deduplicate(records), end_offset
+
+    def commit(self, offset):
+        """Atomically record that everything before `offset` has been consumed"""
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'offset': int(offset), 'updated': datetime.datetime.now().isoformat()}, f)
+        os.replace(tmp_path, self.checkpoint_path)
@@ -0,0 +1,272 @@
+"""
+Grid-cell spatial index of where users (and the whole population) transact.
+
+Coordinates are snapped to fixed-size latitude/longitude grid cells. For each
+user the index keeps a small, fixed number of visited cells, each with a
+time-decayed visit weight and the mean point of the visits in it; a global
+table keeps decayed visit weights per cell for the whole population.
+
+- location familiarity is the share of the user's decayed visits that fall in
+  the transaction's cell or its eight neighbours: a handful of array lookups
+- the nearest known location is found among the user's tracked cells (at most
+  MAX_CELLS_PER_USER), never by scanning transaction history
+- "new location for this population" is one lookup in the global table
+
+Like the behavior profile store, per-user data lives in fixed-capacity arrays
+with approximate-LRU eviction of users, so memory is bounded. The population
+table is bounded too: it is an LRU of cells, and once full, recording a visit
+to a new cell evicts the cell that was visited longest ago (the one whose
+weight has decayed the most), so each update stays O(1).
+"""
+import math
+import random
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.behavior_profiles import EARTH_RADIUS_KM, GEO_DIFF_SCALE_KM
+
+DEFAULT_CAPACITY = 1000000
+
+# Grid cell size in degrees (0.1 deg is ~11 km north-south)
+CELL_DEGREES = 0.1
+
+# Cells tracked per user; the lowest-weight cell makes room for a new one
+MAX_CELLS_PER_USER = 16
+
+# Visits lose half their weight after this long
+DEFAULT_HALF_LIFE_DAYS = 30.0
+
+# A cell whose population weight is below this counts as new for the population
+POPULATION_NEW_THRESHOLD = 1.0
+
+# Population cells kept at most; the least recently visited cell is evicted beyond it
+MAX_POPULATION_CELLS = 1000000
+
+# Share of a memory budget given to the population table (the rest goes to users)
+POPULATION_BUDGET_SHARE = 0.25
+
+EVICTION_SAMPLES = 8
+
+# Python-side overhead per tracked user (index dict entry and key string), for memory budgeting
+_INDEX_OVERHEAD_BYTES = 160
+
+# Bytes per population cell (OrderedDict entry, int key and a (weight, time) tuple), measured
+_POPULATION_CELL_BYTES = 250
+
+_EMPTY = -1
+
+
+def cell_of(latitude, longitude, cell_degrees=CELL_DEGREES):
+    """(row, column) of the grid cell containing a point"""
+    rows = int(round(180.0 / cell_degrees))
+    columns = int(round(360.0 / cell_degrees))
+    row = min(int((latitude + 90.0) // cell_degrees), rows - 1)
+    column = int((longitude + 180.0) // cell_degrees) % columns
+    return row, column
+
+
+class GeoIndex:
+    """
+    Per-user and population grid-cell visit index with time decay
+
+    Args:
+        capacity: Maximum number of users tracked at once
+        cell_degrees: Grid cell size in degrees
+        half_life_days: Half-life of a visit's weight
+        max_population_cells: Cells kept in the population table
+    """
+
+    # Array bytes per user (see __init__)
+    USER_BYTES = MAX_CELLS_PER_USER * (8 + 4 + 2 * 4) + 8 + 8
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, cell_degrees=CELL_DEGREES, half_life_days=DEFAULT_HALF_LIFE_DAYS,
+                 max_population_cells=MAX_POPULATION_CELLS):
+        self.capacity = max(1, int(capacity))
+        self.max_population_cells = max(1, int(max_population_cells))
+        self.cell_degrees = cell_degrees
+        self._rows = int(round(180.0 / cell_degrees))
+        self._columns = int(round(360.0 / cell_degrees))
+        self._decay_rate = math.log(2) / (half_life_days * 86400.0)
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+
+        n, k = self.capacity, MAX_CELLS_PER_USER
+        self._cells = np.full((n, k), _EMPTY, dtype=np.int64)
+        self._weights = np.zeros((n, k), dtype=np.float32)
+        self._points = np.zeros((n, k, 2), dtype=np.float32)  # mean lat/lon of the visits in each cell
+        self._updated = np.zeros(n, dtype=np.float64)  # time the user's weights were last decayed to
+        self._touched = np.zeros(n, dtype=np.uint64)
+
+        self._index = {}
+        self._keys = [None] * n
+        self._size = 0
+        self._clock = 0
+        self.evictions = 0
+        self.population_evictions = 0
+
+        # cell -> (decayed weight, time it was decayed to), least recently visited first
+        self._population = OrderedDict()
+
+    @classmethod
+    def from_memory_budget(cls, max_bytes, **kwargs):
+        """Largest index whose per-user arrays, index and population table fit in `max_bytes`"""
+        max_bytes = int(max_bytes)
+        population_cells = kwargs.pop('max_population_cells', None)
+        if population_cells is None:
+            population_cells = min(MAX_POPULATION_CELLS,
+                                   int(max_bytes * POPULATION_BUDGET_SHARE) // _POPULATION_CELL_BYTES)
+        user_bytes = max(max_bytes - population_cells * _POPULATION_CELL_BYTES, 0)
+        return cls(capacity=user_bytes // (cls.USER_BYTES + _INDEX_OVERHEAD_BYTES),
+                   max_population_cells=population_cells, **kwargs)
+
+    def _cell_id(self, row, column):
+        return row * self._columns + column % self._columns
+
+    def _neighbourhood(self, row, column):
+        """Ids of a cell and its eight neighbours (columns wrap at the antimeridian)"""
+        return [self._cell_id(r, c) for r in (row - 1, row, row + 1) if 0 <= r < self._rows
+                for c in (column - 1, column, column + 1)]
+
+    def _decay(self, slot, timestamp):
+        """Decay a user's cell weights forward to `timestamp`"""
+        elapsed = timestamp - self._updated[slot]
+        if elapsed > 0:
+            self._weights[slot] *= math.exp(-self._decay_rate * elapsed)
+            self._updated[slot] = timestamp
+
+    def _slot_for_update(self, key):
+        slot = self._index.get(key)
+        if slot is not None:
+            return slot
+
+        if self._size < self.capacity:
+            slot = self._size
+            self._size += 1
+        else:
+            candidates = [self._random.randrange(self.capacity) for _ in range(EVICTION_SAMPLES)]
+            slot = min(candidates, key=lambda s: self._touched[s])
+            del self._index[self._keys[slot]]
+            self.evictions += 1
+            self._cells[slot] = _EMPTY
+            self._weights[slot] = 0.0
+            self._points[slot] = 0.0
+            self._updated[slot] = 0.0
+
+        self._index[key] = slot
+        self._keys[slot] = key
+        return slot
+
+    def _population_weight(self, cell, timestamp):
+        entry = self._population.get(cell)
+        if entry is None:
+            return 0.0
+        return entry[0] * math.exp(-self._decay_rate * max(timestamp - entry[1], 0.0))
+
+    def features(self, user_id, location, timestamp):
+        """
+        Location features of a point for a user
+
+        Args:
+            user_id: User the transaction belongs to
+            location: (latitude, longitude)
+            timestamp: Transaction time in epoch seconds
+
+        Returns:
+            Dict with population_cell_weight and new_location_for_population,
+            plus geo_diff, location_familiarity and nearest_known_km when the
+            user has location history
+        """
+        latitude, longitude = location
+        row, column = cell_of(latitude, longitude, self.cell_degrees)
+
+        with self._lock:
+            population_weight = self._population_weight(self._cell_id(row, column), timestamp)
+            features = {
+                'population_cell_weight': population_weight,
+                'new_location_for_population': population_weight < POPULATION_NEW_THRESHOLD
+            }
+
+            slot = self._index.get(str(user_id))
+            if slot is None:
+                return features
+
+            self._decay(slot, timestamp)
+            cells = self._cells[slot]
+            weights = self._weights[slot]
+            known = cells != _EMPTY
+            total = float(weights[known].sum())
+            if not known.any() or total <= 0.0:
+                return features
+
+            nearby = (cells[:, None] == np.asarray(self._neighbourhood(row, column))).any(axis=1)
+            features['location_familiarity'] = float(weights[nearby].sum()) / total
+
+            # Nearest tracked cell; its mean visit point stands in for the visits
+            points = np.radians(self._points[slot][known].astype(np.float64))
+            lat, lon = math.radians(latitude), math.radians(longitude)
+            a = (np.sin((points[:, 0] - lat) / 2) ** 2 +
+                 np.cos(points[:, 0]) * math.cos(lat) * np.sin((points[:, 1] - lon) / 2) ** 2)
+            nearest = float(2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0))).min())
+            features['nearest_known_km'] = nearest
+            features['geo_diff'] = min(nearest / GEO_DIFF_SCALE_KM, 1.0)
+            return features
+
+    def update(self, user_id, location, timestamp):
+        """Record a visit to `location` by `user_id` at `timestamp` (epoch seconds)"""
+        latitude, longitude = location
+        row, column = cell_of(latitude, longitude, self.cell_degrees)
+        cell = self._cell_id(row, column)
+
+        with self._lock:
+            weight = self._population_weight(cell, timestamp)
+            previous = self._population.get(cell)
+            if previous is None:
+                if len(self._population) >= self.max_population_cells:
+                    self._population.popitem(last=False)
+                    self.population_evictions += 1
+                self._population[cell] = (weight + 1.0, timestamp)
+            else:
+                self._population[cell] = (weight + 1.0, max(timestamp, previous[1]))
+                self._population.move_to_end(cell)
+
+            slot = self._slot_for_update(str(user_id))
+            self._clock += 1
+            self._touched[slot] = self._clock
+            self._decay(slot, timestamp)
+
+            cells = self._cells[slot]
+            weights = self._weights[slot]
+            matches = np.flatnonzero(cells == cell)
+            if len(matches):
+                position = matches[0]
+            else:
+                # Take an empty position, else replace the least-visited cell
+                empty = np.flatnonzero(cells == _EMPTY)
+                position = empty[0] if len(empty) else int(np.argmin(weights))
+                cells[position] = cell
+                weights[position] = 0.0
+                self._points[slot][position] = (latitude, longitude)
+
+            # Weight the new visit into the cell's mean point
+            share = 1.0 / (float(weights[position]) + 1.0)
+            point = self._points[slot][position]
+            point += share * (np.asarray((latitude, longitude), dtype=np.float32) - point)
+            weights[position] += 1.0
+
+    def memory_bytes(self):
+        arrays = (self._cells, self._weights, self._points, self._updated, self._touched)
+        return sum(array.nbytes for array in arrays) + len(self._population) * _POPULATION_CELL_BYTES
+
+    def stats(self):
+        return {
+            'users': len(self._index),
+            'capacity': self.capacity,
+            'evictions': self.evictions,
+            'population_cells': len(self._population),
+            'max_population_cells': self.max_population_cells,
+            'population_evictions': self.population_evictions,
+            'cell_degrees': self.cell_degrees,
+            'memory_bytes': self.memory_bytes()
+        }
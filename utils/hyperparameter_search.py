@@ -0,0 +1,191 @@
+"""
+Budgeted hyperparameter search for retraining.
+
+An exhaustive grid search costs len(grid) x folds fits on every retrain, so
+retraining time grows with the grid. successive_halving instead samples a
+number of candidates that fits a fit-count budget and scores them all on a
+small stratified share of each training fold. It keeps the best third,
+triples the share and repeats until the survivors are scored on the full
+folds.
+A wall-clock budget stops the search early and returns the best candidate
+of the last round that was scored.
+
+The cross-validation folds are split once and reused by every candidate and
+every round. The previous run's best parameters, read from model metadata,
+always enter the first round, so a good configuration is not lost to
+sampling.
+"""
+import json
+import os
+import time
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import ParameterGrid, StratifiedKFold
+
+SEARCH_MODES = ('halving', 'grid')
+
+# Each round keeps 1/FACTOR of the candidates and gives them FACTOR times the data
+FACTOR = 3
+
+# Smallest training subsample a candidate is scored on
+MIN_RESOURCES = 500
+
+
+def cv_folds(X, y, n_splits=3, random_state=42):
+    """Stratified fold indices, split once and shared by every fit of a search"""
+    splitter = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    return list(splitter.split(X, y))
+
+
+def _stratified_order(y, rng):
+    """
+    Permutation of y whose every prefix has (close to) y's class balance
+
+    Rare fraud labels would otherwise be missing from small subsamples.
+    """
+    position = np.empty(len(y), dtype=np.float64)
+    for label in np.unique(y):
+        members = np.flatnonzero(y == label)
+        position[rng.permutation(members)] = (np.arange(len(members)) + rng.random()) / len(members)
+    return np.argsort(position, kind='stable')
+
+
+def _normalize_params(params, grid):
+    """Keep only grid keys whose value is one the grid offers"""
+    return {key: value for key, value in (params or {}).items() if key in grid and value in grid[key]}
+
+
+def _rounds_for(n_candidates, max_rounds):
+    """Rounds that halve n_candidates down to one survivor, at most max_rounds"""
+    if n_candidates <= 1:
+        return 1
+    return min(max_rounds, int(np.ceil(np.log(n_candidates) / np.log(FACTOR))) + 1)
+
+
+def _planned_fits(n_candidates, n_rounds, n_folds):
+    """Fits of a search whose every round keeps 1/FACTOR of the candidates, rounded up"""
+    fits, survivors = 0, n_candidates
+    for _ in range(n_rounds):
+        fits += survivors * n_folds
+        survivors = max(1, int(np.ceil(survivors / FACTOR)))
+    return fits
+
+
+def load_previous_best_params(models_dir):
+    """best_params of the newest model metadata file that has them, or None"""
+    if not os.path.isdir(models_dir):
+        return None
+    names = sorted((name for name in os.listdir(models_dir)
+                    if name.startswith('model_metadata_v') and name.endswith('.json')), reverse=True)
+    for name in names:
+        try:
+            with open(os.path.join(models_dir, name)) as f:
+                best_params = json.load(f).get('best_params')
+        except (OSError, ValueError):
+            continue
+        if best_params:
+            return best_params
+    return None
+
+
+def successive_halving(estimator, param_grid, X, y, folds, scoring='roc_auc', max_fits=60, max_seconds=None,
+                       warm_start_params=None, random_state=42):
+    """
+    Successive-halving search over a parameter grid within a budget
+
+    Args:
+        estimator: Unfitted estimator; each candidate is a clone with its params set
+        param_grid: Dict of parameter -> list of values
+        X, y: Training data
+        folds: (train, test) index pairs from cv_folds
+        scoring: sklearn scorer name
+        max_fits: Upper bound on the number of fits across all rounds (one
+            candidate is always scored, even if its folds exceed it)
+        max_seconds: Wall-clock budget; no new fits start once it is spent
+        warm_start_params: Parameters that always enter the first round
+
+    Returns:
+        Dict with best_params, best_score, fits, seconds, rounds, candidates,
+        grid_size, stopped_early and estimated_grid_seconds (the projected
+        cost of scoring every grid point on the full folds)
+    """
+    started = time.perf_counter()
+    deadline = started + max_seconds if max_seconds else None
+    rng = np.random.default_rng(random_state)
+    scorer = get_scorer(scoring)
+    X = np.asarray(X)
+    y = np.asarray(y)
+
+    grid = list(ParameterGrid(param_grid))
+    warm = _normalize_params(warm_start_params, param_grid)
+
+    # Rounds: the last one uses the full folds, each earlier one 1/FACTOR of the next
+    n_train = min(len(train) for train, _ in folds)
+    n_rounds = max(1, int(np.floor(np.log(max(n_train / MIN_RESOURCES, 1.0)) / np.log(FACTOR))) + 1)
+    # Most candidates whose rounds, with the survivors rounded up, stay within max_fits
+    n_candidates = 1
+    while (n_candidates < len(grid) and
+           _planned_fits(n_candidates + 1, _rounds_for(n_candidates + 1, n_rounds), len(folds)) <= max_fits):
+        n_candidates += 1
+    n_rounds = _rounds_for(n_candidates, n_rounds)
+
+    order = rng.permutation(len(grid))
+    candidates = [grid[i] for i in order[:n_candidates]]
+    if warm and warm not in candidates:
+        if len(warm) == len(param_grid):
+            candidates[-1] = warm
+        else:
+            candidates[-1] = dict(candidates[-1], **warm)
+
+    fold_orders = [train[_stratified_order(y[train], rng)] for train, _ in folds]
+
+    fits = 0
+    full_fit_seconds = []
+    stopped_early = False
+    best_params, best_score = candidates[0], float('-inf')
+    rounds = []
+    for round_index in range(n_rounds):
+        share = FACTOR ** (round_index - (n_rounds - 1))
+        scores = []
+        for params in candidates:
+            if deadline and time.perf_counter() >= deadline and scores:
+                stopped_early = True
+                break
+            fold_scores = []
+            for (train, test), train_order in zip(folds, fold_orders):
+                subset = train_order[:max(MIN_RESOURCES, int(len(train) * share))]
+                model = clone(estimator).set_params(**params)
+                fit_started = time.perf_counter()
+                model.fit(X[subset], y[subset])
+                if share == 1:
+                    full_fit_seconds.append(time.perf_counter() - fit_started)
+                fold_scores.append(scorer(model, X[test], y[test]))
+                fits += 1
+            scores.append(float(np.mean(fold_scores)))
+
+        ranked = sorted(zip(scores, range(len(scores))), key=lambda item: -item[0])
+        best_score, best_index = ranked[0]
+        best_params = candidates[best_index]
+        rounds.append({'candidates': len(scores), 'share': round(share, 4), 'best_score': best_score})
+        if stopped_early or round_index == n_rounds - 1:
+            break
+        keep = max(1, int(np.ceil(len(candidates) / FACTOR)))
+        candidates = [candidates[index] for _, index in ranked[:keep]]
+
+    seconds = time.perf_counter() - started
+    estimated_grid_seconds = (float(np.mean(full_fit_seconds)) * len(grid) * len(folds)
+                              if full_fit_seconds else None)
+    return {
+        'best_params': best_params,
+        'best_score': best_score,
+        'fits': fits,
+        'seconds': seconds,
+        'rounds': rounds,
+        'candidates': n_candidates,
+        'grid_size': len(grid),
+        'warm_start_params': warm or None,
+        'stopped_early': stopped_early,
+        'estimated_grid_seconds': estimated_grid_seconds
+    }
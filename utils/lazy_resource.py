@@ -0,0 +1,113 @@
+"""
+Deferred construction of expensive, optional resources.
+
+Heavy components (the DistilBERT-based multimodal detector and the torch and
+transformers imports behind it) should not sit on the startup path of the
+lightweight /predict service. A LazyResource builds its object on first use,
+or in a background warm-up thread, and reports its readiness so /status can
+show whether the component is available yet.
+"""
+import threading
+import time
+
+NOT_LOADED = 'not_loaded'
+LOADING = 'loading'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class ResourceUnavailable(RuntimeError):
+    """Raised when a lazy resource is still loading or failed to load"""
+
+
+class LazyResource:
+    """
+    Build an object once, on first use or in the background
+
+    Args:
+        name: Label used in status reports and errors
+        factory: Zero-argument callable returning the object
+        retry_interval: Seconds to wait after a failed load before trying again
+    """
+
+    def __init__(self, name, factory, retry_interval=60.0):
+        self.name = name
+        self.factory = factory
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._value = None
+        self._state = NOT_LOADED
+        self._error = None
+        self._failed_at = None
+        self._load_seconds = None
+        self._loaded_at = None
+
+    def _load(self):
+        """Run the factory; caller holds the lock"""
+        self._state = LOADING
+        started = time.perf_counter()
+        try:
+            self._value = self.factory()
+        except Exception as e:
+            self._state = FAILED
+            self._error = f'{e.__class__.__name__}: {e}'
+            self._failed_at = time.monotonic()
+            return
+        self._state = READY
+        self._error = None
+        self._load_seconds = time.perf_counter() - started
+        self._loaded_at = time.strftime('%Y-%m-%d %H:%M:%S')
+
+    def _should_retry(self):
+        return self._state == FAILED and time.monotonic() - self._failed_at >= self.retry_interval
+
+    def get(self, wait=True):
+        """
+        The loaded object, building it first if needed
+
+        Args:
+            wait: If False, raise ResourceUnavailable instead of waiting for a
+                load already in progress in another thread
+
+        Raises:
+            ResourceUnavailable: The resource failed to load (and is not due
+                for a retry yet) or is still loading and wait is False
+        """
+        if self._state == READY:
+            return self._value
+
+        if not wait and self._state == LOADING:
+            raise ResourceUnavailable(f'{self.name} is still loading')
+
+        with self._lock:
+            if self._state == NOT_LOADED or self._should_retry():
+                self._load()
+            if self._state != READY:
+                raise ResourceUnavailable(f'{self.name} failed to load: {self._error}')
+            return self._value
+
+    def peek(self):
+        """The object if it is already loaded, else None; never triggers a load"""
+        return self._value if self._state == READY else None
+
+    def warm_up(self):
+        """Start loading in a daemon thread; returns immediately"""
+        if self._state in (READY, LOADING):
+            return
+
+        def run():
+            try:
+                self.get()
+            except ResourceUnavailable:
+                pass
+
+        threading.Thread(target=run, name=f'warm-up-{self.name}', daemon=True).start()
+
+    def status(self):
+        """Readiness report for /status"""
+        return {
+            'state': self._state,
+            'error': self._error,
+            'load_seconds': round(self._load_seconds, 3) if self._load_seconds is not None else None,
+            'loaded_at': self._loaded_at
+        }
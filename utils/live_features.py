@@ -0,0 +1,160 @@
+"""
+Live feature enrichment for the serving path.
+
+The training data carries behavior features (amount_deviation, geo_diff,
+device_familiarity, location_familiarity, time_since_last, velocity) that
+were computed offline. LiveFeatureEngine computes them from in-process state
+instead: each scored transaction is first enriched from the user's profile
+and velocity counters and then folded into them, so the next transaction
+sees it.
+
+The state lives in this process. Under serve.py each worker keeps its own
+and sees only the transactions it serves, so with several workers the
+values are per-worker estimates rather than counts over all traffic.
+
+Modes:
+    'fill'      live values are used only for features missing from the payload
+    'override'  live values replace whatever the payload sent
+    'off'       transactions pass through unchanged
+"""
+import threading
+
+from utils.behavior_profiles import (BehaviorProfileStore, transaction_datetime,
+                                     transaction_location)
+
+LIVE_FEATURE_MODES = ('fill', 'override', 'off')
+
+# Velocity is counted per (kind, payload field); e.g. user_velocity_1h
+VELOCITY_KEYS = (('user', 'user_id'), ('device', 'device_id'), ('card', 'card_id'))
+
+# The model's `velocity` feature: the user's transactions in this window
+MODEL_VELOCITY_WINDOW = '1h'
+
+
+class LiveFeatureEngine:
+    """
+    Enrich transactions with features computed from live per-user state
+
+    Args:
+        profiles: BehaviorProfileStore (a default-sized one if omitted, none
+            in 'off' mode, which keeps no state)
+        velocity: Optional utils.velocity.VelocityCounter for per-user,
+            per-device and per-card transaction velocity
+        geo: Optional utils.geo_index.GeoIndex; when set, geo_diff and
+            location_familiarity come from visited grid cells instead of the
+            profile's single location centroid
+        devices: Optional utils.device_familiarity store ('exact' or
+            'sketch'); when set, device_familiarity comes from its pair counts
+            (on the profile's scale) instead of the profile's few recent devices
+        mode: One of LIVE_FEATURE_MODES
+    """
+
+    def __init__(self, profiles=None, velocity=None, geo=None, devices=None, mode='fill'):
+        if mode not in LIVE_FEATURE_MODES:
+            raise ValueError(f'Unknown live feature mode: {mode}')
+        if profiles is None and mode != 'off':
+            profiles = BehaviorProfileStore()
+        self.profiles = profiles
+        self.velocity = velocity
+        self.geo = geo
+        self.devices = devices
+        self.mode = mode
+        # Enrich-then-update must be atomic so concurrent transactions of one user see each other
+        self._lock = threading.Lock()
+        self.observed = 0
+
+    def live_features(self, transaction):
+        """Features for `transaction` from current state, without updating it"""
+        features = {}
+        when = transaction_datetime(transaction)
+        user_id = transaction.get('user_id')
+
+        if user_id is not None:
+            features.update(self.profiles.features(
+                user_id, _amount(transaction), when,
+                location=transaction_location(transaction), device_id=transaction.get('device_id')) or {})
+
+        location = transaction_location(transaction)
+        if self.geo is not None and user_id is not None and location is not None:
+            features.update(self.geo.features(user_id, location, when.timestamp()))
+
+        device_id = transaction.get('device_id')
+        if self.devices is not None and user_id is not None and device_id is not None:
+            familiarity = self.devices.familiarity(user_id, device_id, when.timestamp())
+            if familiarity is not None:
+                features['device_familiarity'] = familiarity
+
+        if self.velocity is not None:
+            timestamp = when.timestamp()
+            for kind, field in VELOCITY_KEYS:
+                value = transaction.get(field)
+                if value is None:
+                    continue
+                # Transactions before this one, per window
+                for window, count in self.velocity.counts((kind, str(value)), timestamp).items():
+                    features[f'{kind}_velocity_{window}'] = count
+            if user_id is not None:
+                features['velocity'] = features[f'user_velocity_{MODEL_VELOCITY_WINDOW}']
+
+        return features
+
+    def update(self, transaction):
+        """Fold `transaction` into the live state"""
+        when = transaction_datetime(transaction)
+        user_id = transaction.get('user_id')
+
+        location = transaction_location(transaction)
+        if user_id is not None:
+            self.profiles.update(
+                user_id, _amount(transaction), when,
+                location=location, device_id=transaction.get('device_id'))
+            if self.geo is not None and location is not None:
+                self.geo.update(user_id, location, when.timestamp())
+            if self.devices is not None and transaction.get('device_id') is not None:
+                self.devices.record(user_id, transaction['device_id'], when.timestamp())
+
+        if self.velocity is not None:
+            timestamp = when.timestamp()
+            for kind, field in VELOCITY_KEYS:
+                value = transaction.get(field)
+                if value is not None:
+                    self.velocity.record((kind, str(value)), timestamp)
+
+    def observe(self, transaction):
+        """
+        Enrich a transaction from live state, then record it
+
+        Returns:
+            A copy of `transaction` with live features applied according to
+            the mode; the input dict is not modified.
+        """
+        if self.mode == 'off' or not isinstance(transaction, dict):
+            return transaction
+
+        with self._lock:
+            features = self.live_features(transaction)
+            self.update(transaction)
+            self.observed += 1
+
+        enriched = dict(transaction)
+        for name, value in features.items():
+            if self.mode == 'override' or enriched.get(name) is None:
+                enriched[name] = value
+        return enriched
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'observed': self.observed,
+            'profiles': self.profiles.stats() if self.profiles is not None else None,
+            'velocity': self.velocity.stats() if self.velocity is not None else None,
+            'geo': self.geo.stats() if self.geo is not None else None,
+            'devices': self.devices.stats() if self.devices is not None else None
+        }
+
+
+def _amount(transaction):
+    try:
+        return float(transaction.get('amount', 0) or 0)
+    except (TypeError, ValueError):
+        return 0.0
@@ -0,0 +1,369 @@
+"""
+In-memory request metrics exported in the Prometheus text format.
+
+Timings are kept as fixed-bucket histograms. Recording a value only appends
+it to the series' pending list; pending values are sorted into the buckets in
+bulk (one searchsorted/bincount per PENDING_LIMIT values, and before every
+snapshot), so memory stays fixed and the request path does no bucketing. A
+StageTimer follows one request: each stage mark reads the clock once and notes
+the time since the previous mark (so the stages add up to the request's
+total), and finish() files them all under a single acquisition of the
+registry lock. A ten-stage /predict pays a few microseconds in total.
+
+Under serve.py every worker process keeps its own metrics. With a share_dir
+each worker also writes a snapshot of them there every few seconds, and
+render() writes a fresh snapshot of its own and then renders the sum of all
+workers' snapshot files, so whichever worker answers a scrape reports the
+whole server. Only snapshots are summed, never one worker's live values with
+the others' older snapshots: each file only grows, so consecutive scrapes
+never report a counter going down, even when different workers answer them.
+The snapshots of exited workers stay in the sum until the launcher restarts,
+which removes the directories of earlier runs (remove_stale_share_dirs).
+"""
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+# Upper bounds in seconds: from ~10 us (get_decision) to tens of seconds (LLM calls)
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Values a histogram series buffers before bucketing them
+PENDING_LIMIT = 1024
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Bucket counts and sum of one labelled series (guarded by its registry's lock)"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'pending', '_lock')
+
+    def __init__(self, buckets, lock):
+        self.buckets = np.asarray(buckets, dtype=np.float64)
+        self.counts = np.zeros(len(buckets) + 1, dtype=np.int64)  # last slot: above the largest bound
+        self.sum = 0.0
+        self.pending = []
+        self._lock = lock
+
+    def observe(self, value):
+        with self._lock:
+            self.add(value)
+
+    def add(self, value):
+        """observe() for callers already holding the lock"""
+        self.pending.append(value)
+        if len(self.pending) >= PENDING_LIMIT:
+            self.flush()
+
+    def flush(self):
+        """Sort the pending values into the buckets (lock held)"""
+        if self.pending:
+            values = np.asarray(self.pending, dtype=np.float64)
+            # side='left': a value equal to a bound belongs to that bound's bucket (le)
+            self.counts += np.bincount(np.searchsorted(self.buckets, values, side='left'),
+                                       minlength=len(self.counts))
+            self.sum += float(values.sum())
+            self.pending = []
+
+    def snapshot(self):
+        self.flush()
+        return {'counts': self.counts.tolist(), 'sum': self.sum}
+
+
+class Counter:
+    """Monotonic count of one labelled series (guarded by its registry's lock)"""
+
+    __slots__ = ('value', '_lock')
+
+    def __init__(self, lock):
+        self.value = 0
+        self._lock = lock
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class MetricFamily:
+    """A named metric and its series, one per combination of label values"""
+
+    def __init__(self, name, documentation, kind, lock, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = lock
+
+    def labels(self, *values):
+        """The series for these label values (created on first use)"""
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} expects labels {self.labelnames}, got {values}')
+            with self._lock:
+                series = self._series.get(values)
+                if series is None:
+                    series = Histogram(self.buckets, self._lock) if self.kind == 'histogram' else Counter(self._lock)
+                    self._series[values] = series
+        return series
+
+    def snapshot(self):
+        """{json-encoded label values: series snapshot}"""
+        with self._lock:
+            return {json.dumps(values): series.snapshot() for values, series in self._series.items()}
+
+
+def _merge(total, snapshot, kind):
+    for key, value in snapshot.items():
+        if kind == 'histogram':
+            merged = total.setdefault(key, {'counts': [0] * len(value['counts']), 'sum': 0.0})
+            merged['counts'] = [a + b for a, b in zip(merged['counts'], value['counts'])]
+            merged['sum'] += value['sum']
+        else:
+            total[key] = total.get(key, 0) + value
+
+
+class MetricsRegistry:
+    """
+    Metric families of one process, rendered for Prometheus
+
+    Args:
+        namespace: Prefix of every metric name
+        share_dir: Directory where worker processes exchange snapshots (None: this process only)
+        share_interval: Seconds between snapshot writes
+    """
+
+    def __init__(self, namespace='fraudshield', share_dir=None, share_interval=5.0):
+        self.namespace = namespace
+        self.share_dir = share_dir
+        self.share_interval = share_interval
+        self._families = []
+        self._thread = None
+        self._pid = None
+        # One lock for every series: a request's observations are filed in one acquisition
+        self.lock = threading.RLock()
+
+    def _register(self, family):
+        self._families.append(family)
+        return family
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(MetricFamily(f'{self.namespace}_{name}', documentation, 'histogram', self.lock,
+                                           labelnames, buckets))
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(MetricFamily(f'{self.namespace}_{name}', documentation, 'counter', self.lock,
+                                           labelnames))
+
+    def snapshot(self):
+        return {family.name: family.snapshot() for family in self._families}
+
+    def ensure_sharing(self):
+        """Start the snapshot writer of this process (lazily, and again in a forked child)"""
+        if not self.share_dir or (self._pid == os.getpid() and self._thread is not None):
+            return
+        with self.lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._share_loop, name='metrics-share', daemon=True)
+            self._thread.start()
+
+    def _snapshot_path(self, pid):
+        return os.path.join(self.share_dir, f'{pid}.json')
+
+    def write_snapshot(self):
+        os.makedirs(self.share_dir, exist_ok=True)
+        path = self._snapshot_path(os.getpid())
+        tmp_path = f'{path}.tmp-{threading.get_ident()}'  # the share thread and a scrape may both write
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def _share_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            try:
+                self.write_snapshot()
+            except OSError:
+                pass
+            time.sleep(self.share_interval)
+
+    def _merged_snapshot(self):
+        """
+        Sum of every worker's snapshot file (exited ones included), this
+        process's written first; without a share_dir, this process's values
+        """
+        merged = {family.name: {} for family in self._families}
+        kinds = {family.name: family.kind for family in self._families}
+        if not self.share_dir:
+            snapshots = [self.snapshot()]
+        else:
+            try:
+                self.write_snapshot()
+            except OSError:
+                pass
+            try:
+                names = os.listdir(self.share_dir)
+            except OSError:
+                names = []
+            snapshots = []
+            for name in names:
+                if not name.endswith('.json'):
+                    continue
+                try:
+                    with open(os.path.join(self.share_dir, name)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+            if not snapshots:
+                snapshots = [self.snapshot()]
+        for snapshot in snapshots:
+            for name, series in snapshot.items():
+                if name in merged:
+                    _merge(merged[name], series, kinds[name])
+        return merged
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        self.ensure_sharing()
+        merged = self._merged_snapshot()
+        lines = []
+        for family in self._families:
+            lines.append(f'# HELP {family.name} {family.documentation}')
+            lines.append(f'# TYPE {family.name} {family.kind}')
+            for key in sorted(merged[family.name]):
+                values = json.loads(key)
+                series = merged[family.name][key]
+                if family.kind == 'counter':
+                    lines.append(f'{family.name}{_format_labels(family.labelnames, values)} {series}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(family.buckets + (float('inf'),), series['counts']):
+                    cumulative += count
+                    le = f'le="{_format_number(bound)}"'
+                    lines.append(f'{family.name}_bucket{_format_labels(family.labelnames, values, le)} {cumulative}')
+                labels = _format_labels(family.labelnames, values)
+                lines.append(f"{family.name}_sum{labels} {_format_number(series['sum'])}")
+                lines.append(f'{family.name}_count{labels} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def remove_stale_share_dirs(root, keep=None):
+    """
+    Delete the snapshot directories (named by launcher pid) of launchers
+    that are no longer running; returns the names removed
+    """
+    removed = []
+    if not os.path.isdir(root):
+        return removed
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if not name.isdigit() or name == str(keep) or not os.path.isdir(path):
+            continue
+        try:
+            os.kill(int(name), 0)
+            continue  # another launcher is still using it
+        except ProcessLookupError:
+            pass
+        except OSError:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        removed.append(name)
+    return removed
+
+
+class StageTimer:
+    """
+    Times the stages of one request
+
+    Call stage(name) at the end of each stage; it notes the time since the
+    previous mark (or the start). finish(status) records the stages and the
+    whole request.
+    """
+
+    __slots__ = ('_metrics', '_endpoint', '_stages', '_observations', '_started', '_last')
+
+    def __init__(self, metrics, endpoint):
+        self._metrics = metrics
+        self._endpoint = endpoint
+        self._stages = metrics.stage_series(endpoint)
+        self._observations = []
+        self._started = self._last = time.perf_counter()
+
+    def stage(self, name):
+        now = time.perf_counter()
+        series = self._stages.get(name)
+        if series is None:
+            series = self._stages[name] = self._metrics.stage_seconds.labels(self._endpoint, name)
+        self._observations.append((series, now - self._last))
+        self._last = now
+
+    def finish(self, status=200):
+        self._metrics.record(self._endpoint, status, time.perf_counter() - self._started, self._observations)
+        self._observations = []
+
+
+class RequestMetrics:
+    """Per-stage and per-request latency histograms plus request counters"""
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.stage_seconds = registry.histogram('stage_seconds', 'Time spent in each stage of a request',
+                                                ('endpoint', 'stage'))
+        self.request_seconds = registry.histogram('request_seconds', 'Total time of a request', ('endpoint',))
+        self.requests = registry.counter('requests_total', 'Requests handled', ('endpoint', 'status'))
+        self._stage_series = {}
+        self._request_series = {}
+
+    def stage_series(self, endpoint):
+        """Cache of stage name -> histogram series for one endpoint"""
+        series = self._stage_series.get(endpoint)
+        if series is None:
+            series = self._stage_series.setdefault(endpoint, {})
+        return series
+
+    def timer(self, endpoint):
+        self.registry.ensure_sharing()
+        return StageTimer(self, endpoint)
+
+    def record(self, endpoint, status, seconds, observations=()):
+        """File a finished request: its total time, its status and its stage observations"""
+        key = (endpoint, status)
+        series = self._request_series.get(key)
+        if series is None:
+            series = self._request_series[key] = (self.request_seconds.labels(endpoint),
+                                                  self.requests.labels(endpoint, str(status)))
+        total, count = series
+        with self.registry.lock:
+            for stage, stage_seconds in observations:
+                stage.add(stage_seconds)
+            total.add(seconds)
+            count.value += 1
@@ -0,0 +1,180 @@
+"""
+Server-side coalescing of concurrent single-transaction requests.
+
+Request threads hand their transaction to a MicroBatcher and block. A single
+background thread collects whatever has arrived within a short window (or
+until the batch is full), scores it with one batched call and wakes each
+waiting request with its own result.
+
+The window adapts to the observed arrival rate: when traffic is sparse the
+batcher does not wait at all, so a lone request pays no extra latency; under
+load it waits just long enough to fill a batch of the expected size.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+
+
+class _Pending:
+    """A submitted item waiting for its result"""
+    __slots__ = ('item', 'enqueued_at', 'done', 'result', 'error')
+
+    def __init__(self, item):
+        self.item = item
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent submit() calls into batched calls of `score_fn`
+
+    Args:
+        score_fn: Callable taking a list of items and returning a list of
+            results of the same length and order
+        max_batch_size: Upper bound on items per batch
+        max_wait_ms: Upper bound on how long the first item of a batch waits
+            for others to arrive
+        rate_smoothing: EWMA factor for the inter-arrival gap estimate (0-1)
+    """
+
+    def __init__(self, score_fn, max_batch_size=64, max_wait_ms=2.0, rate_smoothing=0.2):
+        self.score_fn = score_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.rate_smoothing = rate_smoothing
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+
+        # Adaptive state
+        self._avg_gap = None  # seconds between arrivals (EWMA)
+        self._arrival_rate = 0.0  # items per second
+        self._last_arrival = None
+        self._target_batch = 1
+        self._target_wait = 0.0
+
+        # Counters
+        self._batches = 0
+        self._items = 0
+        self._last_batch_size = 0
+        self._avg_batch_size = 0.0
+        self._max_queue_depth = 0
+        self._errors = 0
+
+    def _ensure_started(self):
+        """Start the worker thread (again after a fork, threads do not survive it)"""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+
+        with self._cond:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+            self._thread.start()
+
+    def _observe_arrival(self, now):
+        """Update the arrival-rate estimate and derive the batch target and wait window"""
+        if self._last_arrival is not None:
+            gap = max(now - self._last_arrival, 1e-6)
+            if self._avg_gap is None:
+                self._avg_gap = gap
+            else:
+                self._avg_gap += self.rate_smoothing * (gap - self._avg_gap)
+            self._arrival_rate = 1.0 / self._avg_gap
+        self._last_arrival = now
+
+        # Items expected to arrive within the maximum wait window
+        expected = self._arrival_rate * self.max_wait
+        if expected < 1.0:
+            # Sparse traffic: waiting would only add latency
+            self._target_batch = 1
+            self._target_wait = 0.0
+        else:
+            self._target_batch = min(self.max_batch_size, int(math.ceil(expected)))
+            self._target_wait = min(self.max_wait, self._target_batch / self._arrival_rate)
+
+    def submit(self, item, timeout=None):
+        """
+        Submit one item and block until its batch has been scored
+
+        Returns the item's result; re-raises the exception if its batch failed.
+        """
+        self._ensure_started()
+        pending = _Pending(item)
+
+        with self._cond:
+            self._observe_arrival(pending.enqueued_at)
+            self._queue.append(pending)
+            self._max_queue_depth = max(self._max_queue_depth, len(self._queue))
+            self._cond.notify()
+
+        if not pending.done.wait(timeout):
+            raise TimeoutError('Timed out waiting for batched prediction')
+
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _collect(self):
+        """Block until at least one item is queued, then gather a batch"""
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+
+            deadline = self._queue[0].enqueued_at + self._target_wait
+            while len(self._queue) < self._target_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            size = min(len(self._queue), self.max_batch_size)
+            return [self._queue.popleft() for _ in range(size)]
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+
+            try:
+                results = self.score_fn([pending.item for pending in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f'Batch scorer returned {len(results)} results for {len(batch)} items')
+                for pending, result in zip(batch, results):
+                    pending.result = result
+            except Exception as e:
+                self._errors += 1
+                for pending in batch:
+                    pending.error = e
+            finally:
+                self._batches += 1
+                self._items += len(batch)
+                self._last_batch_size = len(batch)
+                self._avg_batch_size += 0.1 * (len(batch) - self._avg_batch_size)
+                for pending in batch:
+                    pending.done.set()
+
+    def stats(self):
+        """Snapshot of queue depth, batch sizes and the current adaptive settings"""
+        return {
+            'enabled': True,
+            'queue_depth': len(self._queue),
+            'max_queue_depth': self._max_queue_depth,
+            'batches': self._batches,
+            'items': self._items,
+            'errors': self._errors,
+            'last_batch_size': self._last_batch_size,
+            'avg_batch_size': round(self._avg_batch_size, 2),
+            'arrival_rate': round(self._arrival_rate, 1),
+            'target_batch_size': self._target_batch,
+            'target_wait_ms': round(self._target_wait * 1000.0, 3),
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0
+        }
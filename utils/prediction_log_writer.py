@@ -0,0 +1,245 @@
+"""
+Asynchronous, group-committed prediction logging.
+
+Request threads enqueue a record and return immediately. A background thread
+drains the queue every flush interval and commits everything it found with a
+single write (plus one optional fsync) to an append-only JSON-lines segment,
+and a single SQLite transaction to the prediction store. Segments roll over
+at a size cap, so no write ever touches previously logged data.
+
+The in-memory queue is bounded. When it is full the drop policy decides what
+happens: 'drop_newest' rejects the new record, 'drop_oldest' evicts the oldest
+queued one, and 'block' waits up to block_timeout for room before dropping.
+Drops and writer lag are exposed through stats().
+"""
+import atexit
+import datetime
+import json
+import os
+import threading
+import time
+from collections import deque
+
+DEFAULT_LOG_DIR = os.path.join('logs', 'predictions')
+
+DROP_POLICIES = ('drop_newest', 'drop_oldest', 'block')
+
+
+class PredictionLogWriter:
+    """
+    Background group-commit writer for prediction records
+
+    Args:
+        log_dir: Directory for the predictions-*.jsonl segments
+        store: Optional PredictionStore; each batch is added in one transaction
+        max_queue: Maximum number of records waiting to be written
+        flush_interval: Seconds between group commits
+        fsync: fsync the segment once per group commit
+        segment_max_bytes: Roll over to a new segment beyond this size
+        drop_policy: One of DROP_POLICIES
+        block_timeout: Seconds to wait for queue space with the 'block' policy
+    """
+
+    def __init__(self, log_dir=DEFAULT_LOG_DIR, store=None, max_queue=10000, flush_interval=0.05,
+                 fsync=False, segment_max_bytes=64 * 1024 * 1024, drop_policy='drop_newest',
+                 block_timeout=0.01):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f'Unknown drop policy: {drop_policy}')
+
+        self.log_dir = log_dir
+        self.store = store
+        self.max_queue = max(1, int(max_queue))
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.segment_max_bytes = segment_max_bytes
+        self.drop_policy = drop_policy
+        self.block_timeout = block_timeout
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+
+        self._segment = None
+        self._segment_path = None
+        self._segment_bytes = 0
+        self._segment_index = 0
+
+        # Counters
+        self.enqueued = 0
+        self.written = 0
+        self.rejected = 0  # never queued (queue full)
+        self.evicted = 0  # queued, then pushed out by drop_oldest
+        self.failed = 0  # lost to a write error
+        self.write_errors = 0
+        self.store_errors = 0
+        self.commits = 0
+        self.last_commit_size = 0
+        self.last_commit_seconds = 0.0
+        self.last_commit_at = None
+
+        atexit.register(self.close)
+
+    def _ensure_started(self):
+        """Start the writer thread lazily, and again in a forked child"""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._cond:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                # Forked child: the parent owns whatever was queued and its open segment
+                self._queue.clear()
+                self._segment = None
+                self._segment_bytes = 0
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='prediction-log-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, transaction, risk_score, decision, model_version):
+        """
+        Queue one prediction for logging without blocking on disk
+
+        Returns False if the record was dropped because the queue is full.
+        """
+        self._ensure_started()
+        record = {
+            'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'transaction': transaction,
+            'risk_score': float(risk_score),
+            'decision': decision,
+            'model_version': model_version,
+            'enqueued_at': time.monotonic()
+        }
+
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                if self.drop_policy == 'drop_oldest':
+                    self._queue.popleft()
+                    self.evicted += 1
+                elif self.drop_policy == 'block':
+                    deadline = time.monotonic() + self.block_timeout
+                    while len(self._queue) >= self.max_queue and time.monotonic() < deadline:
+                        self._cond.wait(deadline - time.monotonic())
+                    if len(self._queue) >= self.max_queue:
+                        self.rejected += 1
+                        return False
+                else:
+                    self.rejected += 1
+                    return False
+
+            self._queue.append(record)
+            self.enqueued += 1
+        return True
+
+    def _open_segment(self):
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._segment_index += 1
+        name = f"predictions-{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}-{os.getpid()}-{self._segment_index:04d}.jsonl"
+        self._segment_path = os.path.join(self.log_dir, name)
+        self._segment = open(self._segment_path, 'a', encoding='utf-8')
+        self._segment_bytes = self._segment.tell()
+
+    def _commit(self, batch):
+        """Write one batch with a single write/flush/fsync and a single store transaction"""
+        started = time.perf_counter()
+
+        lines = []
+        for record in batch:
+            record.pop('enqueued_at', None)
+            lines.append(json.dumps(record, default=str))
+        data = '\n'.join(lines) + '\n'
+        size = len(data.encode('utf-8'))
+
+        if self._segment is None or self._segment_bytes + size > self.segment_max_bytes:
+            if self._segment is not None:
+                self._segment.close()
+            self._open_segment()
+
+        self._segment.write(data)
+        self._segment.flush()
+        if self.fsync:
+            os.fsync(self._segment.fileno())
+        self._segment_bytes += size
+
+        # The segment is the durable log; the store is an index that can be rebuilt from it
+        if self.store is not None:
+            try:
+                self.store.add_many([
+                    (record['timestamp'], record['transaction'].get('user_id'), record['transaction'].get('amount'),
+                     record['risk_score'], record['decision'], record['model_version'])
+                    for record in batch if isinstance(record['transaction'], dict)
+                ])
+            except Exception:
+                self.store_errors += 1
+
+        self.commits += 1
+        self.written += len(batch)
+        self.last_commit_size = len(batch)
+        self.last_commit_seconds = time.perf_counter() - started
+        self.last_commit_at = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._queue and not self._closed:
+                    self._cond.wait(self.flush_interval)
+                batch = list(self._queue)
+                self._queue.clear()
+                # Wake producers blocked on a full queue
+                self._cond.notify_all()
+                closing = self._closed
+
+            if batch:
+                try:
+                    self._commit(batch)
+                except Exception:
+                    self.write_errors += 1
+                    self.failed += len(batch)
+
+            if closing:
+                return
+
+            # Group commit: let records accumulate for the rest of the interval
+            time.sleep(self.flush_interval)
+
+    def close(self, timeout=5.0):
+        """Flush whatever is queued and stop the writer thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def stats(self):
+        """Counters for /status: queue depth, lag and drops"""
+        with self._cond:
+            queue_depth = len(self._queue)
+            oldest = self._queue[0]['enqueued_at'] if queue_depth else None
+        return {
+            'queue_depth': queue_depth,
+            'max_queue': self.max_queue,
+            'enqueued': self.enqueued,
+            'written': self.written,
+            # Records accepted but not yet on disk (queued or in the batch being written)
+            'lag': self.enqueued - self.written - self.evicted - self.failed,
+            'oldest_queued_ms': round((time.monotonic() - oldest) * 1000.0, 1) if oldest is not None else 0.0,
+            'dropped': self.rejected + self.evicted + self.failed,
+            'rejected': self.rejected,
+            'evicted': self.evicted,
+            'failed': self.failed,
+            'drop_policy': self.drop_policy,
+            'write_errors': self.write_errors,
+            'store_errors': self.store_errors,
+            'commits': self.commits,
+            'last_commit_size': self.last_commit_size,
+            'last_commit_ms': round(self.last_commit_seconds * 1000.0, 3),
+            'last_commit_at': self.last_commit_at,
+            'segment': self._segment_path,
+            'fsync': self.fsync
+        }
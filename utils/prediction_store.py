@@ -0,0 +1,195 @@
+"""
+Indexed local store for logged predictions.
+
+Predictions are kept in a SQLite database with indexes on timestamp, user_id,
+decision and risk_score, so the dashboard API can page through history with a
+keyset cursor and filter server-side. Query cost depends on the page size, not
+on how many predictions have been logged.
+
+On first use the existing logs/predictions.csv is imported once.
+"""
+import base64
+import csv
+import os
+import sqlite3
+import threading
+
+DEFAULT_DB_PATH = os.path.join('logs', 'predictions.db')
+DEFAULT_LEGACY_CSV = os.path.join('logs', 'predictions.csv')
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Risk bands on the 0-1 risk score (0-50 allow, 51-80 challenge, 81-100 block)
+RISK_LEVELS = {
+    'low': (None, 0.5),
+    'medium': (0.5, 0.8),
+    'high': (0.8, None)
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    user_id TEXT,
+    amount REAL,
+    risk_score REAL,
+    decision TEXT,
+    model_version TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_predictions_timestamp ON predictions (timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_predictions_user ON predictions (user_id, timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_predictions_decision ON predictions (decision, timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_predictions_risk ON predictions (risk_score);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_COLUMNS = ('timestamp', 'user_id', 'amount', 'risk_score', 'decision', 'model_version')
+
+
+def encode_cursor(timestamp, row_id):
+    """Opaque pagination cursor for the last row of a page"""
+    return base64.urlsafe_b64encode(f'{timestamp}|{row_id}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on malformed input"""
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+        return timestamp, int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+class PredictionStore:
+    """SQLite-backed prediction history with cursor pagination"""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, legacy_csv=DEFAULT_LEGACY_CSV):
+        self.db_path = db_path
+        self.legacy_csv = legacy_csv
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connection(self):
+        """One connection per thread (and per process after a fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(_SCHEMA)
+                    self._import_legacy_csv(conn)
+                    self._initialized = True
+        return conn
+
+    def _import_legacy_csv(self, conn):
+        """Import logs/predictions.csv once, the first time the store is created"""
+        if conn.execute("SELECT 1 FROM store_meta WHERE key = 'legacy_csv_imported'").fetchone():
+            return
+
+        rows = []
+        if self.legacy_csv and os.path.exists(self.legacy_csv):
+            with open(self.legacy_csv, 'r', newline='') as f:
+                for row in csv.DictReader(f):
+                    try:
+                        rows.append((row['timestamp'], row['user_id'], float(row['amount']),
+                                     float(row['risk_score']), row['decision'], row['model_version']))
+                    except (KeyError, TypeError, ValueError):
+                        continue
+
+        with conn:
+            conn.executemany(
+                'INSERT INTO predictions (timestamp, user_id, amount, risk_score, decision, model_version) '
+                'VALUES (?, ?, ?, ?, ?, ?)', rows)
+            conn.execute("INSERT INTO store_meta (key, value) VALUES ('legacy_csv_imported', ?)",
+                         (str(len(rows)),))
+
+    def initialize(self):
+        """Create the schema and import legacy history now rather than on first use"""
+        self._connection()
+
+    def add(self, timestamp, user_id, amount, risk_score, decision, model_version):
+        """Record one prediction"""
+        self.add_many([(timestamp, user_id, amount, risk_score, decision, model_version)])
+
+    def add_many(self, rows):
+        """Record several predictions in one transaction; rows follow the column order of add()"""
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                'INSERT INTO predictions (timestamp, user_id, amount, risk_score, decision, model_version) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(str(timestamp), None if user_id is None else str(user_id),
+                  None if amount is None else float(amount), float(risk_score), decision,
+                  None if model_version is None else str(model_version))
+                 for timestamp, user_id, amount, risk_score, decision, model_version in rows])
+
+    def query(self, limit=DEFAULT_PAGE_SIZE, cursor=None, user_id=None, min_amount=None,
+              max_amount=None, risk_level=None, decision=None):
+        """
+        Fetch one page of predictions, newest first
+
+        Returns:
+            (rows, next_cursor) where next_cursor is None on the last page
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        clauses = []
+        params = []
+
+        if cursor:
+            timestamp, row_id = decode_cursor(cursor)
+            clauses.append('(timestamp, id) < (?, ?)')
+            params.extend([timestamp, row_id])
+        if user_id is not None:
+            clauses.append('user_id = ?')
+            params.append(str(user_id))
+        if min_amount is not None:
+            clauses.append('amount >= ?')
+            params.append(float(min_amount))
+        if max_amount is not None:
+            clauses.append('amount <= ?')
+            params.append(float(max_amount))
+        if risk_level is not None:
+            if risk_level not in RISK_LEVELS:
+                raise ValueError(f'Unknown risk level: {risk_level}')
+            low, high = RISK_LEVELS[risk_level]
+            if low is not None:
+                clauses.append('risk_score > ?')
+                params.append(low)
+            if high is not None:
+                clauses.append('risk_score <= ?')
+                params.append(high)
+        if decision is not None:
+            clauses.append('decision = ?')
+            params.append(decision.upper())
+
+        sql = 'SELECT id, ' + ', '.join(_COLUMNS) + ' FROM predictions'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        # Fetch one extra row to know whether another page exists
+        sql += ' ORDER BY timestamp DESC, id DESC LIMIT ?'
+        params.append(limit + 1)
+
+        rows = self._connection().execute(sql, params).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        next_cursor = encode_cursor(rows[-1]['timestamp'], rows[-1]['id']) if has_more else None
+        return [{column: row[column] for column in _COLUMNS} for row in rows], next_cursor
+
+    def count(self):
+        return self._connection().execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
@@ -0,0 +1,75 @@
+"""
+Per-process memory figures for pre-forked workers.
+
+RSS counts every resident page a process maps, including pages shared with
+the parent and the other workers, so summing worker RSS overstates the real
+footprint. PSS splits each shared page evenly among the processes mapping
+it; summing PSS across the parent and workers gives the actual total. Both
+come from /proc/<pid>/smaps_rollup on Linux; elsewhere only the peak RSS of
+the current process is available.
+"""
+import os
+import sys
+
+_SMAPS_FIELDS = {
+    'Rss': 'rss',
+    'Pss': 'pss',
+    'Shared_Clean': 'shared_clean',
+    'Shared_Dirty': 'shared_dirty',
+    'Private_Clean': 'private_clean',
+    'Private_Dirty': 'private_dirty'
+}
+
+
+def _read_smaps_rollup(pid):
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            field, _, rest = line.partition(':')
+            if field in _SMAPS_FIELDS:
+                values[_SMAPS_FIELDS[field]] = int(rest.split()[0]) * 1024
+    return values
+
+
+def _read_status_rss(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return {'rss': int(line.split()[1]) * 1024}
+    return {}
+
+
+def process_memory(pid=None):
+    """
+    Memory of a process in MB
+
+    Args:
+        pid: Process id (default: the calling process)
+
+    Returns:
+        Dict with pid and rss_mb, plus pss_mb, shared_mb and private_mb when
+        the kernel provides smaps_rollup; empty figures if the process is gone
+    """
+    pid = pid or os.getpid()
+    try:
+        values = _read_smaps_rollup(pid)
+    except OSError:
+        try:
+            values = _read_status_rss(pid)
+        except OSError:
+            values = {}
+            if pid == os.getpid():
+                import resource
+                peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                # ru_maxrss is in kilobytes on Linux, bytes on macOS
+                values['rss'] = peak if sys.platform == 'darwin' else peak * 1024
+
+    memory = {'pid': pid}
+    if 'rss' in values:
+        memory['rss_mb'] = round(values['rss'] / 1024 / 1024, 1)
+    if 'pss' in values:
+        memory['pss_mb'] = round(values['pss'] / 1024 / 1024, 1)
+        memory['shared_mb'] = round((values.get('shared_clean', 0) + values.get('shared_dirty', 0)) / 1024 / 1024, 1)
+        memory['private_mb'] = round(
+            (values.get('private_clean', 0) + values.get('private_dirty', 0)) / 1024 / 1024, 1)
+    return memory
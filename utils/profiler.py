@@ -0,0 +1,252 @@
+"""
+On-demand profiling of live requests.
+
+A capture profiles the next N requests or the next T seconds of the process
+it is started in. The profiling wrapper is swapped into the Flask app's
+wsgi_app only while a capture runs, so with no capture requests run exactly
+as before and pay nothing.
+
+Two collectors:
+
+- 'cprofile': deterministic cProfile of each request, merged into one
+  .pstats file (open with snakeviz, or flameprof for a flame graph). Only
+  one request is profiled at a time; requests that overlap it run
+  unprofiled but still count toward N.
+- 'sampling': a background thread samples the Python stack of every thread
+  that is inside a request, every sample_interval seconds, and writes the
+  counts as collapsed stacks (one "frame;frame;frame count" line per stack)
+  for flamegraph.pl, inferno or speedscope. Its cost is one stack walk per
+  sampled thread per interval, not per call.
+
+Files go to output_dir as profile-<time>-<pid>-<n>-<collector>.<ext>. Under
+serve.py every worker keeps its own profiler: the HTTP endpoint captures the
+worker that answers it, and SIGUSR2 to a worker (or to the launcher, for all
+of them) starts a sampling capture there.
+"""
+import cProfile
+import datetime
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+COLLECTORS = ('cprofile', 'sampling')
+
+# Paths that are never profiled (the profiler's own control endpoint)
+EXCLUDED_PATHS = ('/admin/profile',)
+
+
+class ProfilerBusy(Exception):
+    """A capture is already running in this process"""
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def collapse_stack(frame):
+    """A frame's stack, outermost first, as one collapsed-stack key"""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class RequestProfiler:
+    """
+    Profiling captures of a Flask app's requests
+
+    Args:
+        flask_app: The Flask app whose wsgi_app is wrapped during a capture
+        output_dir: Directory for the profile files
+        sample_interval: Seconds between stack samples of the 'sampling' collector
+        max_requests: Largest N a capture may ask for
+        max_seconds: Longest a capture may run (also ends a request-count capture)
+    """
+
+    def __init__(self, flask_app, output_dir, sample_interval=0.005, max_requests=1000, max_seconds=300.0):
+        self.flask_app = flask_app
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.max_requests = max_requests
+        self.max_seconds = max_seconds
+
+        self._lock = threading.Lock()
+        self._profile_lock = threading.Lock()  # one cProfile at a time (required on Python 3.12+)
+        self._capture = None
+        self._last = None
+        self._captures = 0
+        self._original_wsgi_app = None
+
+    def start(self, requests=None, seconds=None, collector='cprofile'):
+        """
+        Start a capture of the next `requests` requests or `seconds` seconds
+
+        Returns:
+            The capture record; raises ValueError for bad arguments and
+            ProfilerBusy if a capture is running
+        """
+        if collector not in COLLECTORS:
+            raise ValueError(f'Unknown collector: {collector} (expected one of {COLLECTORS})')
+        if (requests is None) == (seconds is None):
+            raise ValueError('Give either a number of requests or a number of seconds')
+        if requests is not None and not 1 <= int(requests) <= self.max_requests:
+            raise ValueError(f'requests must be between 1 and {self.max_requests}')
+        if seconds is not None and not 0 < float(seconds) <= self.max_seconds:
+            raise ValueError(f'seconds must be between 0 and {self.max_seconds}')
+
+        with self._lock:
+            if self._capture is not None:
+                raise ProfilerBusy(f"A {self._capture['collector']} capture is already running in pid {os.getpid()}")
+
+            started = time.time()
+            self._captures += 1
+            capture = {
+                'id': f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}-{os.getpid()}-{self._captures}",
+                'pid': os.getpid(),
+                'collector': collector,
+                'requests': int(requests) if requests is not None else None,
+                'seconds': float(seconds) if seconds is not None else None,
+                'started_at': datetime.datetime.fromtimestamp(started).strftime('%Y-%m-%d %H:%M:%S'),
+                'profiled_requests': 0,
+                'unprofiled_requests': 0,
+                'samples': 0,
+                'path': None
+            }
+            self._capture = capture
+            self._started = time.perf_counter()
+            self._request_count = 0
+            self._stats = None
+            self._stacks = Counter()
+            self._request_threads = set()
+
+            if collector == 'sampling':
+                threading.Thread(target=self._sample, args=(capture,), name='profiler-sampler', daemon=True).start()
+            deadline = float(seconds) if seconds is not None else self.max_seconds
+            timer = threading.Timer(deadline, self._finish, args=(capture,))
+            timer.daemon = True
+            timer.start()
+
+            self._original_wsgi_app = self.flask_app.wsgi_app
+            self.flask_app.wsgi_app = self._profiled_wsgi_app
+            return dict(capture)
+
+    def status(self):
+        """The running capture (or None) and the last finished one"""
+        with self._lock:
+            active = dict(self._capture) if self._capture else None
+            if active:
+                active['profiled_requests'] = self._request_count
+                active['elapsed_seconds'] = round(time.perf_counter() - self._started, 3)
+            return {'active': active, 'last': dict(self._last) if self._last else None}
+
+    def _profiled_wsgi_app(self, environ, start_response):
+        capture = self._capture
+        wsgi_app = self._original_wsgi_app
+        if capture is None or environ.get('PATH_INFO', '') in EXCLUDED_PATHS:
+            return wsgi_app(environ, start_response)
+
+        if capture['collector'] == 'sampling':
+            ident = threading.get_ident()
+            self._request_threads.add(ident)
+            try:
+                return wsgi_app(environ, start_response)
+            finally:
+                self._request_threads.discard(ident)
+                self._request_done(capture, profiled=True)
+
+        if not self._profile_lock.acquire(blocking=False):
+            try:
+                return wsgi_app(environ, start_response)
+            finally:
+                self._request_done(capture, profiled=False)
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                return wsgi_app(environ, start_response)
+            finally:
+                profile.disable()
+        finally:
+            self._profile_lock.release()
+            with self._lock:
+                if self._capture is capture:
+                    if self._stats is None:
+                        self._stats = pstats.Stats(profile)
+                    else:
+                        self._stats.add(profile)
+            self._request_done(capture, profiled=True)
+
+    def _request_done(self, capture, profiled):
+        with self._lock:
+            if self._capture is not capture:
+                return
+            self._request_count += 1
+            capture['profiled_requests' if profiled else 'unprofiled_requests'] += 1
+            done = capture['requests'] is not None and self._request_count >= capture['requests']
+        if done:
+            self._finish(capture)
+
+    def _sample(self, capture):
+        """Sampler thread: count the stacks of threads inside a request until the capture ends"""
+        own = threading.get_ident()
+        while self._capture is capture:
+            frames = sys._current_frames()
+            sampled = 0
+            for ident in list(self._request_threads):
+                frame = frames.get(ident)
+                if frame is not None and ident != own:
+                    self._stacks[collapse_stack(frame)] += 1
+                    sampled += 1
+            capture['samples'] += sampled
+            del frames
+            time.sleep(self.sample_interval)
+
+    def _finish(self, capture):
+        """End a capture (at most once) and write its file"""
+        with self._lock:
+            if self._capture is not capture:
+                return
+            self.flask_app.wsgi_app = self._original_wsgi_app
+            self._capture = None
+            capture['elapsed_seconds'] = round(time.perf_counter() - self._started, 3)
+            stats, stacks = self._stats, self._stacks
+
+        try:
+            capture['path'] = self._write(capture, stats, stacks)
+        except OSError as e:
+            capture['error'] = f'Could not write profile: {e}'
+        with self._lock:
+            self._last = capture
+
+    def _write(self, capture, stats, stacks):
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"profile-{capture['id']}-{capture['collector']}")
+
+        if capture['collector'] == 'sampling':
+            if not stacks:
+                capture['error'] = 'No samples (no requests during the capture)'
+                return None
+            path = f'{base}.collapsed'
+            with open(path, 'w') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f'{stack} {count}\n')
+            return path
+
+        if stats is None:
+            capture['error'] = 'No requests were profiled'
+            return None
+        path = f'{base}.pstats'
+        stats.dump_stats(path)
+        # Readable summary next to it: the 40 most expensive functions by cumulative time
+        summary = io.StringIO()
+        pstats.Stats(path, stream=summary).sort_stats('cumulative').print_stats(40)
+        with open(f'{base}.txt', 'w') as f:
+            f.write(summary.getvalue())
+        return path
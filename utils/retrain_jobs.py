@@ -0,0 +1,341 @@
+"""
+Background retraining jobs.
+
+Submitting a job returns immediately. A single runner thread per process
+takes jobs off an in-memory queue and runs the retraining script as a
+subprocess; an exclusive lock file makes jobs submitted to different worker
+processes (see serve.py) run one at a time as well.
+
+Each job is kept on disk, as a JSON record and a log file, so any worker can
+report its status or stream its log. The queue itself is in memory: a job
+records the process that queued it (owner_pid), and a queued job whose owner
+has exited is reported, and on the next start of a runner recorded, as failed
+instead of staying queued forever. The script reports progress and the
+version it saved by printing marker lines (report_progress/report_version),
+which the runner parses out of its output.
+
+Retraining runs under a CPU budget so it does not slow down serving: the
+subprocess is niced, and its joblib, OpenMP and BLAS thread pools are capped
+at n_jobs.
+"""
+import datetime
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+
+try:
+    import fcntl
+except ImportError:  # Windows: jobs still run one at a time per process
+    fcntl = None
+
+PROGRESS_MARKER = '##progress'
+VERSION_MARKER = '##version'
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed')
+FINISHED_STATUSES = ('succeeded', 'failed')
+
+_JOB_ID = re.compile(r'^[0-9A-Za-z_-]+$')
+
+# Environment variables that size the thread pools of numpy/scikit-learn in the subprocess
+_THREAD_LIMIT_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+
+def report_progress(percent, stage):
+    """Called by the retraining script: announce progress (0-100) and the current stage"""
+    print(f'{PROGRESS_MARKER} {int(percent)} {stage}', flush=True)
+
+
+def report_version(version):
+    """Called by the retraining script: announce the version it saved"""
+    print(f'{VERSION_MARKER} {version}', flush=True)
+
+
+def default_n_jobs():
+    """A quarter of the cores (at least one), leaving the rest to serving"""
+    return max(1, (os.cpu_count() or 1) // 4)
+
+
+def _now():
+    return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class RetrainJobQueue:
+    """
+    Queue of retraining jobs with one background runner
+
+    Args:
+        command: Argument list that runs the retraining script
+        jobs_dir: Directory for the job records, logs and lock file
+        cwd: Working directory of the script
+        n_jobs: CPU cores the script may use (FRAUDSHIELD_RETRAIN_N_JOBS)
+        niceness: Scheduling niceness added to the script's process
+        on_success: Called with the job record after a successful run; its
+            return value is stored as the job's 'activation'
+    """
+
+    def __init__(self, command, jobs_dir, cwd=None, n_jobs=None, niceness=10, on_success=None):
+        self.command = list(command)
+        self.jobs_dir = jobs_dir
+        self.cwd = cwd
+        self.n_jobs = max(1, int(n_jobs or default_n_jobs()))
+        self.niceness = niceness
+        self.on_success = on_success
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+
+    def _path(self, job_id, extension):
+        return os.path.join(self.jobs_dir, f'{job_id}.{extension}')
+
+    def _save(self, job):
+        """Write the job record atomically (readers in other processes never see half a file)"""
+        path = self._path(job['id'], 'json')
+        tmp_path = f'{path}.tmp-{os.getpid()}-{threading.get_ident()}'
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, path)
+
+    def _ensure_started(self):
+        """Start the runner thread lazily, and again in a forked child"""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._cond:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                # Forked child: the parent's queued jobs are not ours to run
+                self._queue.clear()
+            self._pid = os.getpid()
+            self.fail_orphaned()
+            self._thread = threading.Thread(target=self._run, name='retrain-runner', daemon=True)
+            self._thread.start()
+
+    def submit(self, args=()):
+        """Queue a retraining run (`args` are appended to the command); returns its job record"""
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        job_id = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        job = {
+            'id': job_id,
+            'status': 'queued',
+            'progress': 0,
+            'stage': 'Queued',
+            'version': None,
+            'returncode': None,
+            'error': None,
+            'activation': None,
+            'pid': None,
+            'owner_pid': os.getpid(),
+            'args': list(args),
+            'n_jobs': self.n_jobs,
+            'log_file': self._path(job_id, 'log'),
+            'created_at': _now(),
+            'started_at': None,
+            'finished_at': None
+        }
+        self._save(job)
+
+        self._ensure_started()
+        with self._cond:
+            self._queue.append(job)
+            self._cond.notify()
+        return job
+
+    def get(self, job_id):
+        """The job record, or None for an unknown id"""
+        if not _JOB_ID.match(job_id or ''):
+            return None
+        try:
+            with open(self._path(job_id, 'json')) as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # The process running the job died without recording the outcome
+        if job['status'] == 'running' and job.get('pid') and not _pid_alive(job['pid']):
+            job.update(status='failed', error='Retraining process disappeared', finished_at=_now())
+        # The process that queued the job (and held it in memory) exited before running it
+        elif job['status'] == 'queued' and job.get('owner_pid') and not _pid_alive(job['owner_pid']):
+            job.update(status='failed', error='The worker that queued the job exited before running it',
+                       finished_at=_now())
+        return job
+
+    def fail_orphaned(self):
+        """Record as failed every queued job whose owning process has exited; returns their ids"""
+        failed = []
+        if not os.path.isdir(self.jobs_dir):
+            return failed
+        for name in os.listdir(self.jobs_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.jobs_dir, name)) as f:
+                    stored = json.load(f)
+            except (OSError, ValueError):
+                continue
+            job = self.get(stored.get('id', ''))
+            if job is not None and job['status'] == 'failed' and stored.get('status') != 'failed':
+                self._save(job)
+                failed.append(job['id'])
+        return failed
+
+    def list(self, limit=20):
+        """Most recent jobs first"""
+        if not os.path.isdir(self.jobs_dir):
+            return []
+        job_ids = sorted((name[:-5] for name in os.listdir(self.jobs_dir) if name.endswith('.json')), reverse=True)
+        return [job for job in (self.get(job_id) for job_id in job_ids[:limit]) if job]
+
+    def read_log(self, job_id, offset=0):
+        """Log lines written since byte `offset`; returns (lines, new offset)"""
+        try:
+            with open(self._path(job_id, 'log'), 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except OSError:
+            return [], offset
+        # Leave a trailing partial line for the next read
+        end = data.rfind(b'\n') + 1
+        lines = data[:end].decode('utf-8', errors='replace').splitlines()
+        return lines, offset + end
+
+    def events(self, job_id, offset=0, poll_interval=0.5, heartbeat=15.0):
+        """
+        Server-sent events for a job until it finishes
+
+        Yields 'log' events (id: the log byte offset, so a reconnecting client
+        can resume with Last-Event-ID), 'progress' events when progress or
+        status change, and a final 'done' event with the job record.
+        """
+        last_state = None
+        last_sent = time.monotonic()
+        while True:
+            job = self.get(job_id)
+            if job is None:
+                yield f"event: error\ndata: {json.dumps({'error': 'Unknown job'})}\n\n"
+                return
+
+            position = offset
+            lines, offset = self.read_log(job_id, offset)
+            for line in lines:
+                position += len(line.encode('utf-8')) + 1
+                yield f'id: {position}\nevent: log\ndata: {line}\n\n'
+                last_sent = time.monotonic()
+
+            state = (job['status'], job['progress'], job['stage'])
+            if state != last_state:
+                last_state = state
+                progress = {key: job[key] for key in ('status', 'progress', 'stage')}
+                yield f'event: progress\ndata: {json.dumps(progress)}\n\n'
+                last_sent = time.monotonic()
+
+            if job['status'] in FINISHED_STATUSES:
+                yield f'event: done\ndata: {json.dumps(job)}\n\n'
+                return
+
+            if time.monotonic() - last_sent >= heartbeat:
+                # Comment line: keeps proxies from closing an idle stream
+                yield ': keep-alive\n\n'
+                last_sent = time.monotonic()
+            time.sleep(poll_interval)
+
+    def _subprocess_env(self):
+        env = dict(os.environ)
+        env['FRAUDSHIELD_RETRAIN_N_JOBS'] = str(self.n_jobs)
+        env['PYTHONUNBUFFERED'] = '1'
+        for name in _THREAD_LIMIT_VARS:
+            env[name] = str(self.n_jobs)
+        return env
+
+    def _command(self, job):
+        """The job's command line, run through nice(1) when a niceness is set"""
+        command = self.command + job['args']
+        # nice execs the script, so the pid is still the script's; no preexec_fn, which is unsafe with threads
+        if self.niceness and os.name == 'posix' and shutil.which('nice'):
+            command = ['nice', '-n', str(self.niceness)] + command
+        return command
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                job = self._queue.popleft()
+            try:
+                self._run_exclusive(job)
+            except Exception as e:
+                job.update(status='failed', error=f'{e.__class__.__name__}: {e}', finished_at=_now())
+                self._save(job)
+
+    def _run_exclusive(self, job):
+        """Run a job once no other process is running one"""
+        with open(os.path.join(self.jobs_dir, 'runner.lock'), 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            self._execute(job)
+
+    def _execute(self, job):
+        job.update(status='running', stage='Starting', started_at=_now())
+        self._save(job)
+
+        with open(job['log_file'], 'w') as log:
+            process = subprocess.Popen(
+                self._command(job), cwd=self.cwd, env=self._subprocess_env(),
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+            job['pid'] = process.pid
+            self._save(job)
+
+            for line in process.stdout:
+                if line.startswith(PROGRESS_MARKER):
+                    _, percent, stage = (line.rstrip('\n').split(' ', 2) + [''])[:3]
+                    job.update(progress=int(percent), stage=stage)
+                    self._save(job)
+                    continue
+                if line.startswith(VERSION_MARKER):
+                    job['version'] = line[len(VERSION_MARKER):].strip()
+                    continue
+                log.write(line)
+                log.flush()
+            process.wait()
+
+        job['returncode'] = process.returncode
+        if process.returncode != 0:
+            job.update(status='failed', error=f'Retraining process exited with code {process.returncode}',
+                       finished_at=_now())
+        elif not job['version']:
+            # Nothing to activate (e.g. an incremental run without enough new feedback)
+            job.update(status='succeeded', progress=100, stage='Completed without a new version', finished_at=_now())
+        else:
+            if self.on_success:
+                job.update(progress=100, stage='Activating')
+                self._save(job)
+                try:
+                    job['activation'] = self.on_success(dict(job))
+                except Exception as e:
+                    job['activation'] = {'success': False, 'error': f'{e.__class__.__name__}: {e}'}
+            job.update(status='succeeded', progress=100, stage='Completed', finished_at=_now())
+        self._save(job)
+
+
+def retrain_command(repo_dir):
+    """Command line of the retraining script"""
+    return [sys.executable, os.path.join(repo_dir, 'retraining', 'retrain.py')]
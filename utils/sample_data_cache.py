@@ -0,0 +1,108 @@
+"""
+Cached, columnar view of data/sample_transactions.csv for the dashboard.
+
+The CSV is parsed once into typed NumPy columns; the heuristic risk score and
+decision are computed column-wise and the serialized JSON body is kept along
+with an ETag. The cache is rebuilt only when the file's mtime or size changes,
+so repeated dashboard loads cost one os.stat() call.
+"""
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+DEFAULT_SAMPLE_PATH = os.path.join('data', 'sample_transactions.csv')
+
+# Output columns, in the order the dashboard expects them, with their defaults
+_STRING_COLUMNS = {'timestamp': '', 'user_id': '', 'device_id': ''}
+_FLOAT_COLUMNS = {
+    'amount': 0.0, 'latitude': 0.0, 'longitude': 0.0, 'geo_diff': 0.0,
+    'amount_deviation': 0.0, 'device_familiarity': 0.0,
+    'location_familiarity': 0.0, 'time_since_last': 0.0
+}
+_INT_COLUMNS = {'hour': 0, 'velocity': 0, 'is_weekend': 0, 'is_fraud': 0}
+
+_FIELD_ORDER = ('timestamp', 'user_id', 'amount', 'device_id', 'latitude', 'longitude', 'hour',
+                'velocity', 'geo_diff', 'amount_deviation', 'is_weekend', 'device_familiarity',
+                'location_familiarity', 'time_since_last', 'is_fraud', 'risk_score', 'decision')
+
+
+def load_columns(csv_path):
+    """Parse the sample CSV into a dict of typed NumPy columns"""
+    # pandas is only needed here; importing it lazily keeps it off the app's startup path
+    import pandas as pd
+
+    # round_trip matches Python's float() parsing bit for bit
+    df = pd.read_csv(csv_path, float_precision='round_trip', dtype={name: str for name in _STRING_COLUMNS})
+
+    columns = {}
+    for name, default in _STRING_COLUMNS.items():
+        columns[name] = df[name].fillna(default).to_numpy(dtype=str) if name in df else np.full(len(df), default)
+    for name, default in _FLOAT_COLUMNS.items():
+        columns[name] = df[name].fillna(default).to_numpy(np.float64) if name in df else np.full(len(df), default)
+    for name, default in _INT_COLUMNS.items():
+        columns[name] = df[name].fillna(default).to_numpy(np.int64) if name in df else np.full(len(df), default)
+    return columns
+
+
+def score_columns(columns):
+    """Heuristic dashboard risk score and decision, computed column-wise"""
+    risk_score = np.minimum(columns['amount_deviation'] * 0.7 + columns['geo_diff'] * 0.3, 1.0)
+    decision = np.where(risk_score > 0.7, 'BLOCK', np.where(risk_score > 0.4, 'CHALLENGE', 'ALLOW'))
+    return risk_score, decision
+
+
+def newest_first(timestamps):
+    """Row order sorted by timestamp descending, ties kept in file order"""
+    positions = np.arange(len(timestamps))
+    return np.lexsort((-positions, timestamps))[::-1]
+
+
+class SampleTransactionCache:
+    """
+    Serve the sample transactions as a cached JSON body
+
+    Args:
+        dumps: Function serializing a list of dicts to a JSON string
+            (built on the Flask app's JSON provider so output matches jsonify)
+        csv_path: Sample transactions CSV
+    """
+
+    def __init__(self, dumps, csv_path=DEFAULT_SAMPLE_PATH):
+        self.csv_path = csv_path
+        self.dumps = dumps
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._body = None
+        self._etag = None
+
+    def _build(self):
+        columns = load_columns(self.csv_path)
+        columns['risk_score'], columns['decision'] = score_columns(columns)
+
+        order = newest_first(columns['timestamp'])
+        ordered = [columns[name][order].tolist() for name in _FIELD_ORDER]
+        records = [dict(zip(_FIELD_ORDER, values)) for values in zip(*ordered)]
+
+        body = self.dumps(records).encode('utf-8')
+        return body, hashlib.md5(body).hexdigest()
+
+    def get(self):
+        """
+        Current JSON body and ETag, rebuilt if the CSV changed on disk
+
+        Returns (None, None) when the CSV does not exist.
+        """
+        try:
+            stat = os.stat(self.csv_path)
+        except FileNotFoundError:
+            return None, None
+
+        fingerprint = (stat.st_mtime_ns, stat.st_size)
+        if fingerprint != self._fingerprint:
+            with self._lock:
+                if fingerprint != self._fingerprint:
+                    self._body, self._etag = self._build()
+                    self._fingerprint = fingerprint
+        return self._body, self._etag
@@ -0,0 +1,255 @@
+"""
+Streaming synthetic transaction generator for load and scale testing.
+
+Rows are generated in fixed-size shards, each from its own seed spawned off
+one root seed, so a dataset is identical whatever the number of worker
+processes and any single shard can be regenerated on its own. Each shard
+owns a disjoint range of users and is built with whole-array NumPy
+operations (no per-row Python), then written to disk and dropped, so memory
+stays at one shard per worker however many rows are requested.
+
+Users have histories the live features can learn from:
+
+- a home location near one of a set of cities, occasional travel to a
+  second city and rare transactions from anywhere
+- one to three devices and one or two cards, with most activity on the
+  primary device and a small share of never-seen devices
+- a personal spending level and a daily activity cycle around a peak hour
+- fraud bursts: for a small share of users, a rapid run of large
+  transactions from a new device in another city, labelled is_fraud=1
+
+    python -m utils.synthetic_transactions --rows 50000000 --workers 8 --out data/synthetic
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_SHARD_ROWS = 1000000
+
+# (latitude, longitude) of the cities users live in and travel to
+CITIES = np.array([
+    (40.71, -74.01), (34.05, -118.24), (41.88, -87.63), (29.76, -95.37), (33.45, -112.07),
+    (39.95, -75.17), (32.72, -117.16), (37.77, -122.42), (47.61, -122.33), (25.76, -80.19),
+    (42.36, -71.06), (39.74, -104.99), (51.51, -0.13), (48.86, 2.35), (52.52, 13.40),
+    (40.42, -3.70), (41.90, 12.50), (19.43, -99.13), (43.65, -79.38), (35.68, 139.69)
+])
+
+DEFAULT_OPTIONS = {
+    'start': '2025-01-01',
+    'days': 30,
+    'transactions_per_user': 40,
+    'travel_rate': 0.08,
+    'anywhere_rate': 0.005,
+    'primary_device_rate': 0.85,
+    'new_device_rate': 0.02,
+    'fraud_user_rate': 0.005,
+    'burst_min': 3,
+    'burst_max': 15,
+    'burst_gap_seconds': 90.0
+}
+
+SHARD_FORMATS = ('csv', 'csv.gz', 'parquet')
+
+
+def _users_per_shard(shard_rows, options):
+    return max(1, shard_rows // options['transactions_per_user'])
+
+
+def _labels(prefix, user, sub=None):
+    """String ids like prefix_<user>[_<sub>] for integer columns, formatting each distinct id only once"""
+    key = user if sub is None else user * (int(sub.max()) + 1) + sub
+    unique, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    parts = [user[first].tolist()] if sub is None else [user[first].tolist(), sub[first].tolist()]
+    names = np.array(['_'.join(map(str, (prefix,) + row)) for row in zip(*parts)], dtype=object)
+    return names[inverse]
+
+
+def generate_shard(shard_index, rows, seed, shard_rows=DEFAULT_SHARD_ROWS, **options):
+    """
+    One shard of transactions as a DataFrame sorted by timestamp
+
+    Args:
+        shard_index: Position of the shard; selects its user range
+        rows: Rows in this shard
+        seed: np.random.SeedSequence (or int) for this shard
+        shard_rows: Nominal shard size, which fixes the users per shard
+        options: Overrides of DEFAULT_OPTIONS
+    """
+    options = dict(DEFAULT_OPTIONS, **options)
+    rng = np.random.default_rng(seed)
+    days = options['days']
+
+    # Per-user profile
+    n_users = max(1, min(_users_per_shard(shard_rows, options), rows))
+    first_user = shard_index * _users_per_shard(shard_rows, options)
+    home = CITIES[rng.integers(len(CITIES), size=n_users)] + rng.normal(0.0, 0.15, (n_users, 2))
+    travel = CITIES[rng.integers(len(CITIES), size=n_users)]
+    n_devices = rng.integers(1, 4, n_users)
+    n_cards = rng.integers(1, 3, n_users)
+    spend_level = rng.normal(3.5, 0.8, n_users)
+    peak_hour = rng.normal(14.0, 3.5, n_users)
+    activity = rng.gamma(2.0, 1.0, n_users)
+
+    # Fraud bursts take their rows out of the shard's budget
+    n_fraud_users = min(rng.binomial(n_users, options['fraud_user_rate']), n_users)
+    fraud_users = rng.choice(n_users, n_fraud_users, replace=False)
+    burst_sizes = rng.integers(options['burst_min'], options['burst_max'] + 1, n_fraud_users)
+    while burst_sizes.sum() > rows // 10 and len(burst_sizes):
+        fraud_users, burst_sizes = fraud_users[:-1], burst_sizes[:-1]
+    n_fraud = int(burst_sizes.sum())
+    n_normal = rows - n_fraud
+
+    # Normal activity
+    user = np.repeat(np.arange(n_users), rng.multinomial(n_normal, activity / activity.sum()))
+    hour = (peak_hour[user] + rng.normal(0.0, 3.0, n_normal)) % 24.0
+    seconds = rng.integers(0, days, n_normal) * 86400.0 + hour * 3600.0
+
+    device = np.where(rng.random(n_normal) < options['primary_device_rate'], 0,
+                      (rng.random(n_normal) * n_devices[user]).astype(np.int64))
+    new_device = rng.random(n_normal) < options['new_device_rate']
+    device[new_device] = 100 + rng.integers(0, 1000, int(new_device.sum()))
+    card = (rng.random(n_normal) * n_cards[user]).astype(np.int64)
+
+    location = home[user] + rng.normal(0.0, 0.03, (n_normal, 2))
+    draw = rng.random(n_normal)
+    travelling = draw < options['travel_rate']
+    location[travelling] = travel[user[travelling]] + rng.normal(0.0, 0.05, (int(travelling.sum()), 2))
+    anywhere = draw > 1.0 - options['anywhere_rate']
+    location[anywhere] = np.column_stack([rng.uniform(-60, 70, int(anywhere.sum())),
+                                          rng.uniform(-180, 180, int(anywhere.sum()))])
+    amount = np.exp(rng.normal(spend_level[user], 0.7))
+
+    # Fraud bursts: consecutive transactions minutes apart, new device, another city, large amounts
+    burst = np.repeat(np.arange(n_fraud_users), burst_sizes)
+    fraud_user = fraud_users[burst]
+    gaps = rng.exponential(options['burst_gap_seconds'], n_fraud)
+    elapsed = np.cumsum(gaps)
+    burst_first = np.concatenate([[0], np.cumsum(burst_sizes)[:-1]]).astype(np.int64)
+    elapsed -= np.repeat(elapsed[burst_first] - gaps[burst_first], burst_sizes) if n_fraud else 0.0
+    fraud_seconds = np.repeat(rng.uniform(0, days * 86400.0, n_fraud_users), burst_sizes) + elapsed
+    fraud_city = CITIES[rng.integers(len(CITIES), size=n_fraud_users)]
+    fraud_location = np.repeat(fraud_city, burst_sizes, axis=0) + rng.normal(0.0, 0.05, (n_fraud, 2))
+    fraud_amount = np.exp(rng.normal(spend_level[fraud_user] + 1.5, 0.8))
+
+    # Merge and order by time
+    user = np.concatenate([user, fraud_user])
+    seconds = np.concatenate([seconds, fraud_seconds])
+    order = np.argsort(seconds, kind='stable')
+    user, seconds = user[order], seconds[order]
+    device = np.concatenate([device, 10000 + burst])[order]
+    card = np.concatenate([card, np.zeros(n_fraud, dtype=np.int64)])[order]
+    location = np.concatenate([location, fraud_location])[order]
+    amount = np.concatenate([amount, fraud_amount])[order]
+    is_fraud = np.concatenate([np.zeros(n_normal, dtype=np.int8), np.ones(n_fraud, dtype=np.int8)])[order]
+
+    user = first_user + user
+    timestamps = np.datetime64(options['start'], 's') + seconds.astype(np.int64).astype('timedelta64[s]')
+    return pd.DataFrame({
+        'transaction_id': np.char.add(f'tx_{shard_index}_', np.arange(rows).astype(str)),
+        'user_id': _labels('user', user),
+        'card_id': _labels('card', user, card),
+        'device_id': _labels('device', user, device),
+        'amount': np.round(amount, 2),
+        'timestamp': np.datetime_as_string(timestamps),
+        'latitude': np.round(np.clip(location[:, 0], -90, 90), 5),
+        'longitude': np.round((location[:, 1] + 180.0) % 360.0 - 180.0, 5),
+        'is_fraud': is_fraud
+    })
+
+
+def shard_path(out_dir, shard_index, fmt='csv'):
+    return os.path.join(out_dir, f'transactions-{shard_index:05d}.{fmt}')
+
+
+def write_shard(out_dir, shard_index, rows, seed, shard_rows=DEFAULT_SHARD_ROWS, fmt='csv', **options):
+    """Generate one shard and write it (to a temporary name, then renamed); returns its manifest entry"""
+    frame = generate_shard(shard_index, rows, seed, shard_rows=shard_rows, **options)
+    path = shard_path(out_dir, shard_index, fmt)
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    if fmt == 'parquet':
+        frame.to_parquet(tmp_path, index=False)
+    else:
+        frame.to_csv(tmp_path, index=False, compression='gzip' if fmt == 'csv.gz' else None)
+    os.replace(tmp_path, path)
+    return {'index': shard_index, 'path': os.path.basename(path), 'rows': rows,
+            'fraud_rows': int(frame['is_fraud'].sum())}
+
+
+def generate_dataset(out_dir, rows, shard_rows=DEFAULT_SHARD_ROWS, seed=42, workers=1, fmt='csv', **options):
+    """
+    Write `rows` transactions as shards plus a manifest.json
+
+    Shard i always gets the i-th seed spawned from `seed`, so the output does
+    not depend on `workers`.
+
+    Returns:
+        The manifest dict
+    """
+    if fmt not in SHARD_FORMATS:
+        raise ValueError(f'Unknown shard format: {fmt} (expected one of {SHARD_FORMATS})')
+    if fmt == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError('Parquet shards need pyarrow: pip install pyarrow')
+
+    os.makedirs(out_dir, exist_ok=True)
+    n_shards = max(1, -(-int(rows) // shard_rows))
+    sizes = [min(shard_rows, rows - i * shard_rows) for i in range(n_shards)]
+    seeds = np.random.SeedSequence(seed).spawn(n_shards)
+
+    if workers > 1 and n_shards > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(write_shard, out_dir, i, sizes[i], seeds[i], shard_rows, fmt, **options)
+                       for i in range(n_shards)]
+            shards = [future.result() for future in futures]
+    else:
+        shards = [write_shard(out_dir, i, sizes[i], seeds[i], shard_rows, fmt, **options) for i in range(n_shards)]
+
+    manifest = {
+        'rows': int(rows),
+        'shard_rows': shard_rows,
+        'seed': seed,
+        'format': fmt,
+        'options': dict(DEFAULT_OPTIONS, **options),
+        'shards': shards
+    }
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def iter_shards(out_dir):
+    """Yield each shard of a generated dataset as a DataFrame, in shard order"""
+    with open(os.path.join(out_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+    for shard in manifest['shards']:
+        path = os.path.join(out_dir, shard['path'])
+        yield pd.read_parquet(path) if manifest['format'] == 'parquet' else pd.read_csv(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--shard-rows', type=int, default=DEFAULT_SHARD_ROWS)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--format', choices=SHARD_FORMATS, default='csv')
+    parser.add_argument('--days', type=int, default=DEFAULT_OPTIONS['days'])
+    parser.add_argument('--fraud-user-rate', type=float, default=DEFAULT_OPTIONS['fraud_user_rate'])
+    parser.add_argument('--out', default=os.path.join('data', 'synthetic'))
+    args = parser.parse_args()
+
+    manifest = generate_dataset(args.out, args.rows, shard_rows=args.shard_rows, seed=args.seed,
+                                workers=args.workers, fmt=args.format, days=args.days,
+                                fraud_user_rate=args.fraud_user_rate)
+    fraud_rows = sum(shard['fraud_rows'] for shard in manifest['shards'])
+    print(f"Wrote {manifest['rows']} rows ({fraud_rows} fraudulent) in {len(manifest['shards'])} shards to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
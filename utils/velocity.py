@@ -0,0 +1,154 @@
+"""
+Sliding-window transaction velocity counters.
+
+Answers "how many transactions did this user / device / card make in the
+last minute, hour or day" without scanning history. Every key owns a small
+ring of time buckets per window plus a running total; recording an event or
+reading the counts only touches the buckets that expired since the key was
+last seen, so both are O(1) per event (bounded by the bucket count).
+
+Windows are counted to bucket resolution: a 1 h window made of 60 one-minute
+buckets covers the last 59-60 minutes. Memory per key is fixed (a few hundred
+bytes with the default windows), the number of keys is capped, and keys idle
+for longer than the longest window are evicted first.
+
+Counts are exact for the events recorded in this process only. Under
+serve.py every worker has its own counters, so with several workers a count
+covers only the transactions that worker served.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_CAPACITY = 500000
+
+# (name, window seconds, number of buckets)
+DEFAULT_WINDOWS = (
+    ('1m', 60, 12),  # 5 s buckets
+    ('1h', 3600, 60),  # 1 min buckets
+    ('24h', 86400, 96)  # 15 min buckets
+)
+
+_BUCKET_MAX = np.iinfo(np.uint16).max
+
+
+class VelocityCounter:
+    """
+    Bucketed ring-buffer event counters for many keys and several windows
+
+    Args:
+        capacity: Maximum number of keys tracked at once
+        windows: Sequence of (name, seconds, buckets)
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, windows=DEFAULT_WINDOWS):
+        self.capacity = max(1, int(capacity))
+        self.windows = tuple((name, float(seconds), int(buckets)) for name, seconds, buckets in windows)
+        self.max_window = max(seconds for _, seconds, _ in self.windows)
+        self._lock = threading.Lock()
+
+        n = self.capacity
+        self._buckets = [np.zeros((n, buckets), dtype=np.uint16) for _, _, buckets in self.windows]
+        self._totals = [np.zeros(n, dtype=np.uint32) for _ in self.windows]
+        self._heads = [np.zeros(n, dtype=np.int64) for _ in self.windows]  # newest bucket number per key
+        self._last_seen = np.zeros(n, dtype=np.float64)
+
+        self._slots = OrderedDict()  # key -> slot, least recently seen first
+        self._free = list(range(n - 1, -1, -1))
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _advance(self, w, slot, bucket):
+        """Expire the buckets of window `w` that fall out of the window ending at `bucket`"""
+        head = int(self._heads[w][slot])
+        gap = bucket - head
+        if gap <= 0:
+            return
+        row = self._buckets[w][slot]
+        n = row.shape[0]
+        if gap >= n:
+            row[:] = 0
+            self._totals[w][slot] = 0
+        else:
+            expired = np.arange(head + 1, bucket + 1) % n
+            self._totals[w][slot] -= row[expired].sum(dtype=np.uint32)
+            row[expired] = 0
+        self._heads[w][slot] = bucket
+
+    def _evict_idle(self, now):
+        """Drop keys not seen for longer than the longest window (oldest first)"""
+        while self._slots:
+            key, slot = next(iter(self._slots.items()))
+            if now - self._last_seen[slot] <= self.max_window:
+                break
+            self._release(key)
+
+    def _release(self, key):
+        slot = self._slots.pop(key)
+        for w in range(len(self.windows)):
+            self._buckets[w][slot] = 0
+            self._totals[w][slot] = 0
+            self._heads[w][slot] = 0
+        self._last_seen[slot] = 0.0
+        self._free.append(slot)
+
+    def _slot_for_record(self, key, now):
+        slot = self._slots.get(key)
+        if slot is not None:
+            self._slots.move_to_end(key)
+            return slot
+
+        self._evict_idle(now)
+        if not self._free:
+            # Full of active keys: evict the least recently seen one
+            self._release(next(iter(self._slots)))
+            self.evictions += 1
+
+        slot = self._free.pop()
+        self._slots[key] = slot
+        for w, (_, seconds, buckets) in enumerate(self.windows):
+            self._heads[w][slot] = int(now // (seconds / buckets))
+        return slot
+
+    def record(self, key, timestamp):
+        """Count one event for `key` at `timestamp` (epoch seconds)"""
+        with self._lock:
+            slot = self._slot_for_record(key, timestamp)
+            self._last_seen[slot] = max(self._last_seen[slot], timestamp)
+            for w, (_, seconds, buckets) in enumerate(self.windows):
+                bucket = int(timestamp // (seconds / buckets))
+                self._advance(w, slot, bucket)
+                if int(self._heads[w][slot]) - bucket >= buckets:
+                    continue  # late event that is already outside this window
+                row = self._buckets[w][slot]
+                if row[bucket % buckets] < _BUCKET_MAX:
+                    row[bucket % buckets] += 1
+                    self._totals[w][slot] += 1
+
+    def counts(self, key, timestamp):
+        """Events recorded for `key` in each window ending at `timestamp`, as {name: count}"""
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                return {name: 0 for name, _, _ in self.windows}
+            result = {}
+            for w, (name, seconds, buckets) in enumerate(self.windows):
+                self._advance(w, slot, int(timestamp // (seconds / buckets)))
+                result[name] = int(self._totals[w][slot])
+            return result
+
+    def memory_bytes(self):
+        arrays = self._buckets + self._totals + self._heads + [self._last_seen]
+        return sum(array.nbytes for array in arrays)
+
+    def stats(self):
+        return {
+            'keys': len(self._slots),
+            'capacity': self.capacity,
+            'evictions': self.evictions,
+            'windows': [name for name, _, _ in self.windows],
+            'memory_bytes': self.memory_bytes()
+        }